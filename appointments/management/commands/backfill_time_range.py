@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from appointments.models import Appointment, appointment_time_range
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute time_range for appointments saved before it existed, or for every appointment with --all. "
+        "Appointments without it are invisible to the overlap constraint and checks, run this right after migrating. "
+        "Appointments overlapping one already in the constraint are left without a range and listed, "
+        "cancel or move them and run the command again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recompute every appointment, not only those without a range.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        appointments = Appointment.objects.select_related('saloon').only(
+            'pk', 'date', 'start_time', 'end_time', 'time_range', 'saloon__timezone'
+        )
+        if not options['all']:
+            appointments = appointments.filter(time_range__isnull=True)
+
+        batch = []
+        updated = 0
+        conflicts = []
+        for appointment in appointments.iterator(chunk_size=options['batch_size']):
+            appointment.time_range = appointment_time_range(
+                appointment.date, appointment.start_time, appointment.end_time, appointment.saloon.timezone
+            )
+            batch.append(appointment)
+            if len(batch) >= options['batch_size']:
+                updated += self.update(batch, conflicts)
+                batch = []
+        if batch:
+            updated += self.update(batch, conflicts)
+        self.stdout.write(self.style.SUCCESS(f"Updated the time range of {updated} appointments."))
+        if conflicts:
+            self.stdout.write(self.style.WARNING(
+                f"{len(conflicts)} appointments overlap another appointment of their staff and were skipped: "
+                + ", ".join(str(pk) for pk in conflicts)
+            ))
+
+    def update(self, batch, conflicts):
+        """
+        Save the ranges of a batch. When the overlap constraint rejects it,
+        the rows are saved one at a time and those it rejects are added to
+        `conflicts`.
+        """
+        try:
+            with transaction.atomic():
+                return Appointment.objects.bulk_update(batch, ['time_range'])
+        except IntegrityError:
+            pass
+        updated = 0
+        for appointment in batch:
+            try:
+                with transaction.atomic():
+                    updated += Appointment.objects.filter(pk=appointment.pk).update(time_range=appointment.time_range)
+            except IntegrityError:
+                conflicts.append(appointment.pk)
+        return updated
@@ -0,0 +1,155 @@
+import json
+import random
+from datetime import time, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from appointments.models import Appointment
+from core.utils.geo import h3_cells
+from country.models import Country, Currency
+from openinghours.models import OpeningHour
+from saloons.models import Saloon
+from search.search import update_search_vectors
+from services.models import Service, ServiceVariation
+from staffs.models import BreakTime, Staff, WorkingDay
+from users.models import User
+
+NAME_PREFIX = "Loadtest"
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+SERVICES = ['Haircut', 'Beard Trim', 'Hair Colour', 'Manicure', 'Pedicure', 'Facial', 'Massage', 'Waxing']
+CITIES = ['London', 'Manchester', 'Stockholm', 'Kathmandu', 'Sydney', 'Toronto']
+
+
+class Command(BaseCommand):
+    help = "Create synthetic saloons, staff and services for the load tests and write a manifest for loadtest/run.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saloons', type=int, default=20)
+        parser.add_argument('--staff', type=int, default=3, help="Staff per saloon.")
+        parser.add_argument('--services', type=int, default=4, help="Services per saloon.")
+        parser.add_argument('--variations', type=int, default=3, help="Variations per service.")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed, the same seed gives the same data.")
+        parser.add_argument('--flush', action='store_true', help="Delete previously seeded load-test data first.")
+        parser.add_argument('--output', default='loadtest/manifest.json', help="Where to write the manifest.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['flush']:
+            saloons = Saloon.objects.filter(name__startswith=NAME_PREFIX)
+            Appointment.objects.filter(saloon__in=saloons).delete()
+            deleted, _ = saloons.delete()
+            self.stdout.write(f"Deleted {deleted} load-test rows.")
+
+        with transaction.atomic():
+            manifest = self.seed(rng, options)
+
+        with open(options['output'], 'w') as output:
+            json.dump(manifest, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(manifest['saloons'])} saloons, manifest written to {options['output']}."
+        ))
+
+    def seed(self, rng, options):
+        currency, _ = Currency.objects.get_or_create(currency_code='USD', defaults={'name': 'US Dollar', 'symbol': '$'})
+        country, _ = Country.objects.get_or_create(code='US', defaults={'name': 'United States', 'currency': currency})
+        owner, _ = User.objects.get_or_create(username='loadtest-owner', defaults={'email': 'owner@loadtest.local'})
+
+        # bulk_create skips the model save() hooks (image compression, slug
+        # lookups, duration updates), their results are filled in here instead.
+        offset = Saloon.objects.filter(name__startswith=NAME_PREFIX).count()
+        saloons = [
+            Saloon(
+                user=owner,
+                country=country,
+                currency=currency,
+                name=f"{NAME_PREFIX} Saloon {offset + index}",
+                slug=f"loadtest-saloon-{offset + index}",
+                address=f"{rng.randint(1, 200)} High Street, {rng.choice(CITIES)}",
+                short_description="Synthetic saloon for load tests.",
+                lat=round(rng.uniform(-60, 60), 6),
+                lng=round(rng.uniform(-170, 170), 6),
+                email=f"saloon{offset + index}@loadtest.local",
+                contact_no="+15550000000",
+                amenities=rng.sample(['wifi', 'parking', 'card', 'wheelchair', 'coffee'], 2),
+                timezone='UTC',
+            )
+            for index in range(options['saloons'])
+        ]
+        for saloon in saloons:
+            for field, cell in h3_cells(saloon.lat, saloon.lng).items():
+                setattr(saloon, field, cell)
+        saloons = Saloon.objects.bulk_create(saloons)
+        OpeningHour.objects.bulk_create([
+            OpeningHour(saloon=saloon, day_of_week=day, start_time=time(9), end_time=time(18))
+            for saloon in saloons for day in DAYS
+        ])
+
+        services = Service.objects.bulk_create([
+            Service(
+                saloon=saloon,
+                name=name,
+                slug=f"{saloon.slug}-{name.lower().replace(' ', '-')}",
+                description=f"{name} at {saloon.name}",
+            )
+            for saloon in saloons for name in rng.sample(SERVICES, min(options['services'], len(SERVICES)))
+        ])
+        variations = []
+        for service in services:
+            durations = [timedelta(minutes=rng.choice([15, 30, 45, 60, 90])) for _ in range(options['variations'])]
+            service.min_duration, service.max_duration = min(durations), max(durations)
+            for index, duration in enumerate(durations):
+                variations.append(ServiceVariation(
+                    service=service,
+                    name=f"{service.name} {['Basic', 'Standard', 'Premium', 'Deluxe'][index % 4]}",
+                    duration=duration,
+                    price=Decimal(rng.randint(10, 120)),
+                    discount_price=Decimal(0),
+                ))
+        Service.objects.bulk_update(services, ['min_duration', 'max_duration'])
+        ServiceVariation.objects.bulk_create(variations)
+
+        staff_members = Staff.objects.bulk_create([
+            Staff(saloon=saloon, name=f"{NAME_PREFIX} Stylist {saloon.slug}-{index}", buffer_time=timedelta(minutes=10))
+            for saloon in saloons for index in range(options['staff'])
+        ])
+        working_days = WorkingDay.objects.bulk_create([
+            WorkingDay(staff=staff, day_of_week=day, start_time=time(9), end_time=time(18), is_working=True)
+            for staff in staff_members for day in DAYS
+        ])
+        BreakTime.objects.bulk_create([
+            BreakTime(working_day=working_day, break_start=time(13), break_end=time(13, 30))
+            for working_day in working_days
+        ])
+
+        services_by_saloon = {}
+        for service in services:
+            services_by_saloon.setdefault(service.saloon_id, []).append(service)
+        variations_by_service = {}
+        for variation in variations:
+            variations_by_service.setdefault(variation.service_id, []).append(variation)
+
+        Through = Staff.services.through
+        Through.objects.bulk_create([
+            Through(staff_id=staff.pk, service_id=service.pk)
+            for staff in staff_members for service in services_by_saloon[staff.saloon_id]
+        ])
+        for model, rows in ((Saloon, saloons), (Service, services), (ServiceVariation, variations), (Staff, staff_members)):
+            update_search_vectors(model, [row.pk for row in rows])
+
+        return {
+            'saloons': [
+                {
+                    'id': str(saloon.pk),
+                    'staff': [str(staff.pk) for staff in staff_members if staff.saloon_id == saloon.pk],
+                    'services': [
+                        {
+                            'id': str(service.pk),
+                            'variations': [str(variation.pk) for variation in variations_by_service[service.pk]],
+                        }
+                        for service in services_by_saloon[saloon.pk]
+                    ],
+                }
+                for saloon in saloons
+            ],
+            'search_terms': SERVICES + CITIES + [NAME_PREFIX],
+        }
@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models import Q
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField, RangeOperators
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
 from saloons.models import Saloon
 from services.models import Service
 from users.models import User
@@ -7,6 +11,8 @@ from offers.models import SaloonCoupons
 import uuid
 from django.core.exceptions import ValidationError
 from datetime import datetime, timedelta
+import pytz
+from core.utils.slot_engine import localize_interval
 
 APPOINTMENT_STATUS_CHOICES = [
     ('Pending', 'Pending'),
@@ -18,7 +24,10 @@ APPOINTMENT_STATUS_CHOICES = [
 
 PAYMENT_STATUS_CHOICES = [
     ('Unpaid', 'Unpaid'),
+    ('Pending', 'Pending'),
+    ('Processing', 'Processing'),
     ('Paid', 'Paid'),
+    ('Failed', 'Failed'),
 ]
 
 PAYMENT_METHOD_CHOICES = [
@@ -27,6 +36,14 @@ PAYMENT_METHOD_CHOICES = [
     ('moredeals', 'MoreDeals')
 ]
 
+APPOINTMENT_OVERLAP_CONSTRAINT = 'appointment_staff_no_overlap'
+
+
+def appointment_time_range(date, start_time, end_time, timezone=None):
+    """Aware [start, end) range of a booking in the saloon timezone, ending past midnight if needed."""
+    start, end = localize_interval(date, start_time, end_time, pytz.timezone(timezone or 'UTC'))
+    return DateTimeTZRange(start, end, '[)')
+
 
 
 
@@ -37,9 +54,13 @@ class AppointmentSlot(models.Model):
     service = models.ForeignKey(Service, on_delete=models.CASCADE,null=True, blank=True)
     working_day = models.ForeignKey(WorkingDay, on_delete=models.CASCADE,null=True, blank=True)
     service_variation = models.ForeignKey('services.ServiceVariation', on_delete=models.CASCADE,null=True, blank=True)
+    date = models.DateField(null=True, blank=True)
     start_time = models.TimeField()
     end_time = models.TimeField(null=True)
     buffer_time = models.DurationField(default=timedelta(minutes=10),null=True, blank=True)
+    is_available = models.BooleanField(default=True)
+    # Created by the slot materializer, which replaces these rows when their day changes.
+    is_generated = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.saloon} - {self.staff} -{self.working_day} {self.start_time} - {self.end_time}"
@@ -51,6 +72,7 @@ class AppointmentSlot(models.Model):
             overlapping_slots = AppointmentSlot.objects.filter(
                 staff=self.staff,
                 working_day=self.working_day,
+                date=self.date,
                 start_time__lt=self.end_time,
                 end_time__gt=self.start_time
             ).exclude(pk=self.pk)
@@ -70,6 +92,11 @@ class AppointmentSlot(models.Model):
         
         self.clean()
         super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['staff', 'date', 'start_time']),
+        ]
     
 class Appointment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -84,6 +111,8 @@ class Appointment(models.Model):
     date = models.DateField()
     start_time = models.TimeField()
     end_time = models.TimeField()
+    # Derived from date, start_time and end_time in save(), backs the overlap constraint.
+    time_range = DateTimeRangeField(null=True, blank=True, editable=False)
     buffer_time = models.DurationField(default=timedelta(minutes=10), null=True, blank=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     status = models.CharField(max_length=20, choices=APPOINTMENT_STATUS_CHOICES, default='Pending')
@@ -98,6 +127,11 @@ class Appointment(models.Model):
     coupon= models.ForeignKey(SaloonCoupons, on_delete=models.CASCADE, null=True, blank=True)
     phone_number= models.CharField(max_length=20, null=True, blank=True)
     note =models.CharField(max_length=500, null=True, blank=True)
+    # Shared by the appointments booked and paid together through the basket endpoint.
+    basket_id = models.UUIDField(null=True, blank=True, db_index=True)
+    # Cache reference of the encrypted payment details (core.utils.payments.store_payment)
+    # while the payment is pending, also its idempotency key.
+    payment_reference = models.CharField(max_length=64, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -106,10 +140,25 @@ class Appointment(models.Model):
     def save(self, *args, **kwargs):
         if self.saloon:
             self.currency = self.saloon.currency
+        if self.date and self.start_time and self.end_time:
+            self.time_range = appointment_time_range(
+                self.date, self.start_time, self.end_time, self.saloon.timezone if self.saloon_id else None
+            )
         super().save(*args, **kwargs)
 
     class Meta:
         indexes = [
             models.Index(fields=['staff', 'start_time', 'end_time']),
         ]
+        constraints = [
+            # Requires the btree_gist extension for the equality on staff.
+            ExclusionConstraint(
+                name=APPOINTMENT_OVERLAP_CONSTRAINT,
+                expressions=[
+                    ('staff', RangeOperators.EQUAL),
+                    ('time_range', RangeOperators.OVERLAPS),
+                ],
+                condition=~Q(status='Cancelled'),
+            ),
+        ]
         
\ No newline at end of file
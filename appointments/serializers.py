@@ -4,9 +4,12 @@ from saloons.models import Saloon
 from staffs.models import Staff
 from offers.models import SaloonCoupons
 from services.models import Service, ServiceVariation
-from .models import AppointmentSlot, Appointment
+from django.conf import settings
+from django.db.models import Q
+from .models import AppointmentSlot, Appointment, appointment_time_range, PAYMENT_METHOD_CHOICES
 from staffs.models import WorkingDay, BreakTime
-from core.utils.appointment import calculate_appointment_end_time
+from core.utils.appointment import BookingQuote
+from core.utils.slot_holds import get_hold, held_intervals, overlaps_hold, owns_hold
 
 class AppointmentSlotSerializer(serializers.ModelSerializer):
     end_time = serializers.TimeField(read_only=True)
@@ -22,7 +25,7 @@ class AppointmentSlotSerializer(serializers.ModelSerializer):
         return obj.service_variation.price if obj.service_variation else 0
     
     def get_date(self, obj):
-        return obj.date.strftime("%Y-%m-%d")
+        return obj.date.strftime("%Y-%m-%d") if obj.date else None
 
     def validate(self, data):
         staff = data.get('staff')
@@ -89,10 +92,14 @@ class AppointmentPlaceSerializer(serializers.ModelSerializer):
     transaction_id = serializers.CharField(read_only=True)
     refferal_points_id = serializers.CharField(read_only=True)
     payment_method_id = serializers.CharField(write_only=True,required=False,allow_blank=True)
+    hold_id = serializers.UUIDField(write_only=True, required=False, allow_null=True)
+    hold_secret = serializers.CharField(write_only=True, required=False, allow_blank=True, allow_null=True)
 
     class Meta:
         model = Appointment
         fields = [
+            'hold_id',
+            'hold_secret',
             'saloon_id',
             'service_id',
             'service_variation_ids',
@@ -165,39 +172,217 @@ class AppointmentPlaceSerializer(serializers.ModelSerializer):
         
         data['buffer_time'] = staff.buffer_time
 
-        # Fetch the service variations and calculate total duration
-        service_variations = []
-        total_duration = timedelta()
-
-        for variation_id in service_variations_ids:
-            try:
-                variation = ServiceVariation.objects.get(id=variation_id, service=service)
-                service_variations.append(variation.id)
-            except ServiceVariation.DoesNotExist:
-                raise serializers.ValidationError(f"Service variation with ID {variation_id} does not exist or is not valid for the selected service.")
-
-        # Calculate the end time using the utility function
-        end_time=calculate_appointment_end_time(date, start_time, service_variations, data['buffer_time'])
-        print(end_time)
+        # Load the service variations once, the quote is reused for pricing by the view
+        try:
+            quote = BookingQuote(service_variations_ids, service=service)
+        except ServiceVariation.DoesNotExist as e:
+            raise serializers.ValidationError(f"{e} or is not valid for the selected service.")
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        data['quote'] = quote
+
+        end_time = quote.end_time(date, start_time, data['buffer_time'])
         data['end_time'] = end_time
 
         # Ensure the appointment falls within staff's working hours
         if not (working_day.start_time <= working_day.start_time and end_time <= working_day.end_time):
             raise serializers.ValidationError("Appointment time is outside of staff working hours.")
 
-        # Check for overlapping appointments with the same staff
-        booked_appointments = Appointment.objects.filter(staff_id=staff_id, date=date)
+        # Check for overlapping appointments with the same staff, the database
+        # constraint rejects any booking that races past this check.
+        requested_range = appointment_time_range(date, start_time, end_time, saloon.timezone)
+        if Appointment.objects.filter(
+            staff_id=staff_id,
+            time_range__overlap=requested_range
+        ).exclude(status='Cancelled').exists():
+            raise serializers.ValidationError("This staff member already has an appointment at this time.")
+
+        # A checkout hold reserves the slot for its holder only
+        hold_id = data.get('hold_id')
+        if hold_id:
+            hold = get_hold(hold_id)
+            if (
+                hold is None
+                or hold['staff_id'] != str(staff_id)
+                or hold['date'] != date.isoformat()
+                or hold['start_time'] != start_time.replace(second=0, microsecond=0)
+                or not owns_hold(hold, user, data.get('hold_secret'))
+            ):
+                raise serializers.ValidationError({"hold_id": "The slot hold has expired or does not match this booking."})
+        if overlaps_hold(staff_id, date, start_time, end_time, exclude=hold_id):
+            raise serializers.ValidationError("This time is currently held by another customer.")
+
+        return data
+    
+
+class SlotHoldSerializer(serializers.Serializer):
+    saloon_id = serializers.UUIDField()
+    staff_id = serializers.UUIDField()
+    date = serializers.DateField()
+    start_time = serializers.TimeField()
+    service_variation_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+
+    def validate(self, data):
+        date = data['date']
+        start_time = data['start_time']
+        if date < datetime.now().date():
+            raise serializers.ValidationError("The date cannot be in the past.")
+
+        staff = Staff.objects.filter(id=data['staff_id'], saloon_id=data['saloon_id']).select_related('saloon').first()
+        if not staff:
+            raise serializers.ValidationError("The selected staff member does not exist.")
 
-        for appointment in booked_appointments:
-            booked_start = appointment.start_time
-            booked_end = appointment.end_time
+        try:
+            quote = BookingQuote(data['service_variation_ids'])
+        except ServiceVariation.DoesNotExist as e:
+            raise serializers.ValidationError(str(e))
+        end_time = quote.end_time(date, start_time, staff.buffer_time)
 
-        # Check for overlap
-            if not (end_time <= booked_start or start_time >= booked_end):
-                raise serializers.ValidationError("This staff member already has an appointment at this time.")
+        if Appointment.objects.filter(
+            staff=staff,
+            time_range__overlap=appointment_time_range(date, start_time, end_time, staff.saloon.timezone)
+        ).exclude(status='Cancelled').exists():
+            raise serializers.ValidationError("This staff member already has an appointment at this time.")
 
+        data['staff'] = staff
+        data['end_time'] = end_time
         return data
-    
+
+
+class BasketLegSerializer(serializers.Serializer):
+    staff_id = serializers.UUIDField()
+    service_id = serializers.UUIDField()
+    service_variation_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    date = serializers.DateField()
+    start_time = serializers.TimeField()
+    hold_id = serializers.UUIDField(required=False, allow_null=True)
+    hold_secret = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class BasketBookingSerializer(serializers.Serializer):
+    """
+    Several (staff, variations, start) legs booked and paid together. All
+    legs are validated with a fixed number of queries and priced from one
+    load of their variations.
+    """
+    saloon_id = serializers.UUIDField()
+    legs = BasketLegSerializer(many=True, allow_empty=False)
+    fullname = serializers.CharField()
+    email = serializers.EmailField()
+    phone_number = serializers.CharField()
+    note = serializers.CharField(allow_blank=True, allow_null=True, required=False)
+    coupon_code = serializers.CharField(required=False, allow_blank=True)
+    payment_method = serializers.ChoiceField(choices=PAYMENT_METHOD_CHOICES, default='coa')
+    payment_method_id = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        user = self.context['request'].user
+        legs = data['legs']
+        if len(legs) > settings.BASKET_MAX_LEGS:
+            raise serializers.ValidationError(f"A basket cannot have more than {settings.BASKET_MAX_LEGS} appointments.")
+
+        saloon = Saloon.objects.filter(id=data['saloon_id']).first()
+        if not saloon:
+            raise serializers.ValidationError("The selected saloon does not exist.")
+        if saloon.user == user:
+            raise serializers.ValidationError("You cannot book the appointment on your own saloon.")
+        data['saloon'] = saloon
+
+        coupon_code = data.get('coupon_code')
+        if coupon_code:
+            coupon = SaloonCoupons.objects.filter(code=coupon_code, saloon=saloon).first()
+            if not coupon:
+                raise serializers.ValidationError({"coupon_code": "Invalid coupon code."})
+            if not coupon.is_active():
+                raise serializers.ValidationError({"coupon_code": "This coupon has expired or is inactive."})
+            data['coupon'] = coupon
+
+        staff_ids = {leg['staff_id'] for leg in legs}
+        staff_members = {staff.id: staff for staff in Staff.objects.filter(id__in=staff_ids, saloon=saloon)}
+        staff_services = set(Staff.services.through.objects.filter(
+            staff_id__in=staff_ids
+        ).values_list('staff_id', 'service_id'))
+        working_days = {
+            (working_day.staff_id, working_day.day_of_week): working_day
+            for working_day in WorkingDay.objects.filter(staff_id__in=staff_ids)
+        }
+
+        # One load of every requested variation for the whole basket
+        try:
+            basket_quote = BookingQuote([variation_id for leg in legs for variation_id in leg['service_variation_ids']])
+        except ServiceVariation.DoesNotExist as e:
+            raise serializers.ValidationError(str(e))
+        variations = {str(variation.id): variation for variation in basket_quote.variations}
+
+        conflicts = Q()
+        for index, leg in enumerate(legs):
+            date = leg['date']
+            staff = staff_members.get(leg['staff_id'])
+            if date < datetime.now().date():
+                raise serializers.ValidationError({"legs": {index: "The date cannot be in the past."}})
+            if not staff:
+                raise serializers.ValidationError({"legs": {index: "The selected staff member does not exist."}})
+            if (staff.id, leg['service_id']) not in staff_services:
+                raise serializers.ValidationError({"legs": {index: "The selected staff member does not provide the service."}})
+            leg_variations = [variations[str(variation_id)] for variation_id in leg['service_variation_ids']]
+            if any(
+                variation.service_id != leg['service_id'] or variation.service.saloon_id != saloon.id
+                for variation in leg_variations
+            ):
+                raise serializers.ValidationError({"legs": {index: "A service variation is not valid for the selected service."}})
+
+            quote = BookingQuote.from_variations(leg_variations)
+            end_time = quote.end_time(date, leg['start_time'], staff.buffer_time)
+            working_day = working_days.get((staff.id, date.strftime('%A')))
+            if not working_day or not working_day.start_time or not working_day.end_time:
+                raise serializers.ValidationError({"legs": {index: f"Staff is not working on {date.strftime('%A')}."}})
+            if not (working_day.start_time <= leg['start_time'] and end_time <= working_day.end_time):
+                raise serializers.ValidationError({"legs": {index: "Appointment time is outside of staff working hours."}})
+
+            hold_id = leg.get('hold_id')
+            if hold_id:
+                hold = get_hold(hold_id)
+                if (
+                    hold is None
+                    or hold['staff_id'] != str(staff.id)
+                    or hold['date'] != date.isoformat()
+                    or hold['start_time'] != leg['start_time'].replace(second=0, microsecond=0)
+                    or not owns_hold(hold, user, leg.get('hold_secret'))
+                ):
+                    raise serializers.ValidationError({"legs": {index: "The slot hold has expired or does not match this booking."}})
+
+            leg.update(
+                staff=staff,
+                quote=quote,
+                end_time=end_time,
+                time_range=appointment_time_range(date, leg['start_time'], end_time, saloon.timezone),
+            )
+            conflicts |= Q(staff_id=staff.id, time_range__overlap=leg['time_range'])
+
+        # Legs of the same staff member must not overlap each other either
+        for index, leg in enumerate(legs):
+            for other in legs[index + 1:]:
+                if (
+                    leg['staff'].id == other['staff'].id
+                    and leg['time_range'].lower < other['time_range'].upper
+                    and other['time_range'].lower < leg['time_range'].upper
+                ):
+                    raise serializers.ValidationError("Two appointments in the basket overlap for the same staff member.")
+
+        if Appointment.objects.filter(conflicts).exclude(status='Cancelled').exists():
+            raise serializers.ValidationError("A staff member already has an appointment at one of the selected times.")
+
+        hold_ids = [leg['hold_id'] for leg in legs if leg.get('hold_id')]
+        holds = held_intervals(staff_ids, {leg['date'] for leg in legs}, exclude=hold_ids)
+        for index, leg in enumerate(legs):
+            for hold_start, hold_end in holds.get((str(leg['staff'].id), leg['date']), ()):
+                hold_range = appointment_time_range(leg['date'], hold_start, hold_end, saloon.timezone)
+                if hold_range.lower < leg['time_range'].upper and leg['time_range'].lower < hold_range.upper:
+                    raise serializers.ValidationError({"legs": {index: "This time is currently held by another customer."}})
+
+        data['quote'] = basket_quote
+        return data
+
 
 class AvailableSlotSerializer(serializers.ModelSerializer):
     saloon = serializers.StringRelatedField()
@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from core.utils.availability_bitmap import rebuild_bitmap
+from staffs.models import Staff
+from .models import Appointment
+
+
+def rebuild_bitmaps_on_commit(schedules):
+    """Rebuild the availability bitmaps of the given (staff_id, date) pairs once the change is committed."""
+    schedules = {(staff_id, date) for staff_id, date in schedules if staff_id and date}
+    if not schedules:
+        return
+
+    def rebuild():
+        staff_members = Staff.objects.in_bulk({staff_id for staff_id, _ in schedules})
+        for staff_id, date in schedules:
+            if staff_id in staff_members:
+                rebuild_bitmap(staff_members[staff_id], date)
+
+    transaction.on_commit(rebuild)
+
+
+@receiver(post_init, sender=Appointment)
+def remember_schedule(sender, instance, **kwargs):
+    # Read from __dict__ so deferred fields are not loaded.
+    instance._original_schedule = (instance.__dict__.get('staff_id'), instance.__dict__.get('date'))
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, **kwargs):
+    # A reschedule frees the old day as well as blocking the new one.
+    rebuild_bitmaps_on_commit([instance._original_schedule, (instance.staff_id, instance.date)])
+    instance._original_schedule = (instance.staff_id, instance.date)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    rebuild_bitmaps_on_commit([(instance.staff_id, instance.date)])
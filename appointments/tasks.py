@@ -0,0 +1,186 @@
+import logging
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+from core.utils.mail import APPOINTMENT_EMAIL_TEMPLATES, build_appointment_email
+from core.utils.payments import (
+    PaymentFailed,
+    PaymentUncertain,
+    compensate_payment,
+    discard_payment,
+    load_payment,
+    process_payment,
+)
+from core.utils.slot_materializer import materialize_slots
+from offers.models import CouponUsage
+from staffs.models import Staff
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_LOCK_KEY = "payments:running:{reference}"
+
+
+@shared_task
+def materialize_appointment_slots(saloon_id=None, weeks=None, incremental=True):
+    """Materialize dated slots ahead of time, by default only for days that changed."""
+    staff_members = Staff.objects.all()
+    if saloon_id:
+        staff_members = staff_members.filter(saloon_id=saloon_id)
+    created, changed_days = materialize_slots(staff_members, weeks=weeks, incremental=incremental)
+    return {"created": created, "changed_days": changed_days}
+
+
+@shared_task(bind=True, max_retries=settings.APPOINTMENT_EMAIL_MAX_RETRIES)
+def send_appointment_emails(self, appointment_id, kinds=tuple(APPOINTMENT_EMAIL_TEMPLATES)):
+    """
+    Send the customer, staff and salon confirmation emails of an appointment
+    over one SMTP connection. Only the emails that failed are retried, with
+    exponential backoff.
+    """
+    appointment = Appointment.objects.select_related('saloon', 'service', 'staff').filter(pk=appointment_id).first()
+    if appointment is None:
+        return
+
+    failed = []
+    try:
+        with get_connection() as connection:
+            for kind in kinds:
+                try:
+                    message = build_appointment_email(appointment, kind, connection)
+                    if all(message.to):
+                        message.send()
+                except Exception:
+                    logger.exception("Sending %s email for appointment %s failed", kind, appointment_id)
+                    failed.append(kind)
+    except Exception as e:
+        # The connection itself failed, nothing was sent.
+        logger.warning("SMTP connection for appointment %s emails failed: %s", appointment_id, e)
+        failed = list(kinds)
+
+    if failed:
+        raise self.retry(
+            args=(appointment_id, failed),
+            countdown=settings.APPOINTMENT_EMAIL_RETRY_DELAY * 2 ** self.request.retries,
+        )
+
+
+def fail_appointments(appointments):
+    """Compensation of the booking: cancel the appointments and release their coupon usage."""
+    with transaction.atomic():
+        CouponUsage.objects.filter(appointment__in=appointments).delete()
+        for appointment in appointments:
+            appointment.status = 'Cancelled'
+            appointment.payment_status = 'Failed'
+            appointment.payment_reference = None
+            appointment.save(update_fields=['status', 'payment_status', 'payment_reference'])
+
+
+@shared_task
+def process_appointment_payment(appointment_ids, redrive=False):
+    """
+    Payment step of the booking saga. The appointments were committed with a
+    Pending payment; charge them together and mark them paid, or compensate
+    a failed payment by refunding what was charged, cancelling them and
+    releasing their coupon usage.
+
+    The payment details are read from the encrypted cache entry named by the
+    appointments' payment_reference, they never pass through the broker. The
+    reference is also the idempotency key of every payment call, so a run
+    that is repeated, with `redrive` by reap_stale_payments, charges once.
+    """
+    # Claim the appointments so a redelivered task never charges twice.
+    claimable = ('Pending', 'Processing') if redrive else ('Pending',)
+    claimed = Appointment.objects.filter(pk__in=appointment_ids, payment_status__in=claimable).update(payment_status='Processing')
+    if not claimed:
+        return
+
+    appointments = list(
+        Appointment.objects.filter(pk__in=appointment_ids, payment_status='Processing')
+        .select_related('saloon__user', 'saloon__currency')
+    )
+    reference = appointments[0].payment_reference if appointments else None
+    if not reference:
+        logger.error("Appointments %s have no payment reference, cancelling them", appointment_ids)
+        fail_appointments(appointments)
+        return
+
+    lock_key = PAYMENT_LOCK_KEY.format(reference=reference)
+    if not cache.add(lock_key, 1, settings.PAYMENT_LOCK_TIMEOUT):
+        # Another run of the same payment is in progress.
+        return
+    try:
+        charge_appointments(appointment_ids, appointments, reference)
+    finally:
+        cache.delete(lock_key)
+
+
+def charge_appointments(appointment_ids, appointments, reference):
+    payment = load_payment(reference)
+    if payment is None:
+        logger.error(
+            "Payment details of appointments %s expired before the payment completed, "
+            "cancelling them; check the payment provider for a charge", appointment_ids
+        )
+        fail_appointments(appointments)
+        return
+
+    payment_method = appointments[0].payment_method
+    amount = sum(appointment.total_price or 0 for appointment in appointments)
+    try:
+        payment_status, data = process_payment(payment_method, amount, appointments[0].saloon, payment, reference)
+    except PaymentUncertain as e:
+        # Left Processing, reap_stale_payments repeats the call with the same key.
+        logger.warning("Payment for appointments %s has an unknown outcome: %s", appointment_ids, e)
+        return
+    except Exception as e:
+        if isinstance(e, PaymentFailed):
+            logger.warning("Payment for appointments %s failed: %s", appointment_ids, e)
+        else:
+            logger.exception("Payment for appointments %s failed", appointment_ids)
+        try:
+            compensate_payment(payment_method, payment, reference)
+        except Exception:
+            logger.exception("Refunding the payment of appointments %s failed, it needs a manual refund", appointment_ids)
+        fail_appointments(appointments)
+        discard_payment(reference)
+        return
+
+    data = data or {}
+    with transaction.atomic():
+        for appointment in appointments:
+            appointment.payment_status = payment_status
+            appointment.payment_reference = None
+            appointment.user_send_amount = data.get('user_send_amount', 0)
+            appointment.transaction_id = data.get('transaction_id', 0)
+            appointment.refferal_points_id = data.get('refferal_points_id', 0)
+            appointment.save(update_fields=[
+                'payment_status', 'payment_reference', 'user_send_amount', 'transaction_id', 'refferal_points_id'
+            ])
+            appointment_id = str(appointment.pk)
+            transaction.on_commit(lambda appointment_id=appointment_id: send_appointment_emails.delay(appointment_id))
+    discard_payment(reference)
+
+
+@shared_task
+def reap_stale_payments():
+    """
+    Re-drive payments still Pending or Processing PAYMENT_STALE_AFTER seconds
+    after booking: their task was lost, its worker died, or the outcome was
+    unknown. Payments whose details expired are cancelled by the re-driven run.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.PAYMENT_STALE_AFTER)
+    stale = {}
+    for pk, reference in Appointment.objects.filter(
+        payment_status__in=('Pending', 'Processing'),
+        created_at__lt=cutoff
+    ).values_list('pk', 'payment_reference'):
+        # Appointments paid together share the reference.
+        stale.setdefault(reference or str(pk), []).append(str(pk))
+    for appointment_ids in stale.values():
+        process_appointment_payment.delay(appointment_ids, redrive=True)
+    return len(stale)
@@ -1,3 +1,510 @@
-from django.test import TestCase
+import contextlib
+from datetime import date, time, timedelta
+from decimal import Decimal
+from unittest import mock
+import fakeredis
+import pytz
+import stripe
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import SimpleTestCase, override_settings
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from core.utils import payments, slot_holds, snowflake
+from core.utils.idempotency import IdempotentPostMixin
+from core.utils.slot_engine import compute_day_slots, localize_interval
+from . import tasks, views
+from .models import APPOINTMENT_OVERLAP_CONSTRAINT
 
-# Create your tests here.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class WorkingDayStub(object):
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+
+
+class LocalizeIntervalTests(SimpleTestCase):
+    def test_equal_times_give_an_empty_interval(self):
+        start, end = localize_interval(date(2024, 5, 6), time(12, 0), time(12, 0), pytz.UTC)
+        self.assertEqual(start, end)
+
+    def test_end_before_start_ends_the_next_day(self):
+        start, end = localize_interval(date(2024, 5, 6), time(22, 0), time(2, 0), pytz.UTC)
+        self.assertEqual(end - start, timedelta(hours=4))
+
+    def test_zero_length_break_blocks_nothing(self):
+        slots = compute_day_slots(
+            date(2024, 5, 6), 'UTC', WorkingDayStub(time(9, 0), time(11, 0)),
+            duration=timedelta(minutes=60), buffer_time=timedelta(),
+            breaks=[(time(10, 0), time(10, 0))],
+        )
+        self.assertEqual([slot['start_time'] for slot in slots], ['09:00', '10:00'])
+
+
+class CountingView(IdempotentPostMixin, APIView):
+    authentication_classes = []
+    permission_classes = []
+    calls = 0
+    status = 201
+
+    def post(self, request, *args, **kwargs):
+        CountingView.calls += 1
+        return Response({'call': CountingView.calls}, status=self.status)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class IdempotencyKeyTests(SimpleTestCase):
+    def setUp(self):
+        CountingView.calls = 0
+        self.addCleanup(cache.clear)
+        self.factory = APIRequestFactory()
+
+    def post(self, body, key='key-1', view=CountingView, **headers):
+        request = self.factory.post('/book/', body, format='json', HTTP_IDEMPOTENCY_KEY=key, **headers)
+        return view.as_view()(request)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post({'slot': 1})
+        replay = self.post({'slot': 1})
+        self.assertEqual(CountingView.calls, 1)
+        self.assertEqual((replay.status_code, replay.content), (201, first.rendered_content))
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+
+    def test_key_reused_with_another_body_is_refused(self):
+        self.post({'slot': 1})
+        self.assertEqual(self.post({'slot': 2}).status_code, 422)
+        self.assertEqual(CountingView.calls, 1)
+
+    def test_key_still_in_progress_is_refused(self):
+        with mock.patch('core.utils.idempotency.cache.add', return_value=False):
+            self.assertEqual(self.post({'slot': 1}).status_code, 409)
+        self.assertEqual(CountingView.calls, 0)
+
+    def test_server_errors_are_not_replayed(self):
+        failing = type('FailingView', (CountingView,), {'status': 503})
+        self.post({'slot': 1}, view=failing)
+        self.post({'slot': 1}, view=failing)
+        self.assertEqual(CountingView.calls, 2)
+
+    def test_keys_are_scoped_per_caller(self):
+        self.post({'slot': 1}, HTTP_AUTHORIZATION='Bearer a')
+        self.post({'slot': 1}, HTTP_AUTHORIZATION='Bearer b')
+        self.post({'slot': 1}, REMOTE_ADDR='10.0.0.1')
+        self.post({'slot': 1}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(CountingView.calls, 4)
+        self.post({'slot': 1}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(CountingView.calls, 4)
+
+
+class SnowflakeGeneratorTests(SimpleTestCase):
+    def test_ids_are_unique_and_increasing(self):
+        generator = snowflake.SnowflakeGenerator(node_id=1)
+        ids = [generator.next_id() for _ in range(10000)]
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_frozen_or_backward_clock_keeps_ids_increasing(self):
+        generator = snowflake.SnowflakeGenerator(node_id=1)
+        clock = [1800000000.0]
+        with mock.patch.object(snowflake.time, 'time', side_effect=lambda: clock[0]):
+            # More ids than one millisecond's sequence holds, then the clock steps back.
+            ids = [generator.next_id() for _ in range(snowflake.SEQUENCE_MASK + 10)]
+            clock[0] -= 5
+            ids += [generator.next_id() for _ in range(10)]
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_nodes_never_collide_within_a_millisecond(self):
+        with mock.patch.object(snowflake.time, 'time', return_value=1800000000.0):
+            first = {snowflake.SnowflakeGenerator(node_id=1).next_id() for _ in range(100)}
+            second = {snowflake.SnowflakeGenerator(node_id=2).next_id() for _ in range(100)}
+        self.assertFalse(first & second)
+
+    def test_rejects_node_id_out_of_range(self):
+        with self.assertRaises(ValueError):
+            snowflake.SnowflakeGenerator(node_id=snowflake.MAX_NODE_ID + 1)
+
+
+class RedisStub(object):
+    """The Redis calls NodeLease makes, leases never expire on their own."""
+
+    def __init__(self):
+        self.values = {}
+
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def register_script(self, script):
+        return lambda keys, args: int(self.values.get(keys[0]) == args[0])
+
+
+@override_settings(SNOWFLAKE_NODE_LEASE_TTL=300)
+class NodeLeaseTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = RedisStub()
+        for patcher in (
+            mock.patch.object(snowflake, '_redis', return_value=self.redis),
+            mock.patch.object(snowflake, '_renew_lease', None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_processes_lease_different_node_ids(self):
+        node_ids = {snowflake.NodeLease().current() for _ in range(50)}
+        self.assertEqual(len(node_ids), 50)
+
+    def test_no_lease_left_raises(self):
+        for _ in range(snowflake.MAX_NODE_ID + 1):
+            snowflake.NodeLease().acquire()
+        with self.assertRaises(RuntimeError):
+            snowflake.NodeLease().acquire()
+
+    def test_lost_lease_is_replaced_when_due(self):
+        lease = snowflake.NodeLease()
+        node_id = lease.current()
+        # Another process took the id over after the lease had run out.
+        self.redis.values[snowflake.NODE_LEASE_KEY.format(node_id=node_id)] = 'other'
+        lease.expires_at = 0
+        self.assertNotEqual(lease.current(), node_id)
+
+
+class PaymentSagaTests(SimpleTestCase):
+    def setUp(self):
+        self.payment = {'payment_intent': 'pi_1', 'payment_method_id': 'pm_1'}
+        self.appointments = [
+            mock.Mock(pk=pk, payment_method='stripe', total_price=Decimal('10.00')) for pk in (1, 2)
+        ]
+        self.mocks = {}
+        for name, value in (
+            ('load_payment', self.payment),
+            ('process_payment', ('Paid', {'transaction_id': 7})),
+            ('compensate_payment', 'refunded'),
+            ('fail_appointments', None),
+            ('discard_payment', None),
+            ('transaction', None),
+            ('send_appointment_emails', None),
+        ):
+            patcher = mock.patch.object(tasks, name, return_value=value)
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def charge(self):
+        tasks.charge_appointments([1, 2], self.appointments, 'ref')
+
+    def charge_failing(self):
+        with self.assertLogs(tasks.logger, level='WARNING'):
+            self.charge()
+
+    def test_success_marks_every_leg_paid(self):
+        self.charge()
+        self.mocks['process_payment'].assert_called_once_with(
+            'stripe', Decimal('20.00'), self.appointments[0].saloon, self.payment, 'ref'
+        )
+        for appointment in self.appointments:
+            self.assertEqual((appointment.payment_status, appointment.transaction_id), ('Paid', 7))
+            self.assertNotIn('status', appointment.save.call_args.kwargs['update_fields'])
+        self.mocks['compensate_payment'].assert_not_called()
+        self.mocks['discard_payment'].assert_called_once_with('ref')
+
+    def test_failed_payment_is_compensated_and_cancelled(self):
+        self.mocks['process_payment'].side_effect = payments.PaymentFailed("declined")
+        self.charge_failing()
+        self.mocks['compensate_payment'].assert_called_once_with('stripe', self.payment, 'ref')
+        self.mocks['fail_appointments'].assert_called_once_with(self.appointments)
+        self.mocks['discard_payment'].assert_called_once_with('ref')
+
+    def test_failed_refund_still_cancels(self):
+        self.mocks['process_payment'].side_effect = payments.PaymentFailed("record failed")
+        self.mocks['compensate_payment'].side_effect = stripe.error.APIConnectionError("down")
+        self.charge_failing()
+        self.mocks['fail_appointments'].assert_called_once_with(self.appointments)
+
+    def test_uncertain_payment_is_left_for_the_reaper(self):
+        self.mocks['process_payment'].side_effect = payments.PaymentUncertain("timed out")
+        self.charge_failing()
+        self.mocks['compensate_payment'].assert_not_called()
+        self.mocks['fail_appointments'].assert_not_called()
+        self.mocks['discard_payment'].assert_not_called()
+
+    def test_expired_payment_details_cancel_without_charging(self):
+        self.mocks['load_payment'].return_value = None
+        self.charge_failing()
+        self.mocks['process_payment'].assert_not_called()
+        self.mocks['fail_appointments'].assert_called_once_with(self.appointments)
+
+
+class CompensatePaymentTests(SimpleTestCase):
+    def compensate(self, status, method='stripe'):
+        intent = {'id': 'pi_1', 'status': status}
+        with mock.patch.object(payments.stripe.PaymentIntent, 'retrieve', return_value=intent), \
+                mock.patch.object(payments.stripe.PaymentIntent, 'cancel') as cancel, \
+                mock.patch.object(payments.stripe.Refund, 'create') as refund:
+            outcome = payments.compensate_payment(method, {'payment_intent': 'pi_1'}, 'ref')
+        return outcome, refund, cancel
+
+    def test_succeeded_intent_is_refunded_once(self):
+        outcome, refund, cancel = self.compensate('succeeded')
+        self.assertEqual(outcome, 'refunded')
+        refund.assert_called_once_with(payment_intent='pi_1', idempotency_key='ref:refund')
+        cancel.assert_not_called()
+
+    def test_open_intent_is_cancelled(self):
+        outcome, refund, cancel = self.compensate('requires_confirmation')
+        self.assertEqual(outcome, 'cancelled')
+        cancel.assert_called_once_with('pi_1')
+        refund.assert_not_called()
+
+    def test_nothing_to_undo(self):
+        self.assertIsNone(self.compensate('canceled')[0])
+        self.assertIsNone(self.compensate('succeeded', method='moredeals')[0])
+
+
+@override_settings(SLOT_HOLD_TTL=300, SLOT_HOLD_MAX_PER_CLIENT=2)
+class SlotHoldTests(SimpleTestCase):
+    day = date(2024, 5, 6)
+
+    def setUp(self):
+        self.now = 1800000000.0
+        for patcher in (
+            mock.patch.object(slot_holds, '_redis', return_value=fakeredis.FakeRedis()),
+            mock.patch.object(slot_holds, '_create_hold', None),
+            mock.patch.object(slot_holds.time, 'time', side_effect=lambda: self.now),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def hold(self, start, end, client='client-1', staff_id='staff-1'):
+        return slot_holds.create_hold(staff_id, self.day, time(*start), time(*end), 'owner', client)
+
+    def test_overlapping_hold_is_refused(self):
+        self.assertIsNotNone(self.hold((10, 0), (11, 0)))
+        self.assertIsNone(self.hold((10, 30), (11, 30), client='client-2'))
+        self.assertIsNotNone(self.hold((11, 0), (12, 0), client='client-2'))
+        self.assertIsNotNone(self.hold((10, 30), (11, 30), client='client-2', staff_id='staff-2'))
+        self.assertTrue(slot_holds.overlaps_hold('staff-1', self.day, time(10, 45), time(10, 50)))
+
+    def test_expired_hold_no_longer_blocks(self):
+        self.hold((10, 0), (11, 0))
+        self.now += 301
+        self.assertFalse(slot_holds.overlaps_hold('staff-1', self.day, time(10, 0), time(11, 0)))
+        self.assertIsNotNone(self.hold((10, 0), (11, 0), client='client-2'))
+
+    def test_client_is_capped(self):
+        first = self.hold((9, 0), (10, 0))
+        self.hold((10, 0), (11, 0))
+        with self.assertRaises(slot_holds.HoldLimitReached):
+            self.hold((11, 0), (12, 0))
+        self.assertIsNotNone(self.hold((11, 0), (12, 0), client='client-2'))
+        slot_holds.release_hold(first['hold_id'])
+        self.assertIsNotNone(self.hold((12, 0), (13, 0)))
+
+    def test_anonymous_hold_needs_its_secret(self):
+        secret = slot_holds.new_hold_secret()
+        owner = slot_holds.hold_owner(mock.Mock(is_authenticated=False), secret)
+        hold = {'owner': owner}
+        anonymous = mock.Mock(is_authenticated=False)
+        self.assertTrue(slot_holds.owns_hold(hold, anonymous, secret))
+        self.assertFalse(slot_holds.owns_hold(hold, anonymous, 'guess'))
+        self.assertFalse(slot_holds.owns_hold(hold, anonymous))
+        self.assertFalse(slot_holds.owns_hold({'owner': None}, anonymous))
+
+
+class BookingViewTestCase(SimpleTestCase):
+    """Runs a booking view with its writes, payment store and tasks mocked out."""
+    def setUp(self):
+        self.saved = []
+        self.mocks = {}
+        for name, value in (
+            ('store_payment', 'ref'),
+            ('discard_payment', None),
+            ('release_hold', None),
+            ('process_appointment_payment', None),
+            ('send_appointment_emails', None),
+            ('CouponUsage', None),
+        ):
+            patcher = mock.patch.object(views, name, return_value=value)
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks['CouponUsage'].objects.filter.return_value.exists.return_value = False
+        for patcher in (
+            mock.patch.object(views, 'Appointment', side_effect=self.appointment),
+            mock.patch.object(views.snowflake, 'next_id', side_effect=iter(range(100, 200)).__next__),
+            mock.patch.object(views.transaction, 'atomic', contextlib.nullcontext),
+            mock.patch.object(views.transaction, 'on_commit', side_effect=lambda callback: callback()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    save_error = None
+
+    def appointment(self, **fields):
+        appointment = mock.Mock(pk=len(self.saved) + 1, status='Pending', staff_id=fields['staff'].id, **fields)
+        appointment.save.side_effect = self.save_error
+        self.saved.append(appointment)
+        return appointment
+
+    def post(self, view, serializer, validated_data, body=None):
+        serializer.return_value.is_valid.return_value = True
+        serializer.return_value.validated_data = validated_data
+        serializer.return_value.data = {}
+        request = APIRequestFactory().post('/book/', body or {}, format='json')
+        return view.as_view()(request)
+
+
+class QuoteStub(object):
+    def __init__(self, total_price, discount=Decimal('0')):
+        self.total_price = Decimal(total_price)
+        self._discount = Decimal(discount)
+
+    def discount(self, coupon):
+        return self._discount if coupon else Decimal('0')
+
+
+class BasketBookingTests(BookingViewTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(views, 'BasketBookingSerializer')
+        self.serializer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def leg(self, price, staff_id, hold_id=None):
+        return {
+            'quote': QuoteStub(price),
+            'staff': mock.Mock(id=staff_id),
+            'service_id': 'service-1',
+            'service_variation_ids': ['variation-1'],
+            'date': date(2024, 5, 6),
+            'start_time': time(10, 0),
+            'end_time': time(11, 0),
+            'hold_id': hold_id,
+        }
+
+    def book(self, prices, discount='0', coupon=None, payment_method='coa', **body):
+        legs = [self.leg(price, 'staff-%d' % index, hold_id='hold-%d' % index) for index, price in enumerate(prices)]
+        total = sum((Decimal(price) for price in prices), Decimal(0))
+        return self.post(views.BasketBookingAPIView, self.serializer, {
+            'saloon': mock.Mock(),
+            'legs': legs,
+            'quote': QuoteStub(total, discount),
+            'coupon': coupon,
+            'payment_method': payment_method,
+            'fullname': 'Jo', 'email': 'jo@example.com', 'phone_number': '1',
+        }, body)
+
+    def test_discount_is_split_in_proportion_and_sums_to_the_whole(self):
+        response = self.book(['10.00', '10.00', '10.00'], discount='10.00', coupon=mock.Mock())
+        self.assertEqual(response.status_code, 200)
+        prices = [appointment.total_price for appointment in self.saved]
+        # The last leg takes the rounding remainder.
+        self.assertEqual(prices, [Decimal('6.67'), Decimal('6.67'), Decimal('6.66')])
+        self.assertEqual(response.data['data']['total_price'], Decimal('20.00'))
+        self.mocks['CouponUsage'].objects.create.assert_called_once()
+
+    def test_legs_without_a_coupon_keep_their_price(self):
+        self.book(['30.00', '15.50'], discount='5.00')
+        self.assertEqual([appointment.total_price for appointment in self.saved], [Decimal('30.00'), Decimal('15.50')])
+        self.mocks['CouponUsage'].objects.create.assert_not_called()
+
+    def test_pay_later_basket_is_one_booking(self):
+        response = self.book(['10.00', '20.00'])
+        self.assertEqual(len({appointment.basket_id for appointment in self.saved}), 1)
+        self.assertEqual({appointment.payment_status for appointment in self.saved}, {'Unpaid'})
+        self.assertEqual(len(response.data['data']['appointments']), 2)
+        self.assertEqual(self.mocks['release_hold'].call_count, 2)
+        self.assertEqual(self.mocks['send_appointment_emails'].delay.call_count, 2)
+        self.mocks['store_payment'].assert_not_called()
+
+    def test_paid_basket_takes_a_single_payment(self):
+        response = self.book(['10.00', '20.00'], payment_method='stripe', payment_intent='pi_1')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual({appointment.payment_reference for appointment in self.saved}, {'ref'})
+        self.mocks['process_appointment_payment'].delay.assert_called_once_with(['1', '2'])
+
+    def test_stripe_basket_needs_a_payment_intent(self):
+        self.assertEqual(self.book(['10.00'], payment_method='stripe').status_code, 400)
+        self.assertEqual(self.saved, [])
+
+
+class OverlapConstraintTests(BookingViewTestCase):
+    """A booking that loses the race to the exclusion constraint is a conflict, not a server error."""
+    overlap = IntegrityError(
+        'conflicting key value violates exclusion constraint "%s"' % APPOINTMENT_OVERLAP_CONSTRAINT
+    )
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.object(views, 'Saloon'),
+            mock.patch.object(views, 'Service'),
+            mock.patch.object(views, 'Staff'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(views, 'AppointmentPlaceSerializer')
+        self.serializer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def book(self):
+        quote = mock.Mock()
+        quote.price.return_value = Decimal('10.00')
+        # The view prints the validated data.
+        with mock.patch('builtins.print'):
+            return self.post(views.BookAppointmentAPIView, self.serializer, {
+                'saloon_id': 'saloon-1', 'service_id': 'service-1', 'staff_id': 'staff-1',
+                'service_variation_ids': ['variation-1'], 'date': date(2024, 5, 6),
+                'start_time': time(10, 0), 'end_time': time(11, 0), 'quote': quote,
+                'payment_method': 'stripe', 'fullname': 'Jo', 'email': 'jo@example.com',
+                'phone_number': '1', 'note': None,
+            }, {'payment_intent': 'pi_1'})
+
+    def book_basket(self):
+        leg = {
+            'quote': QuoteStub('10.00'), 'staff': mock.Mock(id='staff-1'), 'service_id': 'service-1',
+            'service_variation_ids': ['variation-1'], 'date': date(2024, 5, 6),
+            'start_time': time(10, 0), 'end_time': time(11, 0),
+        }
+        with mock.patch.object(views, 'BasketBookingSerializer') as serializer:
+            return self.post(views.BasketBookingAPIView, serializer, {
+                'saloon': mock.Mock(), 'legs': [leg], 'quote': QuoteStub('10.00'),
+                'payment_method': 'stripe', 'fullname': 'Jo', 'email': 'jo@example.com', 'phone_number': '1',
+            }, {'payment_intent': 'pi_1'})
+
+    def test_overlap_is_a_conflict_and_drops_the_payment(self):
+        self.save_error = self.overlap
+        response = self.book()
+        self.assertEqual(response.status_code, 409)
+        self.mocks['discard_payment'].assert_called_once_with('ref')
+        self.mocks['process_appointment_payment'].delay.assert_not_called()
+
+    def test_other_integrity_errors_are_not_reported_as_conflicts(self):
+        self.save_error = IntegrityError('null value in column "email"')
+        self.assertEqual(self.book().status_code, 500)
+        self.mocks['discard_payment'].assert_called_once_with('ref')
+
+    def test_overlap_caught_by_validation_is_a_bad_request(self):
+        self.serializer.return_value.is_valid.return_value = False
+        self.serializer.return_value.errors = {
+            'non_field_errors': ["This staff member already has an appointment at this time."]
+        }
+        request = APIRequestFactory().post('/book/', {}, format='json')
+        self.assertEqual(views.BookAppointmentAPIView.as_view()(request).status_code, 400)
+        self.assertEqual(self.saved, [])
+
+    def test_basket_overlap_is_a_conflict_and_drops_the_payment(self):
+        self.save_error = self.overlap
+        self.assertEqual(self.book_basket().status_code, 409)
+        self.mocks['discard_payment'].assert_called_once_with('ref')
+
+    def test_basket_keeps_raising_other_integrity_errors(self):
+        self.save_error = IntegrityError('null value in column "email"')
+        with self.assertRaises(IntegrityError):
+            self.book_basket()
+        self.mocks['discard_payment'].assert_called_once_with('ref')
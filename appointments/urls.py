@@ -8,11 +8,17 @@ from .views import(
        AppointmentSlotDetailAPIView,
        StaffAppointmentsListAPIView,
        AvailableSlotListAPIView,
+       AvailableSlotRangeAPIView,
+       SaloonAvailableSlotListAPIView,
+       SlotHoldCreateAPIView,
+       BasketBookingAPIView,
+       SlotHoldDetailAPIView,
        AppointmentListAPIView
 )
 
 urlpatterns = [
     path('place/', BookAppointmentAPIView.as_view(), name='place_appointment'),
+    path('basket/', BasketBookingAPIView.as_view(), name='basket_appointment'),
     path('list/', AppointmentListAPIView.as_view(), name='appointment_list'),
     path('user/', UserAppointmentsListAPIView.as_view(), name='user_appointments'),
     path('<int:appointment_id>/', AppointmentDetailAPIView.as_view(), name='appointment_detail'),
@@ -21,4 +27,8 @@ urlpatterns = [
     path('appointment-slots/<uuid:id>/', AppointmentSlotDetailAPIView.as_view(), name='appointment-slot-detail'),
     path('staff-appointments/<int:staff_id>/', StaffAppointmentsListAPIView.as_view(), name='staff-appointments-list'),
     path('available-slots/<uuid:staff_id>/', AvailableSlotListAPIView.as_view(), name='admin-available-slots'),
+    path('available-slots/<uuid:staff_id>/range/', AvailableSlotRangeAPIView.as_view(), name='available-slots-range'),
+    path('available-slots/saloon/<uuid:saloon_id>/', SaloonAvailableSlotListAPIView.as_view(), name='saloon-available-slots'),
+    path('holds/', SlotHoldCreateAPIView.as_view(), name='slot-hold-create'),
+    path('holds/<uuid:hold_id>/', SlotHoldDetailAPIView.as_view(), name='slot-hold-detail'),
 ]
@@ -1,5 +1,5 @@
-import requests
 from rest_framework.views import APIView
+from rest_framework.throttling import BaseThrottle, ScopedRateThrottle
 from rest_framework import generics, permissions
 from rest_framework.permissions import IsAuthenticated,IsAdminUser
 from django.shortcuts import get_object_or_404
@@ -8,30 +8,45 @@ from django.utils.dateparse import parse_date
 from users.models import User
 from django.utils import timezone
 from offers.models import CouponUsage
-from core.utils.moredealstoken import get_moredeals_token
-from django.db import transaction
+from core.utils import snowflake
+from core.utils.slot_holds import HoldLimitReached, create_hold, get_hold, hold_owner, new_hold_secret, owns_hold, release_hold
+from core.utils.idempotency import IdempotentPostMixin
+from core.utils.payments import discard_payment, store_payment
+from django.db import transaction, IntegrityError
 import stripe
 from staffs.models import BreakTime
 from datetime import datetime
 from services.models import Service, ServiceVariation
 from staffs.models import Staff, WorkingDay
-from core.utils.fetch_slot import fetch_available_slots
+from core.utils.fetch_slot import fetch_available_slots, fetch_available_slots_range, fetch_saloon_available_slots
 from django.conf import settings
 from django.core.mail import send_mail
 from rest_framework.exceptions import ValidationError
-from .models import Appointment, AppointmentSlot
-from .serializers import AppointmentPlaceSerializer, AppointmentSlotSerializer, AvailableSlotSerializer,AppointmentListSerializer,UserAppointmentListSerializer
+from .models import Appointment, AppointmentSlot, APPOINTMENT_OVERLAP_CONSTRAINT
+from .serializers import AppointmentPlaceSerializer, BasketBookingSerializer, SlotHoldSerializer, AppointmentSlotSerializer, AvailableSlotSerializer,AppointmentListSerializer,UserAppointmentListSerializer
 from saloons.models import Saloon
 from core.utils.pagination import CustomPageNumberPagination
-from core.utils.mail import send_confirmation_email,staff_confirmation_email,salon_confirmation_email
-from core.utils.appointment import calculate_total_appointment_price, book_appointment,calculate_appointment_end_time
+from .tasks import send_appointment_emails, process_appointment_payment
+from core.utils.appointment import book_appointment
 from datetime import datetime,timedelta
-import random
+from decimal import Decimal
+import uuid
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
-class BookAppointmentAPIView(APIView):
+def invalid_uuids(*values):
+    """The values that are not UUIDs, so lookups by them can be rejected with a 400."""
+    invalid = []
+    for value in values:
+        try:
+            uuid.UUID(str(value))
+        except ValueError:
+            invalid.append(value)
+    return invalid
+
+
+class BookAppointmentAPIView(IdempotentPostMixin, APIView):
     def post(self, request, *args, **kwargs):
         data = request.data
         serializer = AppointmentPlaceSerializer(data=data, context={'request': request})
@@ -64,25 +79,10 @@ class BookAppointmentAPIView(APIView):
                 errors={"non_field_errors": ["Invalid data provided."]}
             ).send(400)
 
-        buffer_time = staff.buffer_time
-
-        # Calculate the start time and end time
-        try:
-            end_time = calculate_appointment_end_time(
-                date=validated_data['date'],
-                start_time=start_time,
-                service_variations_ids=service_variations_ids,
-                buffer_time=buffer_time
-            )
-        except ValueError as e:
-            return PrepareResponse(
-                success=False,
-                message=str(e)
-            ).send(400)
-
-        total_price = calculate_total_appointment_price(service_variations_ids)
+        # Duration and price come from the variations the serializer already loaded
+        quote = validated_data['quote']
+        end_time = validated_data['end_time']
         coupon = validated_data.get('coupon')
-        discount_amount = 0
 
         if coupon:
             if CouponUsage.objects.filter(coupon=coupon, user=request.user).exists():
@@ -91,31 +91,47 @@ class BookAppointmentAPIView(APIView):
                     message="You have already used this coupon."
                 ).send(400)
 
-            if coupon.percentage_discount:
-                discount_amount = (total_price * coupon.percentage_discount) / 100
-            elif coupon.fixed_discount:
-                discount_amount = min(coupon.fixed_discount, total_price)
-
-            total_price -= discount_amount
+        total_price = quote.price(coupon)
+        payment_method = validated_data.get('payment_method')
+        payment = {
+            'payment_intent': request.data.get('payment_intent'),
+            'payment_method_id': validated_data.get('payment_method_id'),
+            'pin': request.data.get('pin'),
+            'authorization': request.headers.get('Authorization'),
+        }
+        if payment_method == 'stripe' and not payment['payment_intent']:
+            return PrepareResponse(
+                success=False,
+                message="Payment intent not provided",
+                errors={"non_field_errors": ["Payment intent not provided"]}
+            ).send(400)
+        if payment_method == 'moredeals' and not (payment['pin'] and payment['authorization']):
+            return PrepareResponse(
+                success=False,
+                message="PIN not provided for MoreDeals payment",
+                errors={"non_field_errors": ["PIN not provided for MoreDeals payment"]}
+            ).send(400)
 
+        # The appointment is committed straight away with a pending payment,
+        # the payment itself runs in a task outside of the transaction. The
+        # PIN and authorization header wait encrypted in the cache for it.
+        pays_later = payment_method == 'coa'
+        payment_reference = None if pays_later else store_payment(payment)
         try:
             with transaction.atomic():
                 # Create the appointment
-                minimum = pow(10, 10 - 1)
-                maximum = pow(10, 10) - 1
-                unique_id = random.randint(minimum, maximum)
-
                 appointment = Appointment(
                     user=request.user if request.user.is_authenticated else None,
                     saloon=saloon,
                     service=service,
-                    appointment_id=unique_id,
+                    appointment_id=str(snowflake.next_id()),
                     staff=staff,
                     date=validated_data['date'],
                     start_time=start_time,
                     end_time=end_time,
-                    payment_method=validated_data.get('payment_method'),
-                    payment_status='Pending',
+                    payment_method=payment_method,
+                    payment_status='Unpaid' if pays_later else 'Pending',
+                    payment_reference=payment_reference,
                     total_price=total_price,
                     coupon=coupon,
                     fullname=validated_data['fullname'],
@@ -134,155 +150,52 @@ class BookAppointmentAPIView(APIView):
                         appointment=appointment
                     )
 
-                # Process payment
-                payment_status, message, data = self.process_payment(
-                    request=request,
-                    payment_method=validated_data.get('payment_method'),
-                    amount=total_price,
-                    user=request.user if request.user.is_authenticated else None,
-                    payment_method_id=validated_data.get('payment_method_id'),
-                    saloon=saloon,
-                    data=data
-                )
-
-                if not payment_status:
-                    raise ValueError("Payment processing failed.")
-
-                # Update appointment with payment details
-                appointment.payment_status = payment_status
-                if data:
-                    appointment.user_send_amount = data.get('user_send_amount', 0)
-                    appointment.transaction_id = data.get('transaction_id', 0)
-                    appointment.refferal_points_id = data.get('refferal_points_id', 0)
-                appointment.save()
-
-                # Send confirmation emails
-                send_confirmation_email(appointment)
-                staff_confirmation_email(appointment)
-                salon_confirmation_email(appointment)
-
-            return PrepareResponse(
-                success=True,
-                message="Appointment booked successfully.",
-                data=serializer.data
-            ).send(200)
-
-        except ValidationError as e:
-            return PrepareResponse(
-                success=False,
-                message="Payment failed",
-                errors={"payment_errors": str(e)}
-            ).send(400)
+                appointment_pk = str(appointment.pk)
+                hold_id = validated_data.get('hold_id')
+                if hold_id:
+                    # The appointment now blocks the slot, the hold is no longer needed.
+                    transaction.on_commit(lambda: release_hold(hold_id))
+                if pays_later:
+                    # Send confirmation emails once the booking is committed
+                    transaction.on_commit(lambda: send_appointment_emails.delay(appointment_pk))
+                else:
+                    transaction.on_commit(lambda: process_appointment_payment.delay([appointment_pk]))
 
         except Exception as e:
+            if payment_reference:
+                discard_payment(payment_reference)
+            # A concurrent booking of the same staff member won the race.
+            if isinstance(e, IntegrityError) and APPOINTMENT_OVERLAP_CONSTRAINT in str(e):
+                return PrepareResponse(
+                    success=False,
+                    message="This staff member already has an appointment at this time.",
+                    errors={"non_field_errors": ["This staff member already has an appointment at this time."]}
+                ).send(409)
             return PrepareResponse(
                 success=False,
                 message="An error occurred while booking the appointment.",
                 errors={"non_field_errors": [str(e)]}
             ).send(500)
-    
-    def process_payment(self, request, payment_method, amount, user, payment_method_id, saloon, data):
-        if payment_method == 'coa':
-            return 'Unpaid', "Success", None
-        elif payment_method =='stripe':
-            try:
-                payment_intent = request.data.get('payment_intent')
-                if not payment_intent:
-                    return "Payment intent not provided", False, None
-
-                payment_intent = stripe.PaymentIntent.confirm(
-                    payment_intent,
-                      payment_method=payment_method_id,
-                      return_url='http://127.0.0.1:8000/appointments/book'
-                      )
-
-                if payment_intent['status'] != 'succeeded':
-                    raise ValueError(f"Payment failed with status: {payment_intent['status']}")
-                    
-                else:
-                    moredeals_status, message, data = self.stripe_payment(request,amount,saloon, payment_method_id)
-                    return moredeals_status, message, data
-            except stripe.error.CardError as e:
-                raise ValidationError(str(e))
-        elif payment_method == 'moredeals':
-            try:
-                moredeals_status, message, data = self.process_moredeals_payment(request,amount,saloon, payment_method, data)
-                return moredeals_status, message, data
-            except Exception as e:
-                raise ValidationError(str(e))
-            
-    def get_auth_headers(self, request):
-        auth_header=request.headers.get('Authorization')
-        return {'Authorization': auth_header} if auth_header else {}
-
-    def stripe_payment(self,request,amount,saloon, payment_method_id):
-        try:
-            payment_method_get = stripe.PaymentMethod.retrieve(payment_method_id)
-            payer_detail = self.get_payer_detail(payment_method_get)
-            
-            url = "http://192.168.1.72:8000/api/payments/payment-through-stripe/"
-            
-            response = requests.post(
-                url,
-                data={
-                'amount': amount,
-                'payer_detail': payer_detail,
-                "brand": payment_method_get['type'],
-                'recipient': saloon.user.username,
-                'from_project': 'moresaloon',
-                'currency_code': saloon.currency.currency_code
-                },
-                headers=self.get_auth_headers(request)
-            )
-            if response.status_code == 200:
-                payment_data = response.json()['data']
 
-                return 'Paid', "Payment processed successfully", payment_data
-            else:
-                raise ValidationError("Payment failed: {}".format(response.json().get('error', 'Unknown error')))
-
-        except requests.RequestException as e:
-            raise ValidationError(f"Payment request error: {str(e)}")
-    
-    def get_payer_detail(self, payment_method_get):
-        if payment_method_get['type'] == 'card':
-            return payment_method_get['card']['last4']
-        elif payment_method_get['type'] == 'paypal':
-            return payment_method_get['paypal']['payer_email']
-        elif payment_method_get['type'] == 'swish':
-            return payment_method_get['type']
-        return ''
-        
-    
-    def process_moredeals_payment(self, request,amount,saloon, payment_method, data):
-        pin = request.data.get('pin')
-        if not pin:
+        data = dict(serializer.data)
+        data.update(
+            appointment_id=appointment.appointment_id,
+            status=appointment.status,
+            payment_status=appointment.payment_status,
+        )
+        if pays_later:
             return PrepareResponse(
-                success=False,
-                message="PIN not provided for MoreDeals payment",
-                errors={"non_field_errors": ["PIN not provided for MoreDeals payment"]}
-            ).send(400)
-        
+                success=True,
+                message="Appointment booked successfully.",
+                data=data
+            ).send(200)
+        return PrepareResponse(
+            success=True,
+            message="Appointment booked, payment is being processed.",
+            data=data
+        ).send(202)
+
 
-        url = f"https://moretrek.com/api/payments/payment-through-balance/"
-        access_token = get_moredeals_token(request)
-        
-        response = requests.post(url, data={
-            'amount': amount,
-            'pin': pin,
-            'recipient': saloon.user.username,
-            'currency_code': saloon.currency.currency_code,
-            'remarks': f'Payment from {payment_method}',
-            'platform':'moresaloon'
-        }, headers={'Authorization': f"{access_token}"})
-        if response.status_code == 200:
-            print(response.json())
-            return True, "Success", response.json()['data']
-        else:
-            errors = response.json()['errors']['non_field_errors'][0]
-            return False, errors
-        
-    
 class AppointmentListAPIView(generics.GenericAPIView):
     def get(self, request, *args, **kwargs):
         appointments = Appointment.objects.all()
@@ -654,6 +567,13 @@ class AvailableSlotListAPIView(APIView):
                 data=None,
             ).send(400)
 
+        if invalid_uuids(saloon_id, *service_variations):
+            return PrepareResponse(
+                success=False,
+                message="saloon_id and service_variation must be valid UUIDs.",
+                data=None,
+            ).send(400)
+
         # Get saloon and staff details
         try:
             saloon = Saloon.objects.get(id=saloon_id)
@@ -712,7 +632,342 @@ class AvailableSlotListAPIView(APIView):
             ).send(500)
 
 
+class AvailableSlotRangeAPIView(APIView):
+    """
+    Available slots of a staff member for every day of a date range. With
+    `summary=true` each day only reports whether it has any free slot, which
+    is what month views need.
+    """
+    def get(self, request, *args, **kwargs):
+        staff_id = self.kwargs.get("staff_id")
+        saloon_id = request.query_params.get("saloon_id")
+        service_variations = request.query_params.getlist("service_variation", [])
+        summary = request.query_params.get("summary", "false").lower() == "true"
 
-        
-    
+        try:
+            start_date = datetime.strptime(request.query_params.get("start_date"), "%Y-%m-%d").date()
+            end_date = datetime.strptime(request.query_params.get("end_date"), "%Y-%m-%d").date()
+        except (ValueError, TypeError):
+            return PrepareResponse(
+                success=False,
+                message="Invalid start_date or end_date provided. Use 'YYYY-MM-DD'.",
+                data=None,
+            ).send(400)
+
+        if end_date < start_date:
+            return PrepareResponse(
+                success=False,
+                message="end_date must not be before start_date.",
+                data=None,
+            ).send(400)
+
+        max_days = settings.AVAILABILITY_RANGE_MAX_DAYS
+        if (end_date - start_date).days + 1 > max_days:
+            return PrepareResponse(
+                success=False,
+                message=f"Date range cannot exceed {max_days} days.",
+                data=None,
+            ).send(400)
+
+        if not service_variations:
+            return PrepareResponse(
+                success=False,
+                message="No service variations provided.",
+                data=None,
+            ).send(400)
+
+        if invalid_uuids(saloon_id, *service_variations):
+            return PrepareResponse(
+                success=False,
+                message="saloon_id and service_variation must be valid UUIDs.",
+                data=None,
+            ).send(400)
+
+        try:
+            saloon = Saloon.objects.get(id=saloon_id)
+            staff = Staff.objects.get(id=staff_id, saloon=saloon)
+        except Saloon.DoesNotExist:
+            return PrepareResponse(
+                success=False,
+                message="Saloon not found.",
+                data=None,
+            ).send(404)
+        except Staff.DoesNotExist:
+            return PrepareResponse(
+                success=False,
+                message="Staff not found.",
+                data=None,
+            ).send(404)
+
+        availability = fetch_available_slots_range(
+            saloon, staff, start_date, end_date, service_variations, summary=summary
+        )
+        return PrepareResponse(
+            success=True,
+            message="Available slots fetched successfully.",
+            data=availability,
+        ).send(200)
+
+
+class SaloonAvailableSlotListAPIView(APIView):
+    """
+    "Any staff" availability: the merged slots of every staff member of the
+    saloon who offers the requested services, each slot listing who can
+    take it.
+    """
+    def get(self, request, *args, **kwargs):
+        saloon_id = self.kwargs.get("saloon_id")
+        service_variations = request.query_params.getlist("service_variation", [])
+
+        try:
+            date = datetime.strptime(request.query_params.get("date"), "%Y-%m-%d").date()
+        except (ValueError, TypeError):
+            return PrepareResponse(
+                success=False,
+                message="Invalid date format provided. Use 'YYYY-MM-DD'.",
+                data=None,
+            ).send(400)
+
+        if not service_variations:
+            return PrepareResponse(
+                success=False,
+                message="No service variations provided.",
+                data=None,
+            ).send(400)
+
+        if invalid_uuids(*service_variations):
+            return PrepareResponse(
+                success=False,
+                message="service_variation must be valid UUIDs.",
+                data=None,
+            ).send(400)
+
+        saloon = get_object_or_404(Saloon, id=saloon_id)
+        slots = fetch_saloon_available_slots(saloon, date, service_variations)
+        if not slots:
+            return PrepareResponse(
+                success=False,
+                message="No available slots found.",
+                data=None,
+            ).send(404)
+
+        return PrepareResponse(
+            success=True,
+            message="Available slots fetched successfully.",
+            data=slots,
+        ).send(200)
+
+
+class SlotHoldCreateAPIView(APIView):
+    """
+    Hold a slot for SLOT_HOLD_TTL seconds during checkout. Other customers
+    do not see it as available, and booking with the hold_id releases it.
+    Anonymous holds come with a hold_secret that booking or releasing them
+    requires. Creation is rate limited, and a user or IP address holds at
+    most SLOT_HOLD_MAX_PER_CLIENT slots at once.
+    """
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'slot_holds'
+
+    def post(self, request, *args, **kwargs):
+        serializer = SlotHoldSerializer(data=request.data)
+        if not serializer.is_valid():
+            return PrepareResponse(
+                success=False,
+                message="Slot hold failed",
+                errors=serializer.errors
+            ).send(400)
 
+        validated_data = serializer.validated_data
+        authenticated = request.user.is_authenticated
+        hold_secret = None if authenticated else new_hold_secret()
+        try:
+            hold = create_hold(
+                validated_data['staff'].pk,
+                validated_data['date'],
+                validated_data['start_time'],
+                validated_data['end_time'],
+                owner=hold_owner(request.user, hold_secret),
+                client=str(request.user.pk) if authenticated else BaseThrottle().get_ident(request),
+            )
+        except HoldLimitReached:
+            return PrepareResponse(
+                success=False,
+                message="You are already holding the maximum number of slots.",
+            ).send(429)
+        if hold is None:
+            return PrepareResponse(
+                success=False,
+                message="This slot is currently held by another customer.",
+            ).send(409)
+        if hold_secret:
+            hold['hold_secret'] = hold_secret
+        return PrepareResponse(
+            success=True,
+            message="Slot held successfully.",
+            data=hold
+        ).send(201)
+
+
+class SlotHoldDetailAPIView(APIView):
+    def delete(self, request, *args, **kwargs):
+        hold = get_hold(self.kwargs.get('hold_id'))
+        hold_secret = request.headers.get('X-Hold-Secret') or request.data.get('hold_secret')
+        if hold is None or not owns_hold(hold, request.user, hold_secret):
+            return PrepareResponse(
+                success=False,
+                message="Slot hold not found.",
+            ).send(404)
+        release_hold(hold['hold_id'])
+        return PrepareResponse(
+            success=True,
+            message="Slot hold released successfully."
+        ).send(200)
+
+
+class BasketBookingAPIView(IdempotentPostMixin, APIView):
+    """
+    Book several (staff, variations, start) legs at one saloon atomically
+    and take a single payment for all of them through the booking saga.
+    """
+    def post(self, request, *args, **kwargs):
+        serializer = BasketBookingSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return PrepareResponse(
+                success=False,
+                data=serializer.errors,
+                message="Basket booking failed"
+            ).send(400)
+
+        validated_data = serializer.validated_data
+        saloon = validated_data['saloon']
+        legs = validated_data['legs']
+        quote = validated_data['quote']
+        coupon = validated_data.get('coupon')
+        payment_method = validated_data['payment_method']
+
+        if coupon and CouponUsage.objects.filter(coupon=coupon, user=request.user).exists():
+            return PrepareResponse(
+                success=False,
+                message="You have already used this coupon."
+            ).send(400)
+
+        payment = {
+            'payment_intent': request.data.get('payment_intent'),
+            'payment_method_id': validated_data.get('payment_method_id'),
+            'pin': request.data.get('pin'),
+            'authorization': request.headers.get('Authorization'),
+        }
+        if payment_method == 'stripe' and not payment['payment_intent']:
+            return PrepareResponse(
+                success=False,
+                message="Payment intent not provided",
+                errors={"non_field_errors": ["Payment intent not provided"]}
+            ).send(400)
+        if payment_method == 'moredeals' and not (payment['pin'] and payment['authorization']):
+            return PrepareResponse(
+                success=False,
+                message="PIN not provided for MoreDeals payment",
+                errors={"non_field_errors": ["PIN not provided for MoreDeals payment"]}
+            ).send(400)
+
+        # Spread the basket discount over the legs in proportion to their price
+        total_price = quote.total_price
+        discount = Decimal(quote.discount(coupon))
+        leg_prices = []
+        remaining_discount = discount
+        for index, leg in enumerate(legs):
+            leg_price = leg['quote'].total_price
+            if index == len(legs) - 1:
+                leg_discount = remaining_discount
+            else:
+                leg_discount = (discount * leg_price / total_price).quantize(Decimal('0.01')) if total_price else Decimal(0)
+                remaining_discount -= leg_discount
+            leg_prices.append(leg_price - leg_discount)
+
+        pays_later = payment_method == 'coa'
+        # All legs share one payment, its details wait encrypted in the cache.
+        payment_reference = None if pays_later else store_payment(payment)
+        basket_id = uuid.uuid4()
+        try:
+            with transaction.atomic():
+                appointments = []
+                for leg, leg_price in zip(legs, leg_prices):
+                    appointment = Appointment(
+                        user=request.user if request.user.is_authenticated else None,
+                        saloon=saloon,
+                        service_id=leg['service_id'],
+                        appointment_id=str(snowflake.next_id()),
+                        staff=leg['staff'],
+                        date=leg['date'],
+                        start_time=leg['start_time'],
+                        end_time=leg['end_time'],
+                        payment_method=payment_method,
+                        payment_status='Unpaid' if pays_later else 'Pending',
+                        payment_reference=payment_reference,
+                        total_price=leg_price,
+                        coupon=coupon,
+                        fullname=validated_data['fullname'],
+                        email=validated_data['email'],
+                        phone_number=validated_data['phone_number'],
+                        note=validated_data.get('note'),
+                        basket_id=basket_id,
+                    )
+                    appointment.save()
+                    appointment.service_variation.add(*leg['service_variation_ids'])
+                    appointments.append(appointment)
+
+                if coupon:
+                    CouponUsage.objects.create(
+                        coupon=coupon,
+                        user=request.user,
+                        appointment=appointments[0]
+                    )
+
+                appointment_pks = [str(appointment.pk) for appointment in appointments]
+                hold_ids = [leg['hold_id'] for leg in legs if leg.get('hold_id')]
+                if hold_ids:
+                    transaction.on_commit(lambda: [release_hold(hold_id) for hold_id in hold_ids])
+                if pays_later:
+                    transaction.on_commit(lambda: [send_appointment_emails.delay(pk) for pk in appointment_pks])
+                else:
+                    transaction.on_commit(lambda: process_appointment_payment.delay(appointment_pks))
+
+        except IntegrityError as e:
+            if payment_reference:
+                discard_payment(payment_reference)
+            if APPOINTMENT_OVERLAP_CONSTRAINT not in str(e):
+                raise
+            return PrepareResponse(
+                success=False,
+                message="A staff member already has an appointment at one of the selected times.",
+                errors={"non_field_errors": ["A staff member already has an appointment at one of the selected times."]}
+            ).send(409)
+
+        data = {
+            'basket_id': str(basket_id),
+            'total_price': sum(leg_prices, Decimal(0)),
+            'payment_status': 'Unpaid' if pays_later else 'Pending',
+            'appointments': [
+                {
+                    'appointment_id': appointment.appointment_id,
+                    'staff_id': str(appointment.staff_id),
+                    'date': appointment.date,
+                    'start_time': appointment.start_time,
+                    'end_time': appointment.end_time,
+                    'total_price': appointment.total_price,
+                }
+                for appointment in appointments
+            ],
+        }
+        if pays_later:
+            return PrepareResponse(
+                success=True,
+                message="Appointments booked successfully.",
+                data=data
+            ).send(200)
+        return PrepareResponse(
+            success=True,
+            message="Appointments booked, payment is being processed.",
+            data=data
+        ).send(202)
@@ -52,6 +52,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'cloudinary_storage',
     'cloudinary',
     'rest_framework',
@@ -96,6 +97,11 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
 ]
 
+# Database query count and time in response headers, used by the load tests (loadtest/)
+QUERY_COUNT_HEADERS = os.getenv('QUERY_COUNT_HEADERS', 'False') == 'True'
+if QUERY_COUNT_HEADERS:
+    MIDDLEWARE.insert(0, 'core.utils.query_count_middleware.QueryCountMiddleware')
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -250,6 +256,10 @@ REST_FRAMEWORK = {
     "json",
     "DEFAULT_PAGINATION_CLASS":
     "rest_framework.pagination.LimitOffsetPagination",
+    # Rates of the views with a throttle_scope (ScopedRateThrottle)
+    "DEFAULT_THROTTLE_RATES": {
+        "slot_holds": "30/hour",
+    },
 }
 
 SPECTACULAR_SETTINGS = {
@@ -267,7 +277,104 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
-SSO_SERVICE_URL = 'https://moretrek.com/api/'
+SSO_SERVICE_URL = os.getenv('SSO_SERVICE_URL', 'https://moretrek.com/api/')
+
+# Verify SSO tokens locally against the signing keys published by the SSO
+# service; the remote verify endpoint is only used for unknown keys. Off
+# unless a key set URL or a public key is configured.
+SSO_JWKS_URL = os.getenv('SSO_JWKS_URL')  # e.g. f'{SSO_SERVICE_URL}auth/jwks/'
+SSO_JWT_PUBLIC_KEY = os.getenv('SSO_JWT_PUBLIC_KEY')  # PEM, takes precedence over the JWKS
+SSO_LOCAL_VERIFICATION = os.getenv('SSO_LOCAL_VERIFICATION', str(bool(SSO_JWKS_URL or SSO_JWT_PUBLIC_KEY))) == 'True'
+SSO_JWKS_REFRESH_INTERVAL = 300  # seconds
+SSO_JWKS_TIMEOUT = 5  # seconds
+SSO_JWKS_FAILURE_BACKOFF = 60  # seconds without key set fetches after a failed one
+SSO_JWT_ALGORITHMS = ['RS256', 'ES256']
+SSO_JWT_AUDIENCE = os.getenv('SSO_JWT_AUDIENCE')  # `aud` is only checked when set
+SSO_JWT_ISSUER = os.getenv('SSO_JWT_ISSUER')  # `iss` is only checked when set
+SSO_JWT_LEEWAY = 10  # seconds
+# Upper bound for the token -> local user cache, entries never outlive the token.
+SSO_IDENTITY_CACHE_TTL = 15 * 60  # seconds
+SSO_PERMISSIONS_URL = f'{SSO_SERVICE_URL}permissions/saloon/'
+SALOON_PERMISSION_CACHE_TTL = 60  # seconds
+SALOON_PERMISSION_NEGATIVE_CACHE_TTL = 15  # seconds
+
+# Circuit breaker around the SSO service (core.utils.circuit_breaker)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_FAILURE_WINDOW = 30  # seconds
+CIRCUIT_BREAKER_RECOVERY_TIMEOUT = 30  # seconds
+# While the SSO service is unavailable, identities and permission grants
+# validated within this window are served from cache.
+SSO_STALE_GRACE_PERIOD = 60 * 60  # seconds
+SSO_REFRESH_RETRY_DELAY = 30  # seconds, doubled on every retry
+SSO_REFRESH_MAX_RETRIES = 4
+# A token waits encrypted in the cache this long for its refresh, no other
+# refresh of it is queued meanwhile.
+SSO_REFRESH_TTL = 10 * 60  # seconds
+# Fernet key for secrets kept in the cache (core.utils.sealing), derived
+# from SECRET_KEY when unset.
+SEALING_KEY = os.getenv('SEALING_KEY')
+
+# Outbound integrations
+MORETREK_PAYMENTS_URL = os.getenv('MORETREK_PAYMENTS_URL', 'https://moretrek.com/api/payments/')
+STRIPE_PAYMENTS_URL = os.getenv('STRIPE_PAYMENTS_URL', 'http://192.168.1.72:8000/api/payments/')
+# Stripe API host override, points the Stripe client at the load-test stub server
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE')
+
+# Shared HTTP client (core.utils.http_client)
+HTTP_CLIENT_POOL_SIZE = 10  # keep-alive connections per host
+HTTP_CLIENT_CONNECT_TIMEOUT = 3.05  # seconds
+HTTP_CLIENT_READ_TIMEOUT = 10  # seconds
+HTTP_CLIENT_PAYMENT_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+HTTP_CLIENT_MAX_RETRIES = 2
+HTTP_CLIENT_BACKOFF_FACTOR = 0.2
+HTTP_CLIENT_BACKOFF_JITTER = 0.2  # seconds
+
+# Longest date range served by a single multi-day availability request
+AVAILABILITY_RANGE_MAX_DAYS = 31
+# Per staff, per day availability bitmaps (core.utils.availability_bitmap)
+AVAILABILITY_BITMAP_CELL_MINUTES = 5
+AVAILABILITY_BITMAP_TTL = 24 * 60 * 60  # seconds
+# How far ahead dated AppointmentSlot rows are materialized (core.utils.slot_materializer)
+SLOT_MATERIALIZATION_WEEKS = 4
+# Confirmation emails are sent by a Celery task after the booking commits
+APPOINTMENT_EMAIL_MAX_RETRIES = 5
+APPOINTMENT_EMAIL_RETRY_DELAY = 30  # seconds, doubled on every retry
+# Responses replayed for repeated Idempotency-Key headers (core.utils.idempotency)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds
+IDEMPOTENCY_LOCK_TIMEOUT = 60  # seconds, longer than the slowest payment call
+# Every process leases its own node id (0-1023) of the appointment id
+# generator in Redis (core.utils.snowflake) and renews it while in use.
+SNOWFLAKE_NODE_LEASE_TTL = 5 * 60  # seconds
+# Payment details wait encrypted in the cache this long for the payment task
+# (core.utils.payments.store_payment); pending payments are re-driven by
+# appointments.tasks.reap_stale_payments until then.
+PAYMENT_REFERENCE_TTL = 24 * 60 * 60  # seconds
+PAYMENT_STALE_AFTER = 15 * 60  # seconds a payment may stay Pending or Processing
+PAYMENT_LOCK_TIMEOUT = 5 * 60  # seconds, longer than the slowest payment run
+# How long a checkout hold keeps a slot reserved (core.utils.slot_holds)
+SLOT_HOLD_TTL = 10 * 60  # seconds
+SLOT_HOLD_MAX_PER_CLIENT = 3  # live holds per user or IP address
+# Most appointments a single basket booking may contain
+BASKET_MAX_LEGS = 10
+# Text search configuration of the stored search vectors (search.search), changing
+# it requires running the update_search_vectors command.
+SEARCH_TEXT_CONFIG = 'english'
+# In-memory fuzzy name index behind the similar terms endpoint (search.suggestions)
+SUGGESTION_LIMIT = 10
+SUGGESTION_SCORE_CUTOFF = 71  # 0-100, the old endpoint kept scores above 70
+SUGGESTION_CHANGE_LOG_SIZE = 1000  # name changes kept for incremental refreshes
+# Redis prefix index behind the autocomplete endpoint (search.autocomplete), changing
+# the prefix length requires running the rebuild_autocomplete command.
+AUTOCOMPLETE_MAX_PREFIX = 20  # characters
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+# Proximity search over the saloon H3 cell columns (core.utils.geo)
+NEARBY_DEFAULT_RADIUS_KM = 5
+NEARBY_MAX_RADIUS_KM = 100
+H3_MAX_K_RING = 10  # rings around the caller's cell before a coarser resolution is used
+# Rows per section of a search response page (search.search.SearchResults)
+SEARCH_SECTION_LIMIT = 20
+SEARCH_SECTION_MAX_LIMIT = 100
 
 CSRF_TRUSTED_ORIGINS = ['http://127.0.0.1:8000/', 'https://salon.moretechglobal.com','https://www.moredealsclub.com','https://moresalons.com','https://admin-panel-tau-drab.vercel.app','https://web-production-f5d1.up.railway.app','http://api.moresalons.com']
 EMAIL_BACKEND = config('EMAIL_BACKEND')
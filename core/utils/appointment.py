@@ -1,7 +1,7 @@
 from datetime import datetime,date
 from django.db import transaction
 from django.core.exceptions import ValidationError
-from appointments.models import Appointment, AppointmentSlot
+from appointments.models import Appointment, AppointmentSlot, appointment_time_range
 from staffs.models import Staff
 from services.models import Service, ServiceVariation
 from saloons.models import Saloon
@@ -9,20 +9,67 @@ from core.utils.response import PrepareResponse
 from datetime import datetime, timedelta
 from uuid import UUID
 
-def calculate_total_appointment_price(service_variations_uuids):
-
-    total_price = 0
+class BookingQuote:
+    """
+    The requested service variations of a booking, loaded once together with
+    their service and saloon currency, and everything derived from them.
+    Raises ServiceVariation.DoesNotExist when a variation is unknown, or not
+    part of `service` when one is given.
+    """
+
+    def __init__(self, service_variation_ids, service=None):
+        if not service_variation_ids:
+            raise ValueError("Service variations are required to calculate the appointment duration.")
+        variations = ServiceVariation.objects.filter(id__in=service_variation_ids).select_related('service__saloon__currency')
+        if service is not None:
+            variations = variations.filter(service=service)
+        by_id = {str(variation.id): variation for variation in variations}
+        missing = [str(variation_id) for variation_id in service_variation_ids if str(variation_id) not in by_id]
+        if missing:
+            raise ServiceVariation.DoesNotExist(f"ServiceVariation with UUID {missing[0]} does not exist")
+        self.variations = [by_id[str(variation_id)] for variation_id in service_variation_ids]
+
+    @classmethod
+    def from_variations(cls, variations):
+        """A quote over variations that are already loaded, without a query."""
+        quote = cls.__new__(cls)
+        quote.variations = list(variations)
+        return quote
+
+    @property
+    def total_duration(self):
+        return sum((variation.duration for variation in self.variations), timedelta())
+
+    @property
+    def total_price(self):
+        return sum(variation.discount_price if variation.discount_price else variation.price for variation in self.variations)
+
+    @property
+    def currency(self):
+        return self.variations[0].service.saloon.currency
+
+    def discount(self, coupon=None):
+        total_price = self.total_price
+        if not coupon:
+            return 0
+        if coupon.percentage_discount:
+            return (total_price * coupon.percentage_discount) / 100
+        if coupon.fixed_discount:
+            return min(coupon.fixed_discount, total_price)
+        return 0
+
+    def price(self, coupon=None):
+        return self.total_price - self.discount(coupon)
+
+    def end_time(self, date, start_time, buffer_time=timedelta(minutes=10)):
+        return (datetime.combine(date, start_time) + self.total_duration + (buffer_time or timedelta())).time()
 
-    for variation_uuid in service_variations_uuids:
-        try:
-            variation = ServiceVariation.objects.get(id=variation_uuid)
-            price = variation.discount_price if variation.discount_price else variation.price
-            total_price += price
-            print("Total Price:", total_price)
-        except ServiceVariation.DoesNotExist:
-            raise ValueError(f"ServiceVariation with UUID {variation_uuid} does not exist")
 
-    return total_price
+def calculate_total_appointment_price(service_variations_uuids):
+    try:
+        return BookingQuote(service_variations_uuids).total_price
+    except ServiceVariation.DoesNotExist as e:
+        raise ValueError(str(e))
 
 
 
@@ -40,19 +87,21 @@ def book_appointment(user, saloon_id, staff_id, service_id, slot_id, service_var
             message="Invalid saloon, staff, service, or slot."
         ).send(400)
 
-    service_variations = ServiceVariation.objects.filter(id__in=service_variation_ids, service=service)
-    if service_variations.count() != len(service_variation_ids):
-        raise ServiceVariation.DoesNotExist("One or more selected service variations are invalid.")
-    for sv in service_variations:
-        print("Service Variation:", sv.id)
-    
+    if slot.date is None or slot.end_time is None:
+        # Legacy template slots are not tied to a day and cannot be booked directly.
+        return PrepareResponse(
+            success=False,
+            data={},
+            message="The selected slot has no date, choose a dated slot."
+        ).send(400)
 
-    total_duration = timedelta()
-    for variation in service_variations:
-        total_duration += variation.duration
+    try:
+        quote = BookingQuote(service_variation_ids, service=service)
+    except ServiceVariation.DoesNotExist:
+        raise ServiceVariation.DoesNotExist("One or more selected service variations are invalid.")
 
     appointment_start_time = datetime.combine(slot.date, slot.start_time)
-    appointment_end_time = appointment_start_time + total_duration
+    appointment_end_time = appointment_start_time + quote.total_duration
 
     slot_end_datetime = datetime.combine(slot.date, slot.end_time)
     if appointment_end_time > slot_end_datetime:
@@ -64,9 +113,10 @@ def book_appointment(user, saloon_id, staff_id, service_id, slot_id, service_var
 
     overlapping_appointments = Appointment.objects.filter(
         staff=staff,
-        start_time__lt=appointment_end_time.time(),
-        end_time__gt=appointment_start_time.time()
-    )
+        time_range__overlap=appointment_time_range(
+            slot.date, appointment_start_time.time(), appointment_end_time.time(), saloon.timezone
+        )
+    ).exclude(status='Cancelled')
     if overlapping_appointments.exists():
         return PrepareResponse(
             success=False,
@@ -74,32 +124,16 @@ def book_appointment(user, saloon_id, staff_id, service_id, slot_id, service_var
             message="The staff is not available during the selected slot."
         ).send(400)
 
-    total_price = calculate_total_appointment_price(service_variation_ids)
+    total_price = quote.total_price
 
     return True
 
 
 def calculate_appointment_end_time(date, start_time, service_variations_ids, buffer_time=timedelta(minutes=10)):
-    total_duration = timedelta()
-    
-    if not service_variations_ids:
-        raise ValueError("Service variations are required to calculate the appointment duration.")
-    service_variations = ServiceVariation.objects.filter(id__in=service_variations_ids)
-    for variation in service_variations:
-        if hasattr(variation, 'duration'):
-            if isinstance(variation.duration, str):
-                hours, minutes, seconds = map(int, variation.duration.split(':'))
-                duration = timedelta(hours=hours, minutes=minutes, seconds=seconds)
-            else:
-                duration = variation.duration
-            if not isinstance(duration, timedelta):
-                raise ValueError(f"Service variation {variation.id} has an invalid duration type: {type(duration)}")
-            total_duration += duration
-        else:
-            raise ValueError(f"Service variation {variation.id} has no duration.")
-    start_datetime = datetime.combine(date, start_time)
-    end_datetime = start_datetime + total_duration + buffer_time
-    print("End Time:", end_datetime.time())
-    return end_datetime.time()
+    try:
+        quote = BookingQuote(service_variations_ids)
+    except ServiceVariation.DoesNotExist as e:
+        raise ValueError(str(e))
+    return quote.end_time(date, start_time, buffer_time)
 
  
\ No newline at end of file
@@ -0,0 +1,114 @@
+import math
+from datetime import datetime, timedelta
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from appointments.models import Appointment
+from openinghours.models import OpeningHour
+
+CELL_MINUTES = settings.AVAILABILITY_BITMAP_CELL_MINUTES
+CELLS_PER_DAY = 24 * 60 // CELL_MINUTES
+
+VERSION_KEY = "availability:version:{staff_id}"
+BITMAP_KEY = "availability:bitmap:{staff_id}:{version}:{date}"
+
+
+def _cell(value, round_up=False):
+    """Cell index of a wall clock time, the first cell after it when rounding up."""
+    cells = (value.hour * 60 + value.minute + value.second / 60) / CELL_MINUTES
+    return math.ceil(cells) if round_up else math.floor(cells)
+
+
+def _span(start_time, end_time):
+    """Cells touched by [start_time, end_time), clipped at midnight."""
+    end = _cell(end_time, round_up=True) if end_time > start_time else CELLS_PER_DAY
+    return _cell(start_time), end
+
+
+def build_bitmap(staff, date):
+    """
+    Free cells of a staff member on `date` in saloon local time. A cell is
+    free only when the whole of it is inside working hours and outside
+    breaks, bookings and the saloon closing hours.
+    """
+    free = np.zeros(CELLS_PER_DAY, dtype=bool)
+    if staff.is_holiday:
+        return free
+
+    day_name = date.strftime("%A")
+    working_day = staff.working_days.filter(day_of_week=day_name).prefetch_related('break_times').first()
+    if not working_day or not working_day.start_time or not working_day.end_time:
+        return free
+
+    # Partial cells at the edges of the working window are not usable.
+    window_end = _cell(working_day.end_time) if working_day.end_time > working_day.start_time else CELLS_PER_DAY
+    free[_cell(working_day.start_time, round_up=True):window_end] = True
+
+    opening_hour = OpeningHour.objects.filter(saloon_id=staff.saloon_id, day_of_week=day_name).first()
+    if opening_hour is not None:
+        if not opening_hour.is_open or not opening_hour.start_time or not opening_hour.end_time:
+            free[:] = False
+        else:
+            free[:_cell(opening_hour.start_time, round_up=True)] = False
+            if opening_hour.end_time > opening_hour.start_time:
+                free[_cell(opening_hour.end_time):] = False
+
+    blocked = [(break_time.break_start, break_time.break_end) for break_time in working_day.break_times.all()]
+    blocked += Appointment.objects.filter(
+        staff=staff,
+        date=date
+    ).exclude(status='Cancelled').values_list('start_time', 'end_time')
+    for start_time, end_time in blocked:
+        start, end = _span(start_time, end_time)
+        free[start:end] = False
+    return free
+
+
+def _version(staff_id):
+    return cache.get_or_set(VERSION_KEY.format(staff_id=staff_id), 1, None)
+
+
+def _bitmap_key(staff_id, date):
+    return BITMAP_KEY.format(staff_id=staff_id, version=_version(staff_id), date=date.isoformat())
+
+
+def rebuild_bitmap(staff, date):
+    free = build_bitmap(staff, date)
+    cache.set(_bitmap_key(staff.pk, date), np.packbits(free).tobytes(), settings.AVAILABILITY_BITMAP_TTL)
+    return free
+
+
+def get_bitmap(staff, date):
+    packed = cache.get(_bitmap_key(staff.pk, date))
+    if packed is None:
+        return rebuild_bitmap(staff, date)
+    return np.unpackbits(np.frombuffer(packed, dtype=np.uint8))[:CELLS_PER_DAY].astype(bool)
+
+
+def can_start(staff, date, start_time, duration):
+    """Whether a service of `duration` can start at `start_time` on `date`."""
+    end = datetime.combine(date, start_time) + duration
+    if end.date() != date or duration <= timedelta():
+        return False
+    first, last = _span(start_time, end.time())
+    return bool(get_bitmap(staff, date)[first:last].all())
+
+
+def invalidate_staff(staff_id):
+    """
+    Drop every bitmap of a staff member after their working hours change.
+    The staffs signals call it on save; queryset updates of working days,
+    breaks or opening hours send no signal and have to call it themselves.
+    """
+    key = VERSION_KEY.format(staff_id=staff_id)
+    cache.add(key, 1, None)
+    cache.incr(key)
+
+
+__all__ = [
+    "build_bitmap",
+    "can_start",
+    "get_bitmap",
+    "invalidate_staff",
+    "rebuild_bitmap",
+]
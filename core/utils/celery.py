@@ -18,4 +18,13 @@ app.conf.beat_schedule = {
         'schedule': timedelta(hours=1),  # Execute every hour
         'args': ('recipient@example.com', 'Reminder', 'Your appointment is coming up.'),
     },
+    'materialize-appointment-slots': {
+        'task': 'appointments.tasks.materialize_appointment_slots',
+        'schedule': timedelta(hours=1),
+        'kwargs': {'incremental': True},
+    },
+    'reap-stale-payments': {
+        'task': 'appointments.tasks.reap_stale_payments',
+        'schedule': timedelta(minutes=5),
+    },
 }
\ No newline at end of file
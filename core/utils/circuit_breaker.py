@@ -0,0 +1,102 @@
+import logging
+import time
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceUnavailable(Exception):
+    """The dependency failed, timed out, or its circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Failure counting circuit breaker shared by all workers through the cache.
+
+    After `failure_threshold` failures within `failure_window` seconds the
+    circuit opens and calls fail fast for `recovery_timeout` seconds. It is
+    then half-open: one call at a time is let through as a probe, the others
+    still fail fast. A successful probe closes the circuit, a failed one
+    re-opens it for another `recovery_timeout`.
+    """
+
+    def __init__(self, name, failure_threshold=None, failure_window=None, recovery_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        self.failure_window = failure_window or settings.CIRCUIT_BREAKER_FAILURE_WINDOW
+        self.recovery_timeout = recovery_timeout or settings.CIRCUIT_BREAKER_RECOVERY_TIMEOUT
+        self.failures_key = f"circuit:{name}:failures"
+        self.open_until_key = f"circuit:{name}:open_until"
+        self.probe_key = f"circuit:{name}:probe"
+
+    def state(self):
+        """'closed', 'open' or 'half-open'."""
+        # open_until outlives the recovery period, it is only removed by a
+        # success, so a tripped circuit stays tripped until a probe passes.
+        open_until = cache.get(self.open_until_key)
+        if open_until is None:
+            return 'closed'
+        return 'open' if open_until > time.time() else 'half-open'
+
+    def is_open(self):
+        return self.state() == 'open'
+
+    def allow_request(self):
+        state = self.state()
+        if state == 'half-open':
+            # Only the worker that claims the probe goes through.
+            return cache.add(self.probe_key, 1, self.recovery_timeout)
+        return state == 'closed'
+
+    def open(self):
+        cache.set(self.open_until_key, time.time() + self.recovery_timeout, None)
+        cache.delete(self.probe_key)
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.open_until_key, self.probe_key])
+
+    def record_failure(self):
+        if self.state() != 'closed':
+            logger.warning("Circuit %s re-opened, the probe failed", self.name)
+            self.open()
+            return
+        cache.add(self.failures_key, 0, self.failure_window)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            failures = 1
+        if failures >= self.failure_threshold:
+            logger.warning("Circuit %s opened after %s failures", self.name, failures)
+            self.open()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run `func` (an http_client call) through the breaker. Connection
+        errors, timeouts and 5xx responses count as failures and are raised
+        as `ServiceUnavailable`; any other response is returned as is.
+        """
+        if not self.allow_request():
+            raise ServiceUnavailable(f"{self.name} circuit is open")
+        try:
+            response = func(*args, **kwargs)
+        except requests.RequestException as e:
+            self.record_failure()
+            raise ServiceUnavailable(f"{self.name} request failed: {e}")
+        if response.status_code >= 500:
+            self.record_failure()
+            raise ServiceUnavailable(f"{self.name} responded with {response.status_code}")
+        self.record_success()
+        return response
+
+
+# moretrek.com serves token verification, user details and permissions.
+sso_breaker = CircuitBreaker('sso')
+
+
+__all__ = [
+    "CircuitBreaker",
+    "ServiceUnavailable",
+    "sso_breaker",
+]
@@ -1,74 +1,188 @@
-from datetime import datetime, timedelta
-from django.utils import timezone
+import logging
+from datetime import timedelta
+from django.db.models import Prefetch
 from appointments.models import Appointment
 from services.models import ServiceVariation
-from core.utils.dateconvertor import convert_to_utc, convert_to_timezone, check_slot_overlap
-
-def fetch_available_slots(saloon, staff, date, service_variations):
-    saloon_timezone = saloon.timezone
-    print(f"DEBUG: Saloon Timezone: {saloon_timezone}")
-
-    # Fetch booked appointments as (start_time, end_time)
-    booked_appointments = Appointment.objects.filter(
-        staff=staff,
-        date=date
-    ).values_list('start_time', 'end_time')
-
-    print(f"DEBUG: Booked Appointments: {list(booked_appointments)}")
-
-    # Calculate total service duration
+from openinghours.models import OpeningHour
+from staffs.models import Staff, WorkingDay
+from core.utils.slot_engine import compute_day_slots
+from core.utils.slot_holds import held_intervals
+
+logger = logging.getLogger(__name__)
+
+
+def get_total_duration(service_variations):
+    """Total duration of the requested variations in one query, None if any is unknown."""
+    durations = {
+        str(variation_id): duration
+        for variation_id, duration in ServiceVariation.objects.filter(
+            id__in=service_variations
+        ).values_list('id', 'duration')
+    }
     total_duration = timedelta()
     for variation_id in service_variations:
-        try:
-            variation = ServiceVariation.objects.get(id=variation_id)
-            total_duration += variation.duration
-            print(f"DEBUG: Service Variation {variation.name}, Duration: {variation.duration}")
-        except ServiceVariation.DoesNotExist:
-            print(f"DEBUG: Service Variation {variation_id} does not exist.")
-            return []
-
-    print(f"DEBUG: Total Service Duration: {total_duration}")
-
-    # Fetch staff working hours for the day
-    working_day = staff.working_days.filter(day_of_week=date.strftime("%A")).first()
-    if not working_day:
-        print(f"DEBUG: No working day found for {date.strftime('%A')}")
+        duration = durations.get(str(variation_id))
+        if duration is None:
+            logger.debug("Service variation %s does not exist", variation_id)
+            return None
+        total_duration += duration
+    return total_duration
+
+
+def fetch_available_slots(saloon, staff, date, service_variations):
+    if staff.is_holiday:
         return []
 
-    if not working_day.start_time or not working_day.end_time:
-        print(f"DEBUG: Working day found but missing start or end time. Start: {working_day.start_time}, End: {working_day.end_time}")
+    total_duration = get_total_duration(service_variations)
+    if total_duration is None:
         return []
 
-    print(f"DEBUG: Working Hours: Start - {working_day.start_time}, End - {working_day.end_time}")
+    day_name = date.strftime("%A")
+    working_day = staff.working_days.filter(day_of_week=day_name).prefetch_related('break_times').first()
+    if not working_day:
+        logger.debug("Staff %s has no working day on %s", staff.pk, day_name)
+        return []
 
-    # Convert working hours to UTC
-    working_start_utc = convert_to_utc(
-        datetime.combine(date, working_day.start_time), saloon_timezone
-    )
-    working_end_utc = convert_to_utc(
-        datetime.combine(date, working_day.end_time), saloon_timezone
-    )
+    opening_hour = OpeningHour.objects.filter(saloon=saloon, day_of_week=day_name).first()
 
-    print(f"DEBUG: Working Hours in UTC: Start - {working_start_utc}, End - {working_end_utc}")
+    # Fetch booked appointments as (start_time, end_time), live checkout holds block too
+    booked_appointments = list(Appointment.objects.filter(
+        staff=staff,
+        date=date
+    ).exclude(status='Cancelled').values_list('start_time', 'end_time'))
+    booked_appointments += held_intervals([staff.pk], [date]).get((str(staff.pk), date), [])
 
-    slots = []
-    current_start = working_start_utc
+    breaks = [(break_time.break_start, break_time.break_end) for break_time in working_day.break_times.all()]
     buffer_time = staff.buffer_time or timedelta(minutes=10)
 
-    print(f"DEBUG: Buffer Time: {buffer_time}")
+    return compute_day_slots(
+        date=date,
+        timezone=saloon.timezone,
+        working_day=working_day,
+        duration=total_duration,
+        buffer_time=buffer_time,
+        bookings=booked_appointments,
+        breaks=breaks,
+        opening_hour=opening_hour,
+    )
 
-    while current_start + total_duration + buffer_time <= working_end_utc:
-        current_end = current_start + total_duration  # Slot end is service duration from the start
 
-        # Check if the slot overlaps with booked appointments
-        if not check_slot_overlap(current_start, current_end, booked_appointments, date, saloon_timezone):
-            slots.append({
-                "start_time": convert_to_timezone(current_start, saloon_timezone).strftime("%H:%M"),
-                "end_time": convert_to_timezone(current_end, saloon_timezone).strftime("%H:%M"),
-            })
+def fetch_available_slots_range(saloon, staff, start_date, end_date, service_variations, summary=False):
+    """
+    Available slots of a staff member for every day from `start_date` to
+    `end_date` inclusive, keyed by ISO date. All rows for the range are
+    loaded in a constant number of queries. With `summary` each day only
+    says whether any slot is free.
+    """
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    if staff.is_holiday:
+        return {day.isoformat(): False if summary else [] for day in days}
+
+    total_duration = get_total_duration(service_variations)
+    if total_duration is None:
+        return {day.isoformat(): False if summary else [] for day in days}
+
+    working_days = {
+        working_day.day_of_week: working_day
+        for working_day in staff.working_days.prefetch_related('break_times')
+    }
+    opening_hours = {
+        opening_hour.day_of_week: opening_hour
+        for opening_hour in OpeningHour.objects.filter(saloon=saloon)
+    }
+    bookings = {}
+    for booked_date, start_time, end_time in Appointment.objects.filter(
+        staff=staff,
+        date__range=(start_date, end_date)
+    ).exclude(status='Cancelled').values_list('date', 'start_time', 'end_time'):
+        bookings.setdefault(booked_date, []).append((start_time, end_time))
+    for (_, held_date), holds in held_intervals([staff.pk], days).items():
+        bookings.setdefault(held_date, []).extend(holds)
 
-        # Increment start by service duration + buffer time to avoid overlap
-        current_start = current_end + buffer_time
+    buffer_time = staff.buffer_time or timedelta(minutes=10)
+    availability = {}
+    for day in days:
+        day_name = day.strftime("%A")
+        working_day = working_days.get(day_name)
+        breaks = []
+        if working_day:
+            breaks = [(break_time.break_start, break_time.break_end) for break_time in working_day.break_times.all()]
+        slots = compute_day_slots(
+            date=day,
+            timezone=saloon.timezone,
+            working_day=working_day,
+            duration=total_duration,
+            buffer_time=buffer_time,
+            bookings=bookings.get(day, ()),
+            breaks=breaks,
+            opening_hour=opening_hours.get(day_name),
+            limit=1 if summary else None,
+        )
+        availability[day.isoformat()] = bool(slots) if summary else slots
+    return availability
+
+
+def fetch_saloon_available_slots(saloon, date, service_variations):
+    """
+    Merged available slots of every staff member of the saloon who offers all
+    the services of the requested variations, each slot listing the staff who
+    can take it. Staff, working days, breaks and bookings are batch-loaded.
+    """
+    variations = list(
+        ServiceVariation.objects.filter(id__in=service_variations, service__saloon=saloon)
+        .values_list('id', 'duration', 'service_id')
+    )
+    durations = {str(variation_id): duration for variation_id, duration, _ in variations}
+    if not durations or any(str(variation_id) not in durations for variation_id in service_variations):
+        return []
+    total_duration = sum((durations[str(variation_id)] for variation_id in service_variations), timedelta())
+
+    day_name = date.strftime("%A")
+    staff_members = Staff.objects.filter(saloon=saloon, is_holiday=False)
+    for service_id in {service_id for _, _, service_id in variations}:
+        staff_members = staff_members.filter(services=service_id)
+    staff_members = list(staff_members.distinct().prefetch_related(
+        Prefetch(
+            'working_days',
+            queryset=WorkingDay.objects.filter(day_of_week=day_name).prefetch_related('break_times'),
+        )
+    ))
+    if not staff_members:
+        return []
 
-    print(f"DEBUG: Calculated Slots: {slots}")
-    return slots
\ No newline at end of file
+    opening_hour = OpeningHour.objects.filter(saloon=saloon, day_of_week=day_name).first()
+    bookings = {}
+    for staff_id, start_time, end_time in Appointment.objects.filter(
+        staff__in=staff_members,
+        date=date
+    ).exclude(status='Cancelled').values_list('staff_id', 'start_time', 'end_time'):
+        bookings.setdefault(str(staff_id), []).append((start_time, end_time))
+    for (staff_id, _), holds in held_intervals([staff.pk for staff in staff_members], [date]).items():
+        bookings.setdefault(staff_id, []).extend(holds)
+
+    merged = {}
+    for staff in staff_members:
+        working_days = list(staff.working_days.all())
+        if not working_days:
+            continue
+        working_day = working_days[0]
+        breaks = [(break_time.break_start, break_time.break_end) for break_time in working_day.break_times.all()]
+        slots = compute_day_slots(
+            date=date,
+            timezone=saloon.timezone,
+            working_day=working_day,
+            duration=total_duration,
+            buffer_time=staff.buffer_time or timedelta(minutes=10),
+            bookings=bookings.get(str(staff.id), ()),
+            breaks=breaks,
+            opening_hour=opening_hour,
+        )
+        for slot in slots:
+            merged.setdefault((slot["start_time"], slot["end_time"]), []).append(
+                {"id": str(staff.id), "name": staff.name}
+            )
+
+    return [
+        {"start_time": start_time, "end_time": end_time, "staff": staff}
+        for (start_time, end_time), staff in sorted(merged.items())
+    ]
@@ -0,0 +1,92 @@
+import math
+import h3
+import numpy as np
+from django.conf import settings
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Saloon column holding the H3 cell of the saloon at each resolution, coarse to fine.
+H3_FIELDS = {
+    5: 'h3_r5',
+    7: 'h3_r7',
+    9: 'h3_r9',
+}
+
+
+def h3_cells(lat, lng):
+    """{field: cell} of a location at every indexed resolution, all None without coordinates."""
+    if lat is None or lng is None:
+        return {field: None for field in H3_FIELDS.values()}
+    return {field: h3.latlng_to_cell(lat, lng, resolution) for resolution, field in H3_FIELDS.items()}
+
+
+def ring_size(resolution, radius_km):
+    """Grid distance k whose disk around a cell covers every point within radius_km."""
+    # Neighbouring cell centres are about sqrt(3) edge lengths apart, but cell
+    # sizes vary over the globe, so count one average edge length per ring and
+    # add a ring for a caller sitting at the edge of its own cell.
+    spacing = h3.average_hexagon_edge_length(resolution, unit='km')
+    return math.ceil(radius_km / spacing) + 1
+
+
+def covering_cells(lat, lng, radius_km):
+    """
+    (field, cells) of the finest indexed resolution whose k-ring around the
+    location covers radius_km within H3_MAX_K_RING rings, the coarsest
+    resolution with as many rings as needed otherwise.
+    """
+    for resolution, field in sorted(H3_FIELDS.items(), reverse=True):
+        k = ring_size(resolution, radius_km)
+        if k <= settings.H3_MAX_K_RING:
+            break
+    return field, h3.grid_disk(h3.latlng_to_cell(lat, lng, resolution), k)
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distances in km from one point to arrays of points."""
+    lat, lng = np.radians(lat), np.radians(lng)
+    lats, lngs = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lngs, dtype=float))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def nearby(queryset, lat, lng, radius_km):
+    """
+    [(pk, distance_km)] of the rows of a Saloon queryset within radius_km,
+    nearest first. Candidates come from the H3 cell index, only they are
+    loaded and their exact distances computed in one vectorized pass.
+    """
+    field, cells = covering_cells(lat, lng, radius_km)
+    candidates = list(queryset.filter(**{f"{field}__in": cells}).values_list('pk', 'lat', 'lng'))
+    if not candidates:
+        return []
+    pks, lats, lngs = zip(*candidates)
+    distances = haversine_km(lat, lng, lats, lngs)
+    order = np.argsort(distances, kind='stable')
+    return [(pks[index], float(distances[index])) for index in order if distances[index] <= radius_km]
+
+
+def parse_location(lat, lng, radius=None):
+    """
+    Validated (lat, lng, radius_km) from request parameters. The radius
+    defaults to NEARBY_DEFAULT_RADIUS_KM and is capped at NEARBY_MAX_RADIUS_KM.
+    Raises ValueError on invalid values.
+    """
+    lat, lng = float(lat), float(lng)
+    # NaN fails every comparison, it has to be rejected explicitly.
+    if not (math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat must be within -90..90 and lng within -180..180.")
+    radius_km = float(radius) if radius not in (None, '') else settings.NEARBY_DEFAULT_RADIUS_KM
+    if not math.isfinite(radius_km) or radius_km <= 0:
+        raise ValueError("radius must be a positive number.")
+    return lat, lng, min(radius_km, settings.NEARBY_MAX_RADIUS_KM)
+
+
+__all__ = [
+    "H3_FIELDS",
+    "covering_cells",
+    "h3_cells",
+    "haversine_km",
+    "nearby",
+    "parse_location",
+]
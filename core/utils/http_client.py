@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Samples kept per endpoint for the latency percentiles.
+METRIC_SAMPLES = 1000
+
+_sessions = {}
+_metrics = {}
+_lock = threading.Lock()
+
+
+def _build_session():
+    # Connection errors are retried for every method since nothing reached the
+    # server, reads and 5xx responses only for idempotent methods, so payment
+    # POSTs are never replayed.
+    retry = Retry(
+        total=settings.HTTP_CLIENT_MAX_RETRIES,
+        backoff_factor=settings.HTTP_CLIENT_BACKOFF_FACTOR,
+        backoff_jitter=settings.HTTP_CLIENT_BACKOFF_JITTER,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.HTTP_CLIENT_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(url):
+    """One keep-alive session per scheme and host, shared by the whole process."""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _build_session()
+    return session
+
+
+def _record(endpoint, elapsed, status_code=None):
+    with _lock:
+        metric = _metrics.get(endpoint)
+        if metric is None:
+            metric = _metrics[endpoint] = {
+                'count': 0,
+                'errors': 0,
+                'samples': deque(maxlen=METRIC_SAMPLES),
+            }
+        metric['count'] += 1
+        if status_code is None or status_code >= 500:
+            metric['errors'] += 1
+        metric['samples'].append(elapsed)
+    logger.info("%s status=%s elapsed_ms=%.1f", endpoint, status_code, elapsed * 1000)
+
+
+def request(method, url, endpoint=None, timeout=None, **kwargs):
+    if endpoint is None:
+        parts = urlsplit(url)
+        endpoint = f"{method.upper()} {parts.netloc}{parts.path}"
+    if timeout is None:
+        timeout = (settings.HTTP_CLIENT_CONNECT_TIMEOUT, settings.HTTP_CLIENT_READ_TIMEOUT)
+
+    start = time.perf_counter()
+    try:
+        response = get_session(url).request(method, url, timeout=timeout, **kwargs)
+    except requests.RequestException:
+        _record(endpoint, time.perf_counter() - start)
+        raise
+    _record(endpoint, time.perf_counter() - start, response.status_code)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def _percentile(samples, percent):
+    index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def get_metrics():
+    """Latency summary per endpoint for this worker process, in milliseconds."""
+    with _lock:
+        snapshot = {endpoint: (metric['count'], metric['errors'], sorted(metric['samples']))
+                    for endpoint, metric in _metrics.items()}
+
+    metrics = {}
+    for endpoint, (count, errors, samples) in snapshot.items():
+        if not samples:
+            continue
+        metrics[endpoint] = {
+            'count': count,
+            'errors': errors,
+            'p50_ms': round(_percentile(samples, 50) * 1000, 1),
+            'p95_ms': round(_percentile(samples, 95) * 1000, 1),
+            'p99_ms': round(_percentile(samples, 99) * 1000, 1),
+            'max_ms': round(samples[-1] * 1000, 1),
+        }
+    return metrics
+
+
+__all__ = [
+    "request",
+    "get",
+    "post",
+    "get_metrics",
+]
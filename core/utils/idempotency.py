@@ -0,0 +1,87 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from rest_framework.throttling import BaseThrottle
+from core.utils.moredealstoken import hash_token
+from core.utils.response import RESPONSE_STANDARD
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+RESPONSE_KEY = "idempotency:{scope}:{key}"
+LOCK_KEY = "idempotency:{scope}:{key}:lock"
+
+
+def _error_response(message, status):
+    response = RESPONSE_STANDARD.copy()
+    response.update(success=False, message=message, errors={'idempotency_key': [message]})
+    return JsonResponse(response, status=status)
+
+
+class IdempotentPostMixin(object):
+    """
+    Honour an `Idempotency-Key` header on POST. The first response for a key
+    is stored with a fingerprint of the request and replayed for retries
+    without running the view again. Keys are scoped to the caller's token,
+    or to the client address for anonymous callers, like slot holds.
+    Server errors are not stored so that they can be retried.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if request.method != 'POST' or not key:
+            return super().dispatch(request, *args, **kwargs)
+
+        scope = self.idempotency_scope(request)
+        key = hashlib.sha256(key.encode()).hexdigest()
+        response_key = RESPONSE_KEY.format(scope=scope, key=key)
+        fingerprint = hashlib.sha256(
+            request.method.encode() + request.get_full_path().encode() + request.body
+        ).hexdigest()
+
+        stored = cache.get(response_key)
+        if stored is not None:
+            return self.replay(stored, fingerprint)
+
+        lock_key = LOCK_KEY.format(scope=scope, key=key)
+        if not cache.add(lock_key, 1, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return _error_response("A request with this Idempotency-Key is still being processed.", 409)
+        try:
+            # The first request may have finished between the lookup and the lock.
+            stored = cache.get(response_key)
+            if stored is not None:
+                return self.replay(stored, fingerprint)
+
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                response.render()
+            if response.status_code < 500:
+                cache.set(response_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'content': response.content,
+                    'content_type': response.get('Content-Type'),
+                }, settings.IDEMPOTENCY_KEY_TTL)
+            return response
+        finally:
+            cache.delete(lock_key)
+
+    def idempotency_scope(self, request):
+        authorization = request.headers.get('Authorization')
+        if authorization:
+            return hash_token(authorization)
+        # Two guests may well pick the same key, never replay one to the other.
+        return 'anonymous:' + hashlib.sha256(BaseThrottle().get_ident(request).encode()).hexdigest()
+
+    def replay(self, stored, fingerprint):
+        if stored['fingerprint'] != fingerprint:
+            return _error_response("Idempotency-Key was already used with a different request.", 422)
+        response = HttpResponse(stored['content'], status=stored['status'], content_type=stored['content_type'])
+        response[REPLAYED_HEADER] = 'true'
+        return response
+
+
+__all__ = [
+    "IdempotentPostMixin",
+]
@@ -0,0 +1,122 @@
+import time
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from core.utils.moredealstoken import hash_token
+from core.utils.sealing import seal, unseal
+
+IDENTITY_KEY = "sso:identity:{token_hash}"
+# Longer lived copy, only served while the SSO service is unavailable.
+STALE_IDENTITY_KEY = "sso:identity:stale:{token_hash}"
+# Holds the encrypted token while its refresh is pending, the task only gets the hash.
+REFRESH_KEY = "sso:identity:refreshing:{token_hash}"
+# Token hashes cached for a local user, so that they can all be dropped.
+USER_INDEX_KEY = "sso:identity:user:{user_id}"
+# Only the most recent tokens of a user are tracked for invalidation.
+MAX_TOKENS_PER_USER = 20
+
+
+def get_token_expiry(token):
+    """
+    Read the `exp` claim without verifying the signature. Only used to bound
+    the cache lifetime, the token itself has already been verified.
+    """
+    try:
+        claims = jwt.decode(token, options={'verify_signature': False})
+    except jwt.InvalidTokenError:
+        return None
+    return claims.get('exp')
+
+
+def get_identity_ttl(token, ttl=None):
+    ttl = ttl or settings.SSO_IDENTITY_CACHE_TTL
+    expires_at = get_token_expiry(token)
+    if expires_at:
+        ttl = min(ttl, int(expires_at - time.time()))
+    return ttl
+
+
+def get_cached_identity(token):
+    return cache.get(IDENTITY_KEY.format(token_hash=hash_token(token)))
+
+
+def get_stale_identity(token):
+    return cache.get(STALE_IDENTITY_KEY.format(token_hash=hash_token(token)))
+
+
+def cache_identity(token, sso_user_id, user_id):
+    ttl = get_identity_ttl(token)
+    if ttl <= 0:
+        return None
+
+    token_hash = hash_token(token)
+    identity = {
+        'user_id': str(user_id),
+        'sso_user_id': str(sso_user_id),
+    }
+    cache.set(IDENTITY_KEY.format(token_hash=token_hash), identity, ttl)
+    cache.set(
+        STALE_IDENTITY_KEY.format(token_hash=token_hash),
+        identity,
+        get_identity_ttl(token, settings.SSO_STALE_GRACE_PERIOD)
+    )
+
+    index_key = USER_INDEX_KEY.format(user_id=user_id)
+    token_hashes = cache.get(index_key, [])
+    if token_hash not in token_hashes:
+        token_hashes = (token_hashes + [token_hash])[-MAX_TOKENS_PER_USER:]
+        cache.set(index_key, token_hashes, settings.SSO_IDENTITY_CACHE_TTL)
+    return identity
+
+
+def invalidate_token(token):
+    token_hash = hash_token(token)
+    cache.delete_many([
+        IDENTITY_KEY.format(token_hash=token_hash),
+        STALE_IDENTITY_KEY.format(token_hash=token_hash),
+    ])
+
+
+def get_user_token_hashes(user_id):
+    """Hashes of the most recent tokens cached for a local user."""
+    return cache.get(USER_INDEX_KEY.format(user_id=user_id), [])
+
+
+def invalidate_user(user_id):
+    """Drop every cached identity of a local user, e.g. after logout or a profile change."""
+    index_key = USER_INDEX_KEY.format(user_id=user_id)
+    token_hashes = get_user_token_hashes(user_id)
+    keys = [index_key]
+    for token_hash in token_hashes:
+        keys.append(IDENTITY_KEY.format(token_hash=token_hash))
+        keys.append(STALE_IDENTITY_KEY.format(token_hash=token_hash))
+    cache.delete_many(keys)
+
+
+def schedule_identity_refresh(token):
+    """Queue a background revalidation of a stale identity, at most one per token."""
+    from users.tasks import refresh_sso_identity
+
+    token_hash = hash_token(token)
+    if cache.add(REFRESH_KEY.format(token_hash=token_hash), seal(token), settings.SSO_REFRESH_TTL):
+        refresh_sso_identity.delay(token_hash)
+
+
+def get_refresh_token(token_hash):
+    """Token of a pending refresh, None once the refresh was cleared or expired."""
+    return unseal(cache.get(REFRESH_KEY.format(token_hash=token_hash)))
+
+
+def clear_identity_refresh(token_hash):
+    cache.delete(REFRESH_KEY.format(token_hash=token_hash))
+
+
+__all__ = [
+    "get_cached_identity",
+    "get_stale_identity",
+    "cache_identity",
+    "invalidate_token",
+    "invalidate_user",
+    "get_user_token_hashes",
+    "schedule_identity_refresh",
+]
@@ -0,0 +1,80 @@
+import time
+import jwt
+from jwt import PyJWKClient
+from jwt.exceptions import PyJWKClientConnectionError, PyJWKClientError
+from django.conf import settings
+
+
+class SigningKeyUnavailable(Exception):
+    """Raised when no locally known key can verify the token."""
+
+
+_jwk_client = None
+# PyJWKClient does not remember failed fetches, the key endpoint is skipped
+# until then (monotonic clock) instead of being retried on every request.
+_jwks_unavailable_until = 0
+
+
+def get_jwk_client():
+    """
+    Return the process wide JWKS client. Keys are cached in memory and the
+    key set is re-fetched from the SSO service every SSO_JWKS_REFRESH_INTERVAL
+    seconds, or straight away when a token carries an unknown `kid`.
+    """
+    global _jwk_client
+    if _jwk_client is None:
+        _jwk_client = PyJWKClient(
+            settings.SSO_JWKS_URL,
+            cache_keys=True,
+            lifespan=settings.SSO_JWKS_REFRESH_INTERVAL,
+            timeout=settings.SSO_JWKS_TIMEOUT,
+        )
+    return _jwk_client
+
+
+def get_signing_key(token):
+    global _jwks_unavailable_until
+    if settings.SSO_JWT_PUBLIC_KEY:
+        return settings.SSO_JWT_PUBLIC_KEY
+    if not settings.SSO_JWKS_URL:
+        raise SigningKeyUnavailable("No SSO signing key is configured.")
+    if time.monotonic() < _jwks_unavailable_until:
+        raise SigningKeyUnavailable("The SSO key endpoint is unavailable.")
+    try:
+        return get_jwk_client().get_signing_key_from_jwt(token).key
+    except (PyJWKClientConnectionError, ValueError) as e:
+        # Unreachable, or not serving a key set at all.
+        _jwks_unavailable_until = time.monotonic() + settings.SSO_JWKS_FAILURE_BACKOFF
+        raise SigningKeyUnavailable(str(e))
+    except PyJWKClientError as e:
+        # Unknown kid after a refresh.
+        raise SigningKeyUnavailable(str(e))
+
+
+def decode_token(token):
+    """
+    Verify the token signature and expiry locally and return its claims.
+
+    Raises `SigningKeyUnavailable` when the token has to be verified by the
+    SSO service instead, and `jwt.InvalidTokenError` when it is invalid.
+    """
+    key = get_signing_key(token)
+    options = {'require': ['exp']}
+    if not settings.SSO_JWT_AUDIENCE:
+        # PyJWT rejects any token carrying `aud` when no audience is expected.
+        options['verify_aud'] = False
+    return jwt.decode(
+        token,
+        key,
+        algorithms=settings.SSO_JWT_ALGORITHMS,
+        audience=settings.SSO_JWT_AUDIENCE or None,
+        issuer=settings.SSO_JWT_ISSUER or None,
+        leeway=settings.SSO_JWT_LEEWAY,
+        options=options,
+    )
+
+
+__all__ = [
+    "SigningKeyUnavailable",
+    "decode_token",
+]
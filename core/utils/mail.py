@@ -1,42 +1,29 @@
-from django.core.mail import send_mail
+from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from staffs.models import Staff
 
-def send_confirmation_email(appointment):
-    # Define the context for the email template
-    context = {
-        'fullname': appointment.fullname,
-        'appointment_id': appointment.id,
-        'saloon_name': appointment.saloon.name,
-        'service_name': appointment.service.name,
-        'staff_name': appointment.staff.name,
-        'appointment_date': appointment.date,
-        'start_time': appointment.start_time,
-        'end_time': appointment.end_time,
-        'total_price': appointment.total_price,
-        'note': appointment.note,
-    }
+APPOINTMENT_EMAIL_TEMPLATES = {
+    'customer': 'appointment_confirmation_email.html',
+    'staff': 'staff_appointment_confirmation_email.html',
+    'salon': 'salon_appointment_confirmation_email.html',
+}
 
-    # Render the HTML email template with the context
-    html_message = render_to_string('appointment_confirmation_email.html', context)
-    plain_message = strip_tags(html_message)  # Convert HTML to plain text
 
-    subject = 'Appointment Booking Confirmation'
-    from_email = settings.DEFAULT_FROM_EMAIL
-    to_email = appointment.email
+def appointment_email_recipient(appointment, kind):
+    if kind == 'staff':
+        return appointment.staff.email
+    if kind == 'salon':
+        return appointment.saloon.email
+    return appointment.email
 
-    # Send the email
-    send_mail(
-        subject,
-        plain_message,
-        from_email,
-        [to_email],
-        html_message=html_message
-    )
 
-def staff_confirmation_email(appointment):
+def build_appointment_email(appointment, kind, connection=None):
+    """
+    Render one of the appointment confirmation emails ('customer', 'staff'
+    or 'salon') without sending it, so several can share one connection.
+    """
     context = {
         'fullname': appointment.fullname,
         'appointment_id': appointment.id,
@@ -49,50 +36,28 @@ def staff_confirmation_email(appointment):
         'total_price': appointment.total_price,
         'note': appointment.note,
     }
-    html_message = render_to_string('staff_appointment_confirmation_email.html', context)
+    html_message = render_to_string(APPOINTMENT_EMAIL_TEMPLATES[kind], context)
     plain_message = strip_tags(html_message)  # Convert HTML to plain text
 
-    subject = 'Appointment Booking Confirmation'
-    from_email = settings.DEFAULT_FROM_EMAIL
-    to_email = appointment.staff.email
-
-    # Send the email
-    send_mail(
-        subject,
+    message = EmailMultiAlternatives(
+        'Appointment Booking Confirmation',
         plain_message,
-        from_email,
-        [to_email],
-        html_message=html_message
+        settings.DEFAULT_FROM_EMAIL,
+        [appointment_email_recipient(appointment, kind)],
+        connection=connection,
     )
+    message.attach_alternative(html_message, 'text/html')
+    return message
 
-def salon_confirmation_email(appointment):
-    context = {
-        'fullname': appointment.fullname,
-        'appointment_id': appointment.id,
-        'saloon_name': appointment.saloon.name,
-        'service_name': appointment.service.name,
-        'staff_name': appointment.staff.name,
-        'appointment_date': appointment.date,
-        'start_time': appointment.start_time,
-        'end_time': appointment.end_time,
-        'total_price': appointment.total_price,
-        'note': appointment.note,
-    }
-    html_message = render_to_string('salon_appointment_confirmation_email.html', context)
-    plain_message = strip_tags(html_message)  # Convert HTML to plain text
 
-    subject = 'Appointment Booking Confirmation'
-    from_email = settings.DEFAULT_FROM_EMAIL
-    to_email = appointment.saloon.email
+def send_confirmation_email(appointment):
+    build_appointment_email(appointment, 'customer').send()
 
-    # Send the email
-    send_mail(
-        subject,
-        plain_message,
-        from_email,
-        [to_email],
-        html_message=html_message
-    )
+def staff_confirmation_email(appointment):
+    build_appointment_email(appointment, 'staff').send()
+
+def salon_confirmation_email(appointment):
+    build_appointment_email(appointment, 'salon').send()
 
 
 def send_subscription_confirmation_email(email):
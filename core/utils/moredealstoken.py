@@ -1,5 +1,15 @@
+import hashlib
+
+
 def get_moredeals_token(request):
     auth_header = request.headers.get('Authorization')
     if not auth_header:
         raise ValueError("Authorization header is missing")
     return auth_header
+
+
+def hash_token(token):
+    """Stable cache key fragment for a bearer token, never store the raw token."""
+    if token.startswith('Bearer '):
+        token = token[len('Bearer '):]
+    return hashlib.sha256(token.encode()).hexdigest()
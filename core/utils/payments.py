@@ -0,0 +1,198 @@
+import secrets
+import requests
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from core.utils import http_client
+from core.utils.sealing import seal, unseal
+
+stripe.api_key = settings.STRIPE_SECRET_KEY
+if settings.STRIPE_API_BASE:
+    stripe.api_base = settings.STRIPE_API_BASE
+
+
+PAYMENT_KEY = "payments:pending:{reference}"
+
+# Intents that can still be cancelled instead of refunded.
+STRIPE_CANCELABLE_STATUSES = ('requires_payment_method', 'requires_confirmation', 'requires_action', 'requires_capture')
+
+
+class PaymentFailed(Exception):
+    """The payment was declined or could not be completed."""
+
+
+class PaymentUncertain(Exception):
+    """The payment call gave no answer, the charge may or may not have gone through."""
+
+
+def store_payment(payment):
+    """
+    Keep what the client sent to pay (PIN, authorization header, Stripe ids)
+    encrypted in the cache for PAYMENT_REFERENCE_TTL seconds and return the
+    random reference it is stored under. Only the reference leaves the request.
+    """
+    reference = secrets.token_urlsafe(32)
+    cache.set(PAYMENT_KEY.format(reference=reference), seal(payment), settings.PAYMENT_REFERENCE_TTL)
+    return reference
+
+
+def load_payment(reference):
+    """The payment stored under a reference, None once it expired or was discarded."""
+    return unseal(cache.get(PAYMENT_KEY.format(reference=reference)))
+
+
+def discard_payment(reference):
+    cache.delete(PAYMENT_KEY.format(reference=reference))
+
+
+def get_payer_detail(payment_method_get):
+    if payment_method_get['type'] == 'card':
+        return payment_method_get['card']['last4']
+    elif payment_method_get['type'] == 'paypal':
+        return payment_method_get['paypal']['payer_email']
+    elif payment_method_get['type'] == 'swish':
+        return payment_method_get['type']
+    return ''
+
+
+def _idempotency_headers(authorization, idempotency_key):
+    headers = {'Authorization': authorization} if authorization else {}
+    if idempotency_key:
+        headers['Idempotency-Key'] = idempotency_key
+    return headers
+
+
+def stripe_payment(payment_intent, payment_method_id, amount, saloon, authorization=None, idempotency_key=None):
+    """
+    Confirm the Stripe payment intent, unless an earlier attempt already did,
+    and record the transfer with the payments service. A failure after the
+    confirmation raises PaymentFailed as well, compensate_payment() refunds.
+    """
+    try:
+        intent = stripe.PaymentIntent.retrieve(payment_intent)
+        if intent['status'] != 'succeeded':
+            intent = stripe.PaymentIntent.confirm(
+                payment_intent,
+                payment_method=payment_method_id,
+                return_url='http://127.0.0.1:8000/appointments/book',
+                idempotency_key=f"{idempotency_key}:confirm" if idempotency_key else None,
+            )
+        if intent['status'] != 'succeeded':
+            raise PaymentFailed(f"Payment failed with status: {intent['status']}")
+
+        payment_method_get = stripe.PaymentMethod.retrieve(payment_method_id)
+    except stripe.error.APIConnectionError as e:
+        raise PaymentUncertain(str(e))
+    except stripe.error.StripeError as e:
+        raise PaymentFailed(str(e))
+
+    url = f"{settings.STRIPE_PAYMENTS_URL}payment-through-stripe/"
+    try:
+        response = http_client.post(
+            url,
+            data={
+                'amount': amount,
+                'payer_detail': get_payer_detail(payment_method_get),
+                "brand": payment_method_get['type'],
+                'recipient': saloon.user.username,
+                'from_project': 'moresaloon',
+                'currency_code': saloon.currency.currency_code
+            },
+            headers=_idempotency_headers(authorization, idempotency_key),
+            endpoint='payments.through_stripe',
+            timeout=settings.HTTP_CLIENT_PAYMENT_TIMEOUT
+        )
+    except requests.RequestException as e:
+        raise PaymentFailed(f"Payment request error: {str(e)}")
+    if response.status_code != 200:
+        raise PaymentFailed("Payment failed: {}".format(response.json().get('error', 'Unknown error')))
+    return 'Paid', response.json()['data']
+
+
+def moredeals_payment(pin, amount, saloon, authorization, payment_method='moredeals', idempotency_key=None):
+    """
+    Transfer the amount from the customer's MoreDeals balance to the saloon
+    owner. The idempotency key makes a retry after a lost answer return the
+    first transfer instead of making a second one.
+    """
+    url = f"{settings.MORETREK_PAYMENTS_URL}payment-through-balance/"
+    try:
+        response = http_client.post(url, data={
+            'amount': amount,
+            'pin': pin,
+            'recipient': saloon.user.username,
+            'currency_code': saloon.currency.currency_code,
+            'remarks': f'Payment from {payment_method}',
+            'platform': 'moresaloon'
+        }, headers=_idempotency_headers(f"{authorization}", idempotency_key),
+            endpoint='payments.through_balance',
+            timeout=settings.HTTP_CLIENT_PAYMENT_TIMEOUT)
+    except requests.ConnectTimeout as e:
+        # Nothing reached the service.
+        raise PaymentFailed(f"Payment request error: {str(e)}")
+    except requests.RequestException as e:
+        raise PaymentUncertain(f"Payment request error: {str(e)}")
+    if response.status_code >= 500:
+        raise PaymentUncertain(f"Payment service error: {response.status_code}")
+    if response.status_code != 200:
+        try:
+            error = response.json()['errors']['non_field_errors'][0]
+        except (ValueError, KeyError, IndexError, TypeError):
+            error = 'Unknown error'
+        raise PaymentFailed(error)
+    return 'Paid', response.json()['data']
+
+
+def process_payment(payment_method, amount, saloon, payment, idempotency_key=None):
+    """
+    Charge `amount` for a booking at `saloon`. `payment` holds what the
+    client sent: payment_intent and payment_method_id for Stripe, pin for
+    MoreDeals, and the caller's authorization header. Calls made again with
+    the same idempotency key charge only once. Returns (payment_status,
+    payment data), raises PaymentFailed, or PaymentUncertain when the
+    outcome is unknown and the call has to be repeated.
+    """
+    if payment_method == 'coa':
+        return 'Unpaid', None
+    elif payment_method == 'stripe':
+        return stripe_payment(
+            payment.get('payment_intent'), payment.get('payment_method_id'), amount, saloon,
+            payment.get('authorization'), idempotency_key
+        )
+    elif payment_method == 'moredeals':
+        return moredeals_payment(
+            payment.get('pin'), amount, saloon, payment.get('authorization'), payment_method, idempotency_key
+        )
+    raise PaymentFailed(f"Unsupported payment method: {payment_method}")
+
+
+def compensate_payment(payment_method, payment, idempotency_key=None):
+    """
+    Undo whatever a failed payment charged. A Stripe intent that succeeded is
+    refunded and one still open is cancelled; a MoreDeals transfer that
+    failed was never made. Returns what was done, raises StripeError.
+    """
+    if payment_method != 'stripe' or not payment.get('payment_intent'):
+        return None
+    intent = stripe.PaymentIntent.retrieve(payment['payment_intent'])
+    if intent['status'] == 'succeeded':
+        stripe.Refund.create(
+            payment_intent=intent['id'],
+            idempotency_key=f"{idempotency_key}:refund" if idempotency_key else None,
+        )
+        return 'refunded'
+    if intent['status'] in STRIPE_CANCELABLE_STATUSES:
+        stripe.PaymentIntent.cancel(intent['id'])
+        return 'cancelled'
+    return None
+
+
+__all__ = [
+    "PaymentFailed",
+    "PaymentUncertain",
+    "compensate_payment",
+    "discard_payment",
+    "load_payment",
+    "process_payment",
+    "store_payment",
+]
@@ -1,18 +1,106 @@
 from rest_framework.permissions import BasePermission
-import requests
 from django.conf import settings
-from core.utils.moredealstoken import get_moredeals_token
+from django.core.cache import cache
+from core.utils import http_client
+from core.utils.circuit_breaker import sso_breaker, ServiceUnavailable
+from core.utils.identity_cache import get_user_token_hashes
+from core.utils.moredealstoken import get_moredeals_token, hash_token
+from core.utils.sealing import seal, unseal
 
+SALOON_PERMISSION_KEY = "saloon-permission:{token_hash}"
+# Grants only, served while the SSO service is unavailable.
+STALE_SALOON_PERMISSION_KEY = "saloon-permission:stale:{token_hash}"
+# Holds the encrypted token while its refresh is pending, the task only gets the hash.
+REFRESH_SALOON_PERMISSION_KEY = "saloon-permission:refreshing:{token_hash}"
+
+
+def fetch_saloon_permission(token):
+    """
+    Ask the SSO service and cache the answer. Grants and denials are both
+    cached, denials for a shorter time; anything else is never cached.
+    Raises `ServiceUnavailable` when the service cannot answer.
+    """
+    token_hash = hash_token(token)
+    response = sso_breaker.call(
+        http_client.get,
+        settings.SSO_PERMISSIONS_URL,
+        headers={'Authorization': f'{token}'},
+        endpoint='sso.saloon_permission'
+    )
+    if response.status_code == 200:
+        cache.set(SALOON_PERMISSION_KEY.format(token_hash=token_hash), True, settings.SALOON_PERMISSION_CACHE_TTL)
+        cache.set(STALE_SALOON_PERMISSION_KEY.format(token_hash=token_hash), True, settings.SSO_STALE_GRACE_PERIOD)
+        return True
+    if response.status_code in (401, 403):
+        cache.set(SALOON_PERMISSION_KEY.format(token_hash=token_hash), False, settings.SALOON_PERMISSION_NEGATIVE_CACHE_TTL)
+        cache.delete(STALE_SALOON_PERMISSION_KEY.format(token_hash=token_hash))
+    return False
+
+
+def get_saloon_permission(token):
+    """Saloon permission decision for a token, cached per token hash."""
+    token_hash = hash_token(token)
+    allowed = cache.get(SALOON_PERMISSION_KEY.format(token_hash=token_hash))
+    if allowed is not None:
+        return allowed
+
+    try:
+        return fetch_saloon_permission(token)
+    except ServiceUnavailable:
+        if not cache.get(STALE_SALOON_PERMISSION_KEY.format(token_hash=token_hash)):
+            return False
+        schedule_saloon_permission_refresh(token)
+        return True
+
+
+def schedule_saloon_permission_refresh(token):
+    from moreclub.tasks import refresh_saloon_permission
+
+    token_hash = hash_token(token)
+    if cache.add(REFRESH_SALOON_PERMISSION_KEY.format(token_hash=token_hash), seal(token), settings.SSO_REFRESH_TTL):
+        refresh_saloon_permission.delay(token_hash)
+
+
+def get_saloon_permission_refresh_token(token_hash):
+    """Token of a pending refresh, None once the refresh was cleared or expired."""
+    return unseal(cache.get(REFRESH_SALOON_PERMISSION_KEY.format(token_hash=token_hash)))
+
+
+def clear_saloon_permission_refresh(token_hash):
+    cache.delete(REFRESH_SALOON_PERMISSION_KEY.format(token_hash=token_hash))
+
+
+def has_stale_saloon_permission(token):
+    return bool(cache.get(STALE_SALOON_PERMISSION_KEY.format(token_hash=hash_token(token))))
+
+
+def invalidate_saloon_permission(token):
+    invalidate_saloon_permissions([hash_token(token)])
+
+
+def invalidate_saloon_permissions(token_hashes):
+    keys = []
+    for token_hash in token_hashes:
+        keys.append(SALOON_PERMISSION_KEY.format(token_hash=token_hash))
+        keys.append(STALE_SALOON_PERMISSION_KEY.format(token_hash=token_hash))
+    cache.delete_many(keys)
+
+
+def invalidate_user_saloon_permission(user_id):
+    """
+    Drop the decisions cached for the tokens of a local user, e.g. when the
+    saloons they own change. Only tokens the identity cache still tracks
+    for the user are known.
+    """
+    invalidate_saloon_permissions(get_user_token_hashes(user_id))
 
 
 class IsSaloonPermission(BasePermission):    
     def has_permission(self, request, view):
-        token = get_moredeals_token(request)
-        sso_service_url = f"https://moretrek.com/api/permissions/saloon/"
-        # sso_service_url = f"http://192.168.1.73:8001/api/permissions/saloon/"
-        response = requests.get(sso_service_url, headers={'Authorization': f'{token}'})
-        if response.status_code == 200:
-           return True
-        return False
-    # f"{settings.SSO_SERVICE_URL}
-        
\ No newline at end of file
+        # Views combining SaloonPermissionMixin with explicit permission
+        # classes check more than once per request, decide only once.
+        allowed = getattr(request, '_saloon_permission', None)
+        if allowed is None:
+            allowed = get_saloon_permission(get_moredeals_token(request))
+            request._saloon_permission = allowed
+        return allowed
@@ -0,0 +1,39 @@
+import json
+from base64 import urlsafe_b64encode
+from hashlib import sha256
+from cryptography.fernet import Fernet, InvalidToken
+from django.conf import settings
+
+_fernet = None
+
+
+def get_fernet():
+    global _fernet
+    if _fernet is None:
+        key = settings.SEALING_KEY or urlsafe_b64encode(sha256(f"sealing:{settings.SECRET_KEY}".encode()).digest())
+        _fernet = Fernet(key)
+    return _fernet
+
+
+def seal(value):
+    """
+    Encrypt a JSON serializable value, e.g. a credential that has to wait in
+    the cache for a background task. Only the cache key is given to the task.
+    """
+    return get_fernet().encrypt(json.dumps(value).encode())
+
+
+def unseal(sealed):
+    """The value given to seal(), None when it is missing or cannot be decrypted."""
+    if sealed is None:
+        return None
+    try:
+        return json.loads(get_fernet().decrypt(sealed))
+    except InvalidToken:
+        return None
+
+
+__all__ = [
+    "seal",
+    "unseal",
+]
@@ -0,0 +1,153 @@
+import bisect
+from datetime import datetime, timedelta
+import pytz
+
+
+class BlockedIntervals:
+    """
+    Sorted, merged and non-overlapping [start, end) intervals. Built once per
+    day, after which every overlap check is a binary search.
+    """
+
+    def __init__(self, intervals=()):
+        merged = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end):
+        # Only the last interval starting before `end` can reach past `start`,
+        # the ends of merged intervals are sorted as well.
+        index = bisect.bisect_left(self.starts, end) - 1
+        return index >= 0 and self.ends[index] > start
+
+
+def localize_interval(date, start_time, end_time, tz):
+    """
+    Local wall clock times on `date` to an aware interval, ending past
+    midnight if the end is before the start. Equal times give an empty
+    interval.
+    """
+    start = tz.localize(datetime.combine(date, start_time))
+    end_date = date + timedelta(days=1) if end_time < start_time else date
+    end = tz.localize(datetime.combine(end_date, end_time))
+    return start, end
+
+
+def build_blocked_intervals(date, tz, window, bookings=(), breaks=(), opening_hour=None):
+    """
+    Everything that makes a staff member unavailable on `date`: booked
+    appointments, break times and the time outside the saloon opening hours.
+    `bookings` and `breaks` are (start_time, end_time) pairs.
+    """
+    window_start, window_end = window
+    blocked = [localize_interval(date, start, end, tz) for start, end in bookings]
+    blocked += [localize_interval(date, start, end, tz) for start, end in breaks]
+
+    if opening_hour is not None:
+        if not opening_hour.is_open or not opening_hour.start_time or not opening_hour.end_time:
+            blocked.append((window_start, window_end))
+        else:
+            open_start, open_end = localize_interval(date, opening_hour.start_time, opening_hour.end_time, tz)
+            blocked.append((window_start, open_start))
+            blocked.append((open_end, window_end))
+
+    return BlockedIntervals(blocked)
+
+
+def find_free_slots(window, duration, buffer_time, blocked, tz, limit=None):
+    """
+    Walk the slot grid of the working window (a slot every duration + buffer)
+    and keep the slots that do not overlap a blocked interval, stopping after
+    `limit` slots when given.
+    """
+    window_start, window_end = window
+    step = duration + buffer_time
+    if step <= timedelta():
+        return []
+
+    slots = []
+    current_start = window_start
+    while current_start + step <= window_end:
+        current_end = current_start + duration
+        if not blocked.overlaps(current_start, current_end):
+            slots.append({
+                "start_time": current_start.astimezone(tz).strftime("%H:%M"),
+                "end_time": current_end.astimezone(tz).strftime("%H:%M"),
+            })
+            if limit and len(slots) >= limit:
+                break
+        current_start += step
+    return slots
+
+
+def compute_day_slots(date, timezone, working_day, duration, buffer_time, bookings=(), breaks=(), opening_hour=None, limit=None):
+    """
+    Available slots of one staff member on one day. All rows are loaded by
+    the caller so that several days or staff members can share one load.
+    """
+    if not working_day or not working_day.start_time or not working_day.end_time:
+        return []
+
+    tz = pytz.timezone(timezone or 'UTC')
+    window = localize_interval(date, working_day.start_time, working_day.end_time, tz)
+    # Slot arithmetic is done in UTC so that DST days keep real durations.
+    window = (window[0].astimezone(pytz.UTC), window[1].astimezone(pytz.UTC))
+    blocked = build_blocked_intervals(date, tz, window, bookings, breaks, opening_hour)
+    return find_free_slots(window, duration, buffer_time, blocked, tz, limit)
+
+
+def _since_midnight(value):
+    return timedelta(hours=value.hour, minutes=value.minute, seconds=value.second)
+
+
+def _to_time(offset):
+    return (datetime.min + offset).time()
+
+
+def iter_template_slots(working_days, variations, existing_slots, buffer_time):
+    """
+    Lazily generate the weekly slot template of a staff member: for every
+    working day, step through the variations in turn from the start of the
+    day, keeping the slots that fit and do not overlap an existing slot.
+
+    `variations` is the ordered list of the staff member's service
+    variations and `existing_slots` maps a working day id to its
+    (start_time, end_time) pairs. Times are handled as offsets from
+    midnight so slots never wrap into the next day.
+    """
+    step = sum((variation.duration + buffer_time for variation in variations), timedelta())
+    if not variations or step <= timedelta():
+        return
+
+    for working_day in working_days:
+        if not working_day.start_time or not working_day.end_time:
+            continue
+        day_end = _since_midnight(working_day.end_time)
+        taken = BlockedIntervals(
+            (_since_midnight(start), _since_midnight(end))
+            for start, end in existing_slots.get(working_day.id, ())
+        )
+        current = _since_midnight(working_day.start_time)
+        while current < day_end:
+            for variation in variations:
+                slot_end = current + variation.duration
+                if slot_end <= day_end and not taken.overlaps(current, slot_end):
+                    yield working_day, variation, _to_time(current), _to_time(slot_end)
+                current = slot_end + buffer_time
+
+
+__all__ = [
+    "BlockedIntervals",
+    "compute_day_slots",
+    "iter_template_slots",
+]
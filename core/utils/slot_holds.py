@@ -0,0 +1,216 @@
+import hashlib
+import secrets
+import time
+import uuid
+from datetime import time as clock
+from django.conf import settings
+from django_redis import get_redis_connection
+
+DAY_KEY = "slot_holds:{staff_id}:{date}"
+HOLD_KEY = "slot_hold:{hold_id}"
+# Live hold ids of one client (user or IP address) scored by expiry, for the per-client cap.
+CLIENT_KEY = "slot_holds:client:{client}"
+
+
+class HoldLimitReached(Exception):
+    """The client already has SLOT_HOLD_MAX_PER_CLIENT live holds."""
+
+
+# Atomically drop expired holds of the staff day and of the client, refuse
+# the new hold if the client has too many live holds (-1) or if it overlaps
+# a live one (0), otherwise store it in the day hash, under its id and in
+# the client's holds.
+# KEYS: day hash, hold key, client holds. ARGV: hold id, start, end, now (ms),
+# ttl (ms), value, max holds per client.
+CREATE_HOLD_SCRIPT = """
+local start = tonumber(ARGV[2])
+local finish = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+if redis.call('ZCARD', KEYS[3]) >= tonumber(ARGV[7]) then
+    return -1
+end
+local holds = redis.call('HGETALL', KEYS[1])
+for i = 1, #holds, 2 do
+    local hold_start, hold_end, expires = string.match(holds[i + 1], '^(%d+):(%d+):(%d+):')
+    if tonumber(expires) <= now then
+        redis.call('HDEL', KEYS[1], holds[i])
+    elseif tonumber(hold_start) < finish and tonumber(hold_end) > start then
+        return 0
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[6])
+redis.call('PEXPIRE', KEYS[1], ARGV[5])
+redis.call('SET', KEYS[2], ARGV[6], 'PX', ARGV[5])
+redis.call('ZADD', KEYS[3], now + tonumber(ARGV[5]), ARGV[1])
+redis.call('PEXPIRE', KEYS[3], ARGV[5])
+return 1
+"""
+
+_create_hold = None
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _span(start_time, end_time):
+    """Minutes since midnight of [start, end), ending past midnight if needed."""
+    start, end = _minutes(start_time), _minutes(end_time)
+    return start, end if end > start else end + 24 * 60
+
+
+def _parse(value):
+    start, end, expires, owner, staff, day, *client = value.decode().split(':')
+    return {
+        'start': int(start),
+        'end': int(end),
+        'expires': int(expires),
+        'owner': owner or None,
+        'staff_id': staff,
+        'date': day,
+        'client': client[0] if client else None,
+    }
+
+
+def _digest(value):
+    return hashlib.sha256(str(value).encode()).hexdigest()
+
+
+def new_hold_secret():
+    """Secret returned only to the anonymous creator of a hold, needed to book or release it."""
+    return secrets.token_urlsafe(24)
+
+
+def hold_owner(user, hold_secret=None):
+    """Owner recorded on a hold: the user id, or a digest of the secret of an anonymous hold."""
+    if user is not None and user.is_authenticated:
+        return str(user.pk)
+    return f"anonymous-{_digest(hold_secret)}" if hold_secret else None
+
+
+def owns_hold(hold, user, hold_secret=None):
+    """Whether the user, or the holder of the secret, created the hold."""
+    if hold['owner'] is None:
+        return False
+    return hold['owner'] in (hold_owner(user), hold_owner(None, hold_secret))
+
+
+def _time(minutes):
+    minutes %= 24 * 60
+    return clock(minutes // 60, minutes % 60)
+
+
+def create_hold(staff_id, date, start_time, end_time, owner, client):
+    """
+    Reserve [start_time, end_time) of a staff member on `date` for
+    SLOT_HOLD_TTL seconds. `client` (user id or IP address) may hold at most
+    SLOT_HOLD_MAX_PER_CLIENT slots at once. Returns the hold, None if it
+    overlaps a live hold, and raises HoldLimitReached over the cap.
+    """
+    global _create_hold
+    if _create_hold is None:
+        _create_hold = _redis().register_script(CREATE_HOLD_SCRIPT)
+
+    hold_id = str(uuid.uuid4())
+    client = _digest(client)
+    start, end = _span(start_time, end_time)
+    ttl_ms = settings.SLOT_HOLD_TTL * 1000
+    expires = int(time.time() * 1000) + ttl_ms
+    value = f"{start}:{end}:{expires}:{owner or ''}:{staff_id}:{date.isoformat()}:{client}"
+    created = _create_hold(
+        keys=[
+            DAY_KEY.format(staff_id=staff_id, date=date.isoformat()),
+            HOLD_KEY.format(hold_id=hold_id),
+            CLIENT_KEY.format(client=client),
+        ],
+        args=[hold_id, start, end, expires - ttl_ms, ttl_ms, value, settings.SLOT_HOLD_MAX_PER_CLIENT],
+    )
+    if created == -1:
+        raise HoldLimitReached()
+    if not created:
+        return None
+    return {
+        'hold_id': hold_id,
+        'staff_id': str(staff_id),
+        'date': date.isoformat(),
+        'start_time': start_time.strftime("%H:%M"),
+        'end_time': end_time.strftime("%H:%M"),
+        'expires_in': settings.SLOT_HOLD_TTL,
+    }
+
+
+def get_hold(hold_id):
+    """The live hold with this id, or None once it expired or was released."""
+    value = _redis().get(HOLD_KEY.format(hold_id=hold_id))
+    if value is None:
+        return None
+    hold = _parse(value)
+    hold['hold_id'] = str(hold_id)
+    hold['start_time'] = _time(hold['start'])
+    hold['end_time'] = _time(hold['end'])
+    return hold
+
+
+def release_hold(hold_id):
+    hold = get_hold(hold_id)
+    if hold is None:
+        return False
+    pipeline = _redis().pipeline()
+    pipeline.hdel(DAY_KEY.format(staff_id=hold['staff_id'], date=hold['date']), str(hold_id))
+    pipeline.delete(HOLD_KEY.format(hold_id=hold_id))
+    if hold['client']:
+        pipeline.zrem(CLIENT_KEY.format(client=hold['client']), str(hold_id))
+    pipeline.execute()
+    return True
+
+
+def held_intervals(staff_ids, dates, exclude=()):
+    """
+    Live holds as {(staff_id, date): [(start_time, end_time), ...]} for every
+    combination of the given staff ids and dates, in one round trip. Holds
+    whose id is in `exclude` are skipped.
+    """
+    exclude = {str(hold_id) for hold_id in exclude}
+    keys = [(str(staff_id), date) for staff_id in staff_ids for date in dates]
+    pipeline = _redis().pipeline()
+    for staff_id, date in keys:
+        pipeline.hgetall(DAY_KEY.format(staff_id=staff_id, date=date.isoformat()))
+    now = int(time.time() * 1000)
+
+    intervals = {}
+    for key, holds in zip(keys, pipeline.execute()):
+        for hold_id, value in holds.items():
+            if hold_id.decode() in exclude:
+                continue
+            hold = _parse(value)
+            if hold['expires'] > now:
+                intervals.setdefault(key, []).append((_time(hold['start']), _time(hold['end'])))
+    return intervals
+
+
+def overlaps_hold(staff_id, date, start_time, end_time, exclude=None):
+    start, end = _span(start_time, end_time)
+    exclude = [exclude] if exclude else ()
+    for hold_start, hold_end in held_intervals([staff_id], [date], exclude).get((str(staff_id), date), ()):
+        hold_start, hold_end = _span(hold_start, hold_end)
+        if hold_start < end and hold_end > start:
+            return True
+    return False
+
+
+__all__ = [
+    "HoldLimitReached",
+    "create_hold",
+    "get_hold",
+    "held_intervals",
+    "hold_owner",
+    "new_hold_secret",
+    "overlaps_hold",
+    "owns_hold",
+    "release_hold",
+]
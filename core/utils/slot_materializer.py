@@ -0,0 +1,132 @@
+import hashlib
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from appointments.models import Appointment, AppointmentSlot
+from core.utils.slot_engine import BlockedIntervals, iter_template_slots
+
+SIGNATURE_KEY = "slots:materialized:{staff_id}:{date}"
+
+
+def day_signature(working_day, variations, buffer_time, booked, taken):
+    """Digest of everything the generated slots of one staff member on one day depend on."""
+    parts = [str(buffer_time), [(str(variation.id), str(variation.duration)) for variation in variations]]
+    if working_day:
+        parts += [
+            str(working_day.start_time),
+            str(working_day.end_time),
+            sorted((str(break_time.break_start), str(break_time.break_end)) for break_time in working_day.break_times.all()),
+        ]
+    parts += [sorted(map(str, booked)), sorted(map(str, taken))]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def materialize_slots(staff_members, start_date=None, weeks=None, incremental=False):
+    """
+    Generate dated AppointmentSlot rows for `weeks` weeks from `start_date`
+    for the given staff queryset, following the same stepping as the slot
+    templates. Breaks and manually created slots are avoided and slots that
+    overlap a booking are created unavailable.
+
+    Everything is loaded up front and written with one bulk_create. In
+    incremental mode days whose inputs did not change since the last run
+    are left untouched. Returns the number of (created slots, changed days).
+    """
+    weeks = weeks or settings.SLOT_MATERIALIZATION_WEEKS
+    start_date = start_date or timezone.localdate()
+    days = [start_date + timedelta(days=offset) for offset in range(weeks * 7)]
+    date_range = (days[0], days[-1])
+
+    staff_members = list(
+        staff_members.filter(saloon__isnull=False)
+        .prefetch_related('working_days__break_times', 'services__variations')
+    )
+    staff_ids = [staff.pk for staff in staff_members]
+
+    # Manually created slots, and generated slots an appointment points at,
+    # are never replaced; new slots are stepped around them.
+    taken = {}
+    for staff_id, date, start_time, end_time in AppointmentSlot.objects.filter(
+        Q(is_generated=False) | Q(appointment__isnull=False),
+        staff_id__in=staff_ids,
+        date__range=date_range,
+        end_time__isnull=False
+    ).values_list('staff_id', 'date', 'start_time', 'end_time').distinct():
+        taken.setdefault((staff_id, date), []).append((start_time, end_time))
+
+    booked = {}
+    for staff_id, date, start_time, end_time in Appointment.objects.filter(
+        staff_id__in=staff_ids,
+        date__range=date_range
+    ).exclude(status='Cancelled').values_list('staff_id', 'date', 'start_time', 'end_time'):
+        booked.setdefault((staff_id, date), []).append((start_time, end_time))
+
+    keys = {
+        (staff_id, day): SIGNATURE_KEY.format(staff_id=staff_id, date=day.isoformat())
+        for staff_id in staff_ids for day in days
+    }
+    previous = cache.get_many(list(keys.values())) if incremental else {}
+
+    signatures = {}
+    changed = {}
+    new_slots = []
+    for staff in staff_members:
+        working_days = {working_day.day_of_week: working_day for working_day in staff.working_days.all()}
+        variations = [variation for service in staff.services.all() for variation in service.variations.all()]
+        buffer_time = staff.buffer_time or timedelta(minutes=10)
+
+        for day in days:
+            working_day = None if staff.is_holiday else working_days.get(day.strftime("%A"))
+            day_booked = booked.get((staff.pk, day), [])
+            day_taken = taken.get((staff.pk, day), [])
+            key = keys[(staff.pk, day)]
+            signature = day_signature(working_day, variations, buffer_time, day_booked, day_taken)
+            if previous.get(key) == signature:
+                continue
+            signatures[key] = signature
+            changed.setdefault(staff.pk, []).append(day)
+            if working_day is None:
+                continue
+
+            blocked = {
+                working_day.id: day_taken + [
+                    (break_time.break_start, break_time.break_end) for break_time in working_day.break_times.all()
+                ]
+            }
+            bookings = BlockedIntervals(day_booked)
+            day_end = datetime.combine(day, working_day.end_time)
+            for _, variation, start_time, end_time in iter_template_slots([working_day], variations, blocked, buffer_time):
+                new_slots.append(AppointmentSlot(
+                    saloon_id=staff.saloon_id,
+                    staff=staff,
+                    service_id=variation.service_id,
+                    working_day=working_day,
+                    service_variation=variation,
+                    date=day,
+                    start_time=start_time,
+                    # Stored end times include the buffer, as in AppointmentSlot.save(),
+                    # but never reach past the working day, let alone midnight.
+                    end_time=min(datetime.combine(day, end_time) + buffer_time, day_end).time(),
+                    buffer_time=buffer_time,
+                    is_available=not bookings.overlaps(start_time, end_time),
+                    is_generated=True,
+                ))
+
+    with transaction.atomic():
+        for staff_id, dates in changed.items():
+            # Appointment.appointment_slot cascades, booked slots must survive.
+            AppointmentSlot.objects.filter(
+                staff_id=staff_id, date__in=dates, is_generated=True, appointment__isnull=True
+            ).delete()
+        AppointmentSlot.objects.bulk_create(new_slots, batch_size=1000)
+    cache.set_many(signatures, timeout=(len(days) + 1) * 24 * 60 * 60)
+
+    return len(new_slots), sum(len(dates) for dates in changed.values())
+
+
+__all__ = [
+    "materialize_slots",
+]
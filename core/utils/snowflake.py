@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+import uuid
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+# 41 bits of milliseconds since the epoch, 10 bits of node id, 12 bits of sequence.
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+
+NODE_COUNTER_KEY = "snowflake:node:counter"
+NODE_LEASE_KEY = "snowflake:node:{node_id}"
+
+# Extend the lease only while it is still held by this process.
+# KEYS: lease. ARGV: token, ttl.
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_renew_lease = None
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+class NodeLease:
+    """
+    A node id held by this process alone. Candidates come from a shared
+    counter and are claimed with SET NX and a TTL, so every process, forked
+    workers of one host included, gets a different one. The lease is renewed
+    once half of it has passed and replaced if it was lost meanwhile.
+    """
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self.node_id = None
+        self.expires_at = 0
+
+    def acquire(self):
+        redis = _redis()
+        ttl = settings.SNOWFLAKE_NODE_LEASE_TTL
+        for _ in range(MAX_NODE_ID + 1):
+            node_id = redis.incr(NODE_COUNTER_KEY) & MAX_NODE_ID
+            started = time.monotonic()
+            if redis.set(NODE_LEASE_KEY.format(node_id=node_id), self.token, nx=True, ex=ttl):
+                self.node_id, self.expires_at = node_id, started + ttl
+                return node_id
+        raise RuntimeError("Every snowflake node id is leased by another process.")
+
+    def renew(self, now):
+        global _renew_lease
+        if _renew_lease is None:
+            _renew_lease = _redis().register_script(RENEW_LEASE_SCRIPT)
+        ttl = settings.SNOWFLAKE_NODE_LEASE_TTL
+        if _renew_lease(keys=[NODE_LEASE_KEY.format(node_id=self.node_id)], args=[self.token, ttl]):
+            self.expires_at = now + ttl
+            return True
+        return False
+
+    def current(self):
+        """The leased node id, renewing or replacing the lease when it is due."""
+        now = time.monotonic()
+        if self.node_id is None:
+            return self.acquire()
+        if now < self.expires_at - settings.SNOWFLAKE_NODE_LEASE_TTL / 2:
+            return self.node_id
+        try:
+            renewed = self.renew(now)
+        except RedisError:
+            # Still ours until the lease runs out, retry on the next id.
+            if now < self.expires_at:
+                return self.node_id
+            raise
+        return self.node_id if renewed else self.acquire()
+
+
+class SnowflakeGenerator:
+    """
+    Unique, time ordered 63-bit integers without a database round trip.
+    If the clock goes backwards or a millisecond's sequence runs out the
+    generator keeps counting from its last timestamp instead of waiting.
+    """
+
+    def __init__(self, node_id=None):
+        # Without a fixed node id one is leased from Redis on the first id.
+        self.lease = NodeLease() if node_id is None else None
+        self.node_id = node_id
+        if node_id is not None and not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"Snowflake node id must be between 0 and {MAX_NODE_ID}.")
+        self.pid = os.getpid()
+        self.last_timestamp = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            if self.lease is not None:
+                self.node_id = self.lease.current()
+            timestamp = max(int(time.time() * 1000), self.last_timestamp)
+            if timestamp == self.last_timestamp:
+                self.sequence = (self.sequence + 1) & SEQUENCE_MASK
+                if self.sequence == 0:
+                    timestamp += 1
+            else:
+                self.sequence = 0
+            self.last_timestamp = timestamp
+            return ((timestamp - EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self.sequence
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def next_id():
+    """Next id of this process, a forked worker gets its own generator."""
+    global _generator
+    if _generator is None or _generator.pid != os.getpid():
+        with _generator_lock:
+            if _generator is None or _generator.pid != os.getpid():
+                _generator = SnowflakeGenerator()
+    return _generator.next_id()
+
+
+__all__ = [
+    "SnowflakeGenerator",
+    "next_id",
+]
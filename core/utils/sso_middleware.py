@@ -1,13 +1,31 @@
-import requests
+import jwt
 from django.conf import settings
+from core.utils import http_client
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import APIException
 from django.db.models import Q
 from django.contrib.auth import get_user_model
+from core.utils.jwt_verifier import decode_token, SigningKeyUnavailable
+from core.utils.identity_cache import (
+    get_cached_identity,
+    get_stale_identity,
+    cache_identity,
+    invalidate_token,
+    schedule_identity_refresh,
+)
+from core.utils.circuit_breaker import sso_breaker, ServiceUnavailable
 
 User = get_user_model()
 
+
+class SSOUnavailable(APIException):
+    status_code = 503
+    default_detail = "Authentication service is temporarily unavailable."
+    default_code = "sso_unavailable"
+
+
 class SSOAuthentication(JWTAuthentication):
 
     def authenticate(self, request):
@@ -17,20 +35,67 @@ class SSOAuthentication(JWTAuthentication):
         else:
             return None
 
-        validated_token = self.get_validated_token(auth_header)
-        return self.get_or_create_user(auth_header), validated_token
+        # Repeat callers are resolved from the identity cache without any
+        # outbound call, the entry never outlives the token itself.
+        identity = get_cached_identity(auth_header)
+        if identity is not None:
+            user = User.objects.filter(pk=identity['user_id']).first()
+            if user is not None:
+                return user, identity
+            invalidate_token(auth_header)
+
+        try:
+            validated_token = self.get_validated_token(auth_header)
+            user = self.get_or_create_user(auth_header)
+        except ServiceUnavailable:
+            return self.authenticate_stale(auth_header)
+        return user, validated_token
+
+    def authenticate_stale(self, auth_header):
+        """
+        The SSO service is down or its circuit is open: accept identities
+        validated within the grace window and refresh them once it recovers.
+        """
+        identity = get_stale_identity(auth_header)
+        if identity is None:
+            raise SSOUnavailable()
+        user = User.objects.filter(pk=identity['user_id']).first()
+        if user is None:
+            raise SSOUnavailable()
+        schedule_identity_refresh(auth_header)
+        return user, identity
 
     def get_validated_token(self, auth_header):
+        if settings.SSO_LOCAL_VERIFICATION:
+            try:
+                return decode_token(auth_header)
+            except SigningKeyUnavailable:
+                # Key is unknown or has been rotated, let the SSO service decide.
+                pass
+            except jwt.InvalidTokenError:
+                raise InvalidToken("Token is invalid")
+        return self.verify_remote(auth_header)
+
+    def verify_remote(self, auth_header):
         sso_service_url = f"{settings.SSO_SERVICE_URL}auth/verify/token/"
-        response = requests.post(sso_service_url, data={'token': auth_header})
+        response = sso_breaker.call(
+            http_client.post,
+            sso_service_url,
+            data={'token': auth_header},
+            endpoint='sso.verify_token'
+        )
         if response.status_code != 200:
             raise InvalidToken("Token is invalid")
-        return True
+        return {}
 
     def get_or_create_user(self, validated_token):
-        print(validated_token)
         user_basic_details = f"{settings.SSO_SERVICE_URL}auth/user/all/details/"
-        response = requests.get(user_basic_details, headers={'Authorization': f'Bearer {validated_token}'})
+        response = sso_breaker.call(
+            http_client.get,
+            user_basic_details,
+            headers={'Authorization': f'Bearer {validated_token}'},
+            endpoint='sso.user_details'
+        )
         if response.status_code != 200:
             raise InvalidToken("Unable to fetch user details")
 
@@ -55,4 +120,5 @@ class SSOAuthentication(JWTAuthentication):
                 phone_number=phone_number
             )
 
+        cache_identity(validated_token, user_id, user.pk)
         return user
@@ -0,0 +1,253 @@
+"""
+Drive availability lookups, bookings and searches against a running API
+and report latency percentiles and database query counts per endpoint.
+
+    python manage.py seed_loadtest --flush
+    python -m loadtest.stubs &
+    QUERY_COUNT_HEADERS=True SSO_SERVICE_URL=... python manage.py runserver
+    python -m loadtest.run --base-url http://127.0.0.1:8000/api/ --requests 500 --concurrency 20
+
+Query counts come from the X-DB-Query-Count header, which the API only
+sends with QUERY_COUNT_HEADERS=True. See loadtest/stubs.py for the
+settings pointing the payment and SSO calls at the local stubs.
+
+A booking paid by Stripe or MoreDeals is only accepted (202) by the API,
+the payment runs in a Celery task afterwards. The appointment is polled
+until its payment settles and the outcome is reported as booking.payment,
+where anything but Paid counts as an error. Run a Celery worker as well.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import requests
+
+QUERY_COUNT_HEADER = 'X-DB-Query-Count'
+SCENARIOS = ('availability', 'booking', 'search')
+# Payment statuses of an appointment whose payment task has not finished.
+UNSETTLED_PAYMENT_STATUSES = ('Pending', 'Processing')
+
+
+class Recorder:
+    """Latency and query count samples per endpoint, shared by the worker threads."""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, response, elapsed, expected=(200,)):
+        queries = response.headers.get(QUERY_COUNT_HEADER) if response is not None else None
+        failed = response is None or response.status_code not in expected
+        status = str(response.status_code) if response is not None else 'error'
+        self.add(endpoint, status, elapsed, queries, failed)
+
+    def record_outcome(self, endpoint, outcome, elapsed, expected):
+        """A sample whose result is an outcome, e.g. a payment status, rather than a response."""
+        self.add(endpoint, outcome, elapsed, None, outcome not in expected)
+
+    def add(self, endpoint, status, elapsed, queries, failed):
+        with self.lock:
+            sample = self.samples.setdefault(endpoint, {'latency': [], 'queries': [], 'errors': 0, 'statuses': {}})
+            sample['latency'].append(elapsed)
+            if queries is not None:
+                sample['queries'].append(int(queries))
+            if failed:
+                sample['errors'] += 1
+            sample['statuses'][status] = sample['statuses'].get(status, 0) + 1
+
+    def report(self):
+        report = {}
+        for endpoint, sample in sorted(self.samples.items()):
+            latency = sorted(sample['latency'])
+            queries = sample['queries']
+            report[endpoint] = {
+                'count': len(latency),
+                'errors': sample['errors'],
+                'statuses': sample['statuses'],
+                'p50_ms': round(percentile(latency, 50) * 1000, 1),
+                'p95_ms': round(percentile(latency, 95) * 1000, 1),
+                'p99_ms': round(percentile(latency, 99) * 1000, 1),
+                'max_ms': round(latency[-1] * 1000, 1),
+                'queries_avg': round(sum(queries) / len(queries), 1) if queries else None,
+                'queries_max': max(queries) if queries else None,
+            }
+        return report
+
+
+def percentile(samples, percent):
+    index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+class LoadTest:
+    def __init__(self, base_url, manifest, recorder, tokens, payment_method, days_ahead, payment_timeout=30, poll_interval=0.5):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.manifest = manifest
+        self.recorder = recorder
+        self.tokens = tokens
+        self.payment_method = payment_method
+        self.days_ahead = days_ahead
+        self.payment_timeout = payment_timeout
+        self.poll_interval = poll_interval
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def call(self, endpoint, method, path, expected=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=60, **kwargs)
+        except requests.RequestException:
+            response = None
+        self.recorder.record(endpoint, response, time.perf_counter() - start, expected)
+        return response
+
+    def pick(self):
+        saloon = random.choice(self.manifest['saloons'])
+        service = random.choice(saloon['services'])
+        variations = random.sample(service['variations'], random.randint(1, min(2, len(service['variations']))))
+        day = date.today() + timedelta(days=random.randint(1, self.days_ahead))
+        return saloon, random.choice(saloon['staff']), service, variations, day
+
+    def availability(self):
+        saloon, staff_id, service, variations, day = self.pick()
+        return self.call(
+            'availability', 'GET', f"appointments/available-slots/{staff_id}/",
+            expected=(200, 404),
+            params={'saloon_id': saloon['id'], 'date': day.isoformat(), 'service_variation': variations},
+        )
+
+    def booking(self):
+        saloon, staff_id, service, variations, day = self.pick()
+        response = self.call(
+            'booking.availability', 'GET', f"appointments/available-slots/{staff_id}/",
+            expected=(200, 404),
+            params={'saloon_id': saloon['id'], 'date': day.isoformat(), 'service_variation': variations},
+        )
+        if response is None or response.status_code != 200:
+            return
+        slots = response.json().get('data') or []
+        if not slots:
+            return
+        slot = random.choice(slots)
+        token = random.choice(self.tokens)
+        payload = {
+            'saloon_id': saloon['id'],
+            'staff_id': staff_id,
+            'service_id': service['id'],
+            'service_variation_ids': variations,
+            'date': day.isoformat(),
+            'start_time': slot['start_time'],
+            'fullname': 'Load Test',
+            'email': f"{token}@loadtest.local",
+            'phone_number': '+15550000000',
+            'note': '',
+            'payment_method': self.payment_method,
+        }
+        if self.payment_method == 'stripe':
+            payload.update(payment_intent=f"pi_{uuid.uuid4().hex}", payment_method_id=f"pm_{uuid.uuid4().hex}")
+        elif self.payment_method == 'moredeals':
+            payload['pin'] = '0000'
+        # 409s are slots someone else booked between the lookup and the booking.
+        response = self.call(
+            'booking.place', 'POST', 'appointments/place/',
+            expected=(200, 201, 202, 409),
+            json=payload,
+            headers={'Authorization': f"Bearer {token}", 'Idempotency-Key': str(uuid.uuid4())},
+        )
+        if response is not None and response.status_code == 202:
+            self.await_payment(response.json()['data']['appointment_id'], token)
+
+    def await_payment(self, appointment_id, token):
+        """
+        Poll an accepted booking until its payment task settles it and record
+        the final payment status, the time to settle included.
+        """
+        start = time.perf_counter()
+        outcome = 'timeout'
+        while time.perf_counter() - start < self.payment_timeout:
+            try:
+                response = self.session.get(
+                    self.base_url + f"appointments/{appointment_id}/",
+                    headers={'Authorization': f"Bearer {token}"},
+                    timeout=60,
+                )
+            except requests.RequestException:
+                response = None
+            if response is not None and response.status_code == 200:
+                payment_status = response.json()['data'].get('payment_status')
+                if payment_status not in UNSETTLED_PAYMENT_STATUSES:
+                    outcome = payment_status
+                    break
+            time.sleep(self.poll_interval)
+        self.recorder.record_outcome('booking.payment', outcome, time.perf_counter() - start, expected=('Paid',))
+
+    def search(self):
+        self.call('search', 'GET', 'search/search/', params={'query': random.choice(self.manifest['search_terms'])})
+
+    def run(self, scenarios, total, concurrency):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(getattr(self, random.choice(scenarios))) for _ in range(total)]:
+                future.result()
+
+
+def print_report(report):
+    columns = ('count', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'queries_avg', 'queries_max')
+    print(f"{'endpoint':<24}" + ''.join(f"{column:>13}" for column in columns))
+    for endpoint, row in report.items():
+        print(f"{endpoint:<24}" + ''.join(f"{'-' if row[column] is None else row[column]:>13}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000/api/')
+    parser.add_argument('--manifest', default='loadtest/manifest.json', help="Written by the seed_loadtest command.")
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="Repeatable, default all.")
+    parser.add_argument('--requests', type=int, default=200, help="Scenario runs in total.")
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--users', type=int, default=50, help="Size of the stub user token pool.")
+    parser.add_argument('--payment-method', choices=('coa', 'stripe', 'moredeals'), default='stripe')
+    parser.add_argument('--days-ahead', type=int, default=14, help="Bookings and lookups fall within this many days.")
+    parser.add_argument('--payment-timeout', type=float, default=30, help="Seconds to wait for a payment to settle.")
+    parser.add_argument('--seed', type=int, help="Random seed for a repeatable request mix.")
+    parser.add_argument('--json', help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    with open(args.manifest) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    recorder = Recorder()
+    load_test = LoadTest(
+        args.base_url,
+        manifest,
+        recorder,
+        tokens=[f"loadtest-{index}" for index in range(args.users)],
+        payment_method=args.payment_method,
+        days_ahead=args.days_ahead,
+        payment_timeout=args.payment_timeout,
+    )
+    started = time.perf_counter()
+    load_test.run(args.scenario or list(SCENARIOS), args.requests, args.concurrency)
+    elapsed = time.perf_counter() - started
+
+    report = recorder.report()
+    print(f"{args.requests} scenario runs in {elapsed:.1f}s ({args.requests / elapsed:.1f}/s)")
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
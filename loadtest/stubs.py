@@ -0,0 +1,207 @@
+"""
+Local stand-ins for the services the booking flow calls: the Stripe API,
+the moretrek payments endpoints and the SSO service. Every route answers
+after a configurable delay so load tests see realistic upstream latency
+without touching live systems.
+
+    python -m loadtest.stubs --port 8899 --latency-ms 80 --stripe-latency-ms 300
+
+Point the API at it with:
+
+    SSO_SERVICE_URL=http://127.0.0.1:8899/api/
+    SSO_LOCAL_VERIFICATION=False
+    MORETREK_PAYMENTS_URL=http://127.0.0.1:8899/api/payments/
+    STRIPE_PAYMENTS_URL=http://127.0.0.1:8899/api/payments/
+    STRIPE_API_BASE=http://127.0.0.1:8899
+    QUERY_COUNT_HEADERS=True
+
+Bearer tokens are not checked, each distinct token is treated as its own
+user, so `loadtest-1`, `loadtest-2`, ... give a pool of customers.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+USER_NAMESPACE = uuid.UUID('8f2b6c1e-4d5a-4f0b-9c3e-2a7d1e6b5c40')
+
+
+def user_for_token(token):
+    token = token.replace('Bearer ', '').strip() or 'anonymous'
+    user_id = uuid.uuid5(USER_NAMESPACE, token)
+    return {
+        'id': str(user_id),
+        'email': f"{token}@loadtest.local",
+        'username': token,
+        'first_name': 'Load',
+        'last_name': 'Test',
+        'phone_number': f"+1555{user_id.int % 10 ** 7:07d}",
+    }
+
+
+def stripe_payment_intent(intent_id, status='succeeded'):
+    return {'id': intent_id, 'object': 'payment_intent', 'status': status}
+
+
+def stripe_refund(intent_id):
+    return {'id': f"re_{uuid.uuid4().hex}", 'object': 'refund', 'payment_intent': intent_id, 'status': 'succeeded'}
+
+
+def stripe_payment_method(method_id):
+    return {'id': method_id, 'object': 'payment_method', 'type': 'card', 'card': {'last4': '4242'}}
+
+
+def transfer(amount):
+    return {'data': {
+        'user_send_amount': amount,
+        'transaction_id': uuid.uuid4().int % 10 ** 9,
+        'refferal_points_id': 0,
+    }}
+
+
+# (method, path pattern, service, handler(handler, match, form) -> (status, body))
+ROUTES = [
+    ('GET', r'/v1/payment_intents/(?P<id>[^/]+)', 'stripe',
+     lambda request, match, form: (200, stripe_payment_intent(match['id'], request.server.intent_status(match['id'])))),
+    ('POST', r'/v1/payment_intents/(?P<id>[^/]+)/confirm', 'stripe',
+     lambda request, match, form: (200, stripe_payment_intent(match['id'], request.server.confirm_intent(match['id'])))),
+    ('POST', r'/v1/payment_intents/(?P<id>[^/]+)/cancel', 'stripe',
+     lambda request, match, form: (200, stripe_payment_intent(match['id'], request.server.set_intent_status(match['id'], 'canceled')))),
+    ('POST', r'/v1/refunds', 'stripe',
+     lambda request, match, form: (200, stripe_refund(form.get('payment_intent')))),
+    ('GET', r'/v1/payment_methods/(?P<id>[^/]+)', 'stripe',
+     lambda request, match, form: (200, stripe_payment_method(match['id']))),
+    ('POST', r'/api/payments/payment-through-stripe/', 'payments',
+     lambda request, match, form: (200, transfer(form.get('amount', '0')))),
+    ('POST', r'/api/payments/payment-through-balance/', 'payments',
+     lambda request, match, form: (200, transfer(form.get('amount', '0'))) if form.get('pin')
+     else (400, {'errors': {'non_field_errors': ['Invalid PIN']}})),
+    ('POST', r'/api/payments/all/stripe/create-payment-intent/', 'payments',
+     lambda request, match, form: (200, {'data': {'client_secret': f"pi_{uuid.uuid4().hex}_secret_loadtest"}})),
+    ('POST', r'/api/auth/verify/token/', 'sso',
+     lambda request, match, form: (200, {'success': True})),
+    ('GET', r'/api/auth/user/all/details/', 'sso',
+     lambda request, match, form: (200, {'data': user_for_token(request.headers.get('Authorization', ''))})),
+    ('GET', r'/api/auth/jwks/', 'sso',
+     lambda request, match, form: (200, {'keys': []})),
+    ('GET', r'/api/permissions/saloon/', 'sso',
+     lambda request, match, form: (200, {'success': True})),
+]
+ROUTES = [(method, re.compile(pattern + '$'), service, handler) for method, pattern, service, handler in ROUTES]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            form = json.loads(body or '{}')
+        else:
+            form = {key: values[-1] for key, values in parse_qs(body).items()}
+
+        path = self.path.split('?', 1)[0]
+        for route_method, pattern, service, handler in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                time.sleep(self.server.delay(service))
+                status, payload = handler(self, match, form)
+                break
+        else:
+            status, payload = 404, {'error': f"No stub for {method} {path}"}
+        self.respond(status, payload)
+
+    def respond(self, status, payload):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency, jitter, decline_rate=0.0, verbose=False):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.decline_rate = decline_rate
+        self.verbose = verbose
+        # Status of every payment intent seen, retrieving one after its
+        # confirmation returns what the confirmation decided.
+        self.intents = {}
+        self.intents_lock = threading.Lock()
+
+    def delay(self, service):
+        return max(0.0, self.latency[service] + random.uniform(-self.jitter, self.jitter)) / 1000
+
+    def stripe_status(self):
+        return 'requires_payment_method' if random.random() < self.decline_rate else 'succeeded'
+
+    def intent_status(self, intent_id):
+        with self.intents_lock:
+            return self.intents.get(intent_id, 'requires_confirmation')
+
+    def set_intent_status(self, intent_id, status):
+        with self.intents_lock:
+            self.intents[intent_id] = status
+        return status
+
+    def confirm_intent(self, intent_id):
+        with self.intents_lock:
+            if self.intents.get(intent_id) != 'succeeded':
+                self.intents[intent_id] = self.stripe_status()
+            return self.intents[intent_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8899)
+    parser.add_argument('--latency-ms', type=float, default=50, help="Base delay of every route.")
+    parser.add_argument('--jitter-ms', type=float, default=10, help="Uniform +/- jitter added to each delay.")
+    parser.add_argument('--stripe-latency-ms', type=float, help="Delay of the Stripe API routes.")
+    parser.add_argument('--payments-latency-ms', type=float, help="Delay of the moretrek payments routes.")
+    parser.add_argument('--sso-latency-ms', type=float, help="Delay of the SSO routes.")
+    parser.add_argument('--decline-rate', type=float, default=0.0, help="Share of Stripe confirmations that fail.")
+    parser.add_argument('--verbose', action='store_true', help="Log every request.")
+    args = parser.parse_args()
+
+    latency = {
+        service: args.latency_ms if value is None else value
+        for service, value in (
+            ('stripe', args.stripe_latency_ms),
+            ('payments', args.payments_latency_ms),
+            ('sso', args.sso_latency_ms),
+        )
+    }
+    server = StubServer((args.host, args.port), latency, args.jitter_ms, args.decline_rate, args.verbose)
+    print(f"Stub services listening on http://{args.host}:{args.port} with latency {latency} ms")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import AboutView, WhoWeAreView, PhilosophyView, FAQView, PrivacyPolicyView, TermsAndConditionView,HomeView
+from .views import AboutView, WhoWeAreView, PhilosophyView, FAQView, PrivacyPolicyView, TermsAndConditionView,HomeView, IntegrationMetricsView
 
 urlpatterns = [
     path('about/', AboutView.as_view(), name='about'),
@@ -9,4 +9,5 @@ urlpatterns = [
     path('privacypolicy/', PrivacyPolicyView.as_view(), name='privacypolicy'),
     path('termsandcondition/', TermsAndConditionView.as_view(), name='termsandcondition'),
     path('home/', HomeView.as_view(), name='home'),
+    path('integrations/metrics/', IntegrationMetricsView.as_view(), name='integration_metrics'),
 ]
\ No newline at end of file
@@ -4,6 +4,9 @@ from django.views import View
 from django.http import JsonResponse
 from .models import About, WhoWeAre, Philosophy, FAQ, PrivacyPolicy, TermsAndCondition
 from .serializers import AboutSerializer, WhoWeAreSerializer, PhilosophySerializer, FAQSerializer, PrivacyPolicySerializer, TermsAndConditionSerializer
+from rest_framework.permissions import IsAdminUser
+from core.utils import http_client
+from core.utils.circuit_breaker import sso_breaker
 from core.utils.response import PrepareResponse
 # Create your views here.
 
@@ -94,4 +97,22 @@ class HomeView(View):
         restaurants = Saloon.objects.all()
         for restaurant in restaurants:
             restaurant.save()
-        return JsonResponse({'restaurants': list(restaurants.values())})
\ No newline at end of file
+        return JsonResponse({'restaurants': list(restaurants.values())})
+
+
+class IntegrationMetricsView(generics.GenericAPIView):
+    """
+    Latency and error counts of the outbound integration calls made by the
+    worker process answering, and the state of the SSO circuit.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return PrepareResponse(
+            success=True,
+            data={
+                'endpoints': http_client.get_metrics(),
+                'circuits': {sso_breaker.name: sso_breaker.state()},
+            },
+            message="Integration metrics retrieved successfully"
+        ).send(200)
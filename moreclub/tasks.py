@@ -0,0 +1,31 @@
+from celery import shared_task
+from django.conf import settings
+from core.utils.circuit_breaker import ServiceUnavailable
+from core.utils.permissions import (
+    fetch_saloon_permission,
+    get_saloon_permission_refresh_token,
+    has_stale_saloon_permission,
+    clear_saloon_permission_refresh,
+)
+
+
+@shared_task(bind=True, max_retries=settings.SSO_REFRESH_MAX_RETRIES)
+def refresh_saloon_permission(self, token_hash):
+    """
+    Revalidate a saloon permission grant that was served stale while the SSO
+    service was unavailable, retrying with backoff a bounded number of times.
+    The token is read from the pending refresh entry, never sent through the
+    broker.
+    """
+    token = get_saloon_permission_refresh_token(token_hash)
+    if token is None:
+        return
+    if not has_stale_saloon_permission(token):
+        clear_saloon_permission_refresh(token_hash)
+        return
+
+    try:
+        fetch_saloon_permission(token)
+    except ServiceUnavailable as e:
+        raise self.retry(exc=e, countdown=settings.SSO_REFRESH_RETRY_DELAY * 2 ** self.request.retries)
+    clear_saloon_permission_refresh(token_hash)
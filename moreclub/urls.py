@@ -3,6 +3,7 @@ from moreclub.views import (
     SaloonSetupView,
     SaloonDetailUpdateView,
     UserSaloonListView,
+    SaloonPermissionPrecheckView,
     ServiceListCreateView,
     ServiceDetailUpdateDeleteView,
     StaffDetailUpdateDeleteView,
@@ -33,6 +34,7 @@ urlpatterns = [
     path ('saloon/setup/',SaloonSetupView.as_view(),name='setup-saloon'),
     path('users/saloon/<uuid:saloon_id>/',SaloonDetailUpdateView.as_view(),name='saloon-details'),
     path('users/saloons/list/',UserSaloonListView.as_view(),name='user_saloon_list'),
+    path('users/permissions/precheck/',SaloonPermissionPrecheckView.as_view(),name='saloon-permission-precheck'),
 
     #############################service##########################################
     path('users/saloons/<uuid:saloon_id>/services/', ServiceListCreateView.as_view(), name='service-list-create'),
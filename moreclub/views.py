@@ -25,10 +25,13 @@ from moreclub.serializers import (ServiceVariationImageSerializer,
 from core.utils.response import PrepareResponse
 from rest_framework.permissions import IsAuthenticated
 from core.utils.auth import SaloonPermissionMixin
-from core.utils.permissions import IsSaloonPermission
+from core.utils.permissions import IsSaloonPermission, get_saloon_permission
+from core.utils.moredealstoken import get_moredeals_token
 from django.shortcuts import get_object_or_404
 from django.db import transaction
 from datetime import datetime,timedelta
+from itertools import islice
+from core.utils.slot_engine import iter_template_slots
 from rest_framework.parsers import MultiPartParser
 from django.core.exceptions import PermissionDenied
 from core.utils.normalize_text import normalize_amenity
@@ -131,7 +134,25 @@ class UserSaloonListView(SaloonPermissionMixin, generics.GenericAPIView):
             message='User Saloons fetched sucessfully'
         )
         return response.send(200)
-    
+
+
+class SaloonPermissionPrecheckView(generics.GenericAPIView):
+    """
+    Called once when the merchant dashboard loads, warms the saloon permission
+    cache so the API calls that follow skip the SSO round trip.
+    """
+    serializer_class = None
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        has_permission = get_saloon_permission(get_moredeals_token(request))
+        response = PrepareResponse(
+            success=True,
+            data={'has_permission': has_permission},
+            message='Saloon permission checked successfully'
+        )
+        return response.send(200)
+
 ################################################ServiceVariations###########################################################
 
 class ServiceVariationListCreateView(generics.GenericAPIView):
@@ -514,54 +535,69 @@ class AppointmentSlotListCreateView(SaloonPermissionMixin, generics.ListCreateAP
     permission_classes = [IsAuthenticated, IsSaloonPermission]
 
     def get_queryset(self):
+        """
+        Slots are generated lazily from rows loaded in a fixed number of
+        queries; overlaps with existing slots are checked in memory.
+        """
         saloon_id = self.kwargs.get('saloon_id')
         staff_id = self.kwargs.get('staff_id')
         staff = get_object_or_404(Staff, id=staff_id, saloon_id=saloon_id)
-        working_days = staff.working_days.all()
+        working_days = list(staff.working_days.all())
+        variations = [
+            service_variation
+            for service in staff.services.prefetch_related('variations')
+            for service_variation in service.variations.all()
+        ]
+        existing_slots = {}
+        for working_day_id, start_time, end_time in AppointmentSlot.objects.filter(
+            staff=staff,
+            end_time__isnull=False
+        ).values_list('working_day_id', 'start_time', 'end_time'):
+            existing_slots.setdefault(working_day_id, []).append((start_time, end_time))
 
-        available_slots = []
         buffer_time = staff.buffer_time or timedelta(minutes=10)
+        return (
+            {
+                'working_day': working_day,
+                'staff': staff,
+                'start_time': start_time,
+                'end_time': end_time,
+                'service_variation': service_variation,
+                'buffer_time': staff.buffer_time
+            }
+            for working_day, service_variation, start_time, end_time in iter_template_slots(
+                working_days, variations, existing_slots, buffer_time
+            )
+        )
 
-        for working_day in working_days:
-            current_time = working_day.start_time
-            end_time = working_day.end_time
-            if not current_time or not end_time:
-                continue 
-            while current_time < end_time:
-                for service in staff.services.all():
-                    for service_variation in service.variations.all():
-                        duration = service_variation.duration
-                        slot_end_time = (datetime.combine(datetime.today(), current_time) + duration ).time()
-                        print(buffer_time)
-
-                        if slot_end_time <= end_time:
-                            # Check if the slot is already booked
-                            overlapping_slots = AppointmentSlot.objects.filter(
-                                staff=staff,
-                                working_day=working_day,
-                                start_time__lt=slot_end_time,
-                                end_time__gt=current_time
-                            )
-                            if not overlapping_slots.exists():
-                                available_slots.append({
-                                    'working_day': working_day,
-                                    'staff': staff,
-                                    'start_time': current_time,
-                                    'end_time': slot_end_time,
-                                    'service_variation': service_variation,
-                                    'buffer_time': staff.buffer_time
-                                })
-                        current_time = (datetime.combine(datetime.today(), current_time) + duration + staff.buffer_time).time()
-
-        return available_slots
-    
     def get(self, request, *args, **kwargs):
         available_slots = self.get_queryset()
+        meta = {}
+        page_size = request.query_params.get('page_size')
+        if page_size:
+            # Only the requested page is generated, one extra slot tells if there is a next page.
+            try:
+                page_size = max(int(page_size), 1)
+                page_number = max(int(request.query_params.get('page', 1)), 1)
+            except ValueError:
+                return PrepareResponse(
+                    success=False,
+                    message="page and page_size must be integers."
+                ).send(400)
+            offset = (page_number - 1) * page_size
+            available_slots = list(islice(available_slots, offset, offset + page_size + 1))
+            meta = {
+                'page_number': page_number,
+                'page_size': page_size,
+                'has_next': len(available_slots) > page_size,
+            }
+            available_slots = available_slots[:page_size]
         serializer = self.get_serializer(available_slots, many=True)
         response = PrepareResponse(
             success=True,
             data=serializer.data,
-            message="Available slots fetched successfully."
+            message="Available slots fetched successfully.",
+            meta=meta
         )
         return response.send(200)
 class AppointmentSlotDetailUpdateDeleteView(SaloonPermissionMixin, generics.RetrieveUpdateDestroyAPIView):
@@ -3,23 +3,30 @@ import stripe
 from django.conf import settings
 from django.http import JsonResponse
 from rest_framework import generics
-from core.utils.appointment import calculate_total_appointment_price
-import requests
+from core.utils.appointment import BookingQuote
+from services.models import ServiceVariation
+from core.utils import http_client
+from core.utils.idempotency import IdempotentPostMixin
 
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
-class CreatePaymentIntentView(generics.GenericAPIView):
+class CreatePaymentIntentView(IdempotentPostMixin, generics.GenericAPIView):
     def post(self, request, *args, **kwargs):
         # try:
             data = json.loads(request.body)
             print("data: ", data)
-            currency = data.get('currency', 'usd')
             payment_method = "moresaloon"
             service_variations_uuids = data.get('service_variations_uuids', [])  
             print("service_variations_uuids: ", service_variations_uuids)         
-            total_price = calculate_total_appointment_price(service_variations_uuids)
+            try:
+                quote = BookingQuote(service_variations_uuids)
+            except (ServiceVariation.DoesNotExist, ValueError) as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            total_price = quote.total_price
+            saloon_currency = quote.currency
+            currency = data.get('currency') or (saloon_currency.currency_code.lower() if saloon_currency else 'usd')
 
             payment_data = {
                 'currency': currency,
@@ -27,16 +34,17 @@ class CreatePaymentIntentView(generics.GenericAPIView):
                 'price': total_price  
             }
             print("price: ", total_price)
-            # url = f"https://moretrek.com/api/payments/all/stripe/create-payment-intent/"
-            url=f"http://192.168.1.72:8000/api/payments/all/stripe/create-payment-intent/"
-            response = requests.post(url, data={
+            url = f"{settings.STRIPE_PAYMENTS_URL}all/stripe/create-payment-intent/"
+            response = http_client.post(url, data={
                 'currency': currency,
                 'payment_method': payment_method,
                 'price': total_price
             },
             headers = {
                 'Content-Type': 'application/x-www-form-urlencoded',
-            })
+            },
+            endpoint='payments.create_payment_intent',
+            timeout=settings.HTTP_CLIENT_PAYMENT_TIMEOUT)
             if response.status_code == 200:
                 payment_response = response.json()
                 return JsonResponse(payment_response)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from core.utils.geo import H3_FIELDS, h3_cells
+from saloons.models import Saloon
+
+
+class Command(BaseCommand):
+    help = "Compute the H3 cell columns of saloons saved before they existed, or of every saloon with --all."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recompute every saloon, not only those without cells.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        saloons = Saloon.objects.only('pk', 'lat', 'lng', *H3_FIELDS.values())
+        if not options['all']:
+            saloons = saloons.filter(h3_r9__isnull=True)
+
+        batch = []
+        updated = 0
+        for saloon in saloons.iterator(chunk_size=options['batch_size']):
+            for field, cell in h3_cells(saloon.lat, saloon.lng).items():
+                setattr(saloon, field, cell)
+            batch.append(saloon)
+            if len(batch) >= options['batch_size']:
+                updated += Saloon.objects.bulk_update(batch, list(H3_FIELDS.values()))
+                batch = []
+        if batch:
+            updated += Saloon.objects.bulk_update(batch, list(H3_FIELDS.values()))
+        self.stdout.write(self.style.SUCCESS(f"Updated H3 cells of {updated} saloons."))
@@ -4,9 +4,12 @@ import uuid
 from country.models import Country,Currency
 from taggit.managers import TaggableManager
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from core.utils.slugify import unique_slug_generator
 import pytz
 from core.utils.compression_image import compress_image
+from core.utils.geo import H3_FIELDS, h3_cells
 
 class Saloon(models.Model):
     id = models.UUIDField(
@@ -24,6 +27,10 @@ class Saloon(models.Model):
     long_description = models.TextField(null=True,blank=True)
     lat = LatitudeField()
     lng = LongitudeField()
+    # H3 cells of lat/lng at resolutions 5, 7 and 9, set in save() (core.utils.geo)
+    h3_r5 = models.CharField(max_length=15, null=True, blank=True, editable=False, db_index=True)
+    h3_r7 = models.CharField(max_length=15, null=True, blank=True, editable=False, db_index=True)
+    h3_r9 = models.CharField(max_length=15, null=True, blank=True, editable=False, db_index=True)
     banner = models.ImageField(upload_to='saloons/banner', null=True, blank=True)
     email = models.CharField(max_length=255)
     contact_no = models.CharField(max_length=50)
@@ -44,6 +51,14 @@ class Saloon(models.Model):
         null=True,
         blank=True
     )
+    # Maintained by search.signals, see search.search.SEARCH_VECTORS
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='saloon_search_vector_idx'),
+            GinIndex(fields=['name'], name='saloon_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.name
@@ -54,6 +69,11 @@ class Saloon(models.Model):
             self.logo = compress_image(self.logo.file)
         if self.banner and hasattr(self.banner, 'file'):
             self.banner = compress_image(self.banner.file)
+        for field, cell in h3_cells(self.lat, self.lng).items():
+            setattr(self, field, cell)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'lat', 'lng'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | set(H3_FIELDS.values())
         super().save(*args, **kwargs)
 
 class Gallery(models.Model):
@@ -27,6 +27,17 @@ class SaloonSerializer(serializers.ModelSerializer):
 
     def get_logo(self, obj):
         return obj.logo.url if obj.logo else None 
+
+
+class NearbySaloonSerializer(SaloonSerializer):
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta(SaloonSerializer.Meta):
+        fields = SaloonSerializer.Meta.fields + ['lat', 'lng', 'distance_km']
+
+    def get_distance_km(self, obj):
+        return round(obj.distance_km, 3)
+
     # def get_is_open(self, obj):
     #     if not obj.is_open:
     #         return False
@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from core.utils.permissions import invalidate_user_saloon_permission
+from .models import Saloon
+
+
+@receiver(pre_save, sender=Saloon)
+def remember_owner(sender, instance, raw=False, **kwargs):
+    # The previous owner loses the saloon, their decisions are dropped too.
+    instance._previous_user_id = None
+    if instance.pk and not raw:
+        instance._previous_user_id = Saloon.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Saloon)
+def owner_changed(sender, instance, **kwargs):
+    user_ids = {instance.user_id, getattr(instance, '_previous_user_id', None)} - {None}
+    transaction.on_commit(lambda: [invalidate_user_saloon_permission(user_id) for user_id in user_ids])
@@ -6,12 +6,14 @@ from .views import(
      GalleryUploadView, 
      PopularSaloonListView,
      GalleryListView,
-     SaloonListForMoredealsClubView
+     SaloonListForMoredealsClubView,
+     NearbySaloonListView
 )
 
 urlpatterns = [
     path('saloons/create/', SaloonCreateView.as_view(), name='saloon-create'),
     path('lists/', SaloonListView.as_view(), name='saloon-list'),
+    path('nearby/', NearbySaloonListView.as_view(), name='saloon-nearby'),
     path('saloons/moredeals/', SaloonListForMoredealsClubView.as_view(), name='moredeals-saloon-list'),
     path('<uuid:saloon_id>/details/', SaloonDetailView.as_view(), name='saloon-detail'),
     path('saloons/upload/', GalleryUploadView.as_view(), name='gallery-upload'),
@@ -3,7 +3,8 @@ from rest_framework.views import APIView
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
 from .models import Saloon,Gallery
-from .serializers import SaloonSerializer, GallerySerializer,PopularSaloonSerializer,SaloonDetailSerializer,SaloonListForMoreDealsSerializer
+from .serializers import SaloonSerializer, GallerySerializer,PopularSaloonSerializer,SaloonDetailSerializer,SaloonListForMoreDealsSerializer,NearbySaloonSerializer
+from core.utils import geo
 from core.utils.pagination import CustomPageNumberPagination
 from core.utils.response import PrepareResponse
 from django.db.models import Count, Q
@@ -59,7 +60,50 @@ class SaloonListView(generics.GenericAPIView):
             meta=paginated_data
         )
         return response.send(code=200)
-    
+
+
+class NearbySaloonListView(generics.GenericAPIView):
+    serializer_class = NearbySaloonSerializer
+    pagination_class = CustomPageNumberPagination
+
+    def get(self, request, *args, **kwargs):
+        try:
+            lat, lng, radius_km = geo.parse_location(
+                request.query_params.get('lat'),
+                request.query_params.get('lng'),
+                request.query_params.get('radius'),
+            )
+        except (TypeError, ValueError):
+            return PrepareResponse(
+                success=False,
+                message="Provide valid lat, lng and an optional radius in km.",
+            ).send(400)
+
+        # Nearest first; only the page being returned is loaded in full.
+        ranked = geo.nearby(Saloon.objects.all(), lat, lng, radius_km)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(ranked, request)
+        saloons = Saloon.objects.in_bulk([pk for pk, _ in page])
+        results = []
+        for pk, distance_km in page:
+            saloon = saloons.get(pk)
+            if saloon is not None:
+                saloon.distance_km = distance_km
+                results.append(saloon)
+        serializer = self.serializer_class(results, many=True)
+        paginated_data = paginator.get_paginated_response(serializer.data)
+
+        result = paginated_data['results']
+        del paginated_data['results']
+
+        response = PrepareResponse(
+            success=True,
+            message="Nearby saloons fetched successfully",
+            data=result,
+            meta=paginated_data
+        )
+        return response.send(code=200)
+
 class SaloonListForMoredealsClubView(generics.GenericAPIView):
     serializer_class = SaloonListForMoreDealsSerializer
     pagination_class = CustomPageNumberPagination
@@ -0,0 +1,229 @@
+import json
+import re
+from django.conf import settings
+from django.db.models import Count
+from django_redis import get_redis_connection
+from saloons.models import Saloon
+from services.models import Service, ServiceVariation
+
+# Every term is indexed under the country of its saloon and under ALL_COUNTRIES,
+# used when the request carries no country code.
+ALL_COUNTRIES = 'all'
+KEY_PREFIX = "autocomplete:"
+KEY_PATTERN = "autocomplete:*"
+# rebuild_index() writes the new index under this prefix, then renames it over
+# the live keys in one transaction. It must not match KEY_PATTERN.
+REBUILD_PREFIX = "autocomplete-rebuild:"
+# One sorted set per prefix, members are "<type>|<term>" scored by minus the
+# booking count, so ZRANGE lists the most booked terms first and ties by name.
+PREFIX_KEY = "autocomplete:{scope}:prefix:{prefix}"
+# Number of rows providing each member, it leaves the prefix sets at zero.
+MEMBERS_KEY = "autocomplete:{scope}:members"
+# Booking count of each member.
+SCORES_KEY = "autocomplete:{scope}:scores"
+# "<label>:<pk>" of every indexed row -> JSON [scopes, members].
+SOURCES_KEY = "autocomplete:sources"
+# Commands sent per pipeline round trip by rebuild_index().
+REBUILD_BATCH_SIZE = 1000
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def normalize(text):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+
+def prefixes(term):
+    """Prefixes of the term and of each of its later words, up to AUTOCOMPLETE_MAX_PREFIX characters."""
+    normalized = normalize(term)
+    result = set()
+    for word in re.finditer(r'\S+', normalized):
+        rest = normalized[word.start():settings.AUTOCOMPLETE_MAX_PREFIX + word.start()]
+        result.update(rest[:length] for length in range(1, len(rest) + 1) if not rest[length - 1].isspace())
+    return result
+
+
+def _scopes(country_code):
+    return [ALL_COUNTRIES] + ([country_code.lower()] if country_code else [])
+
+
+def _split(member):
+    kind, term = member.split('|', 1)
+    return kind, term
+
+
+def saloon_members(name, amenities):
+    members = [f"saloon|{name}"] + [f"amenity|{amenity}" for amenity in amenities or () if amenity]
+    return list(dict.fromkeys(members))
+
+
+def index_source(label, pk, country_code, members):
+    """
+    Make the terms provided by one row `members`, replacing what it provided
+    before. Terms no other row provides anymore leave the index.
+    """
+    redis = _redis()
+    key = f"{label}:{pk}"
+    old = redis.hget(SOURCES_KEY, key)
+    old_scopes, old_members = json.loads(old) if old else ([], [])
+    scopes = _scopes(country_code) if members else []
+
+    added = [(scope, member) for scope in scopes for member in members
+             if scope not in old_scopes or member not in old_members]
+    removed = [(scope, member) for scope in old_scopes for member in old_members
+               if scope not in scopes or member not in members]
+    if not added and not removed:
+        return
+
+    pipeline = redis.pipeline()
+    for scope, member in added:
+        pipeline.hincrby(MEMBERS_KEY.format(scope=scope), member, 1)
+        pipeline.hget(SCORES_KEY.format(scope=scope), member)
+    for scope, member in removed:
+        pipeline.hincrby(MEMBERS_KEY.format(scope=scope), member, -1)
+    if members:
+        pipeline.hset(SOURCES_KEY, key, json.dumps([scopes, members]))
+    else:
+        pipeline.hdel(SOURCES_KEY, key)
+    results = pipeline.execute()
+
+    pipeline = redis.pipeline()
+    for index, (scope, member) in enumerate(added):
+        count, score = results[index * 2], results[index * 2 + 1]
+        if count == 1:
+            for prefix in prefixes(_split(member)[1]):
+                pipeline.zadd(PREFIX_KEY.format(scope=scope, prefix=prefix), {member: -int(score or 0)})
+    for index, (scope, member) in enumerate(removed):
+        if results[len(added) * 2 + index] <= 0:
+            for prefix in prefixes(_split(member)[1]):
+                pipeline.zrem(PREFIX_KEY.format(scope=scope, prefix=prefix), member)
+            pipeline.hdel(MEMBERS_KEY.format(scope=scope), member)
+            pipeline.hdel(SCORES_KEY.format(scope=scope), member)
+    pipeline.execute()
+
+
+def remove_source(label, pk):
+    index_source(label, pk, None, [])
+
+
+def record_booking(country_code, members, amount=1):
+    """Raise the popularity of the given terms, e.g. for a new appointment."""
+    pipeline = _redis().pipeline()
+    for scope in _scopes(country_code):
+        for member in members:
+            pipeline.hincrby(SCORES_KEY.format(scope=scope), member, amount)
+            for prefix in prefixes(_split(member)[1]):
+                # XX: a term that is not indexed is not added by a booking.
+                pipeline.zadd(PREFIX_KEY.format(scope=scope, prefix=prefix), {member: -amount}, xx=True, incr=True)
+    pipeline.execute()
+
+
+def autocomplete(query, country_code=None, limit=None):
+    """Most booked terms starting with `query` (or with a later word matching it), as dicts of term and type."""
+    normalized = normalize(query or '')
+    if not normalized:
+        return []
+    limit = limit or settings.AUTOCOMPLETE_LIMIT
+    scope = country_code.lower() if country_code else ALL_COUNTRIES
+    prefix = normalized[:settings.AUTOCOMPLETE_MAX_PREFIX].rstrip()
+    truncated = prefix != normalized
+    members = _redis().zrange(PREFIX_KEY.format(scope=scope, prefix=prefix), 0, (limit * 5 if truncated else limit) - 1)
+
+    results = []
+    for member in members:
+        kind, term = _split(member.decode())
+        # Queries longer than the indexed prefixes are checked against the whole term.
+        if truncated and normalized not in normalize(term):
+            continue
+        results.append({'term': term, 'type': kind})
+        if len(results) == limit:
+            break
+    return results
+
+
+def _rebuild_key(key):
+    return REBUILD_PREFIX + key[len(KEY_PREFIX):]
+
+
+def rebuild_index():
+    """
+    Build the whole index again from the database, with booking counts as
+    popularity. It is written aside and swapped in atomically, lookups see
+    the old index until then. Changes indexed during the rebuild are lost.
+    """
+    sources = {}
+    for pk, name, amenities, country_code, bookings in Saloon.objects.annotate(
+        bookings=Count('appointment', distinct=True)
+    ).values_list('pk', 'name', 'amenities', 'country__code', 'bookings').iterator():
+        sources[f"saloon:{pk}"] = (country_code, saloon_members(name, amenities), bookings)
+    for pk, name, country_code, bookings in Service.objects.annotate(
+        bookings=Count('appointment', distinct=True)
+    ).values_list('pk', 'name', 'saloon__country__code', 'bookings').iterator():
+        sources[f"service:{pk}"] = (country_code, [f"service|{name}"], bookings)
+    for pk, name, country_code, bookings in ServiceVariation.objects.annotate(
+        bookings=Count('appointments', distinct=True)
+    ).values_list('pk', 'name', 'service__saloon__country__code', 'bookings').iterator():
+        sources[f"service_variation:{pk}"] = (country_code, [f"service_variation|{name}"], bookings)
+
+    counts = {}
+    scores = {}
+    for country_code, members, bookings in sources.values():
+        for scope in _scopes(country_code):
+            for member in members:
+                counts[(scope, member)] = counts.get((scope, member), 0) + 1
+                scores[(scope, member)] = scores.get((scope, member), 0) + bookings
+
+    prefix_sets = {}
+    for (scope, member), score in scores.items():
+        for prefix in prefixes(_split(member)[1]):
+            prefix_sets.setdefault(PREFIX_KEY.format(scope=scope, prefix=prefix), {})[member] = -score
+
+    redis = _redis()
+    pipeline = redis.pipeline(transaction=False)
+
+    def flush():
+        if len(pipeline) >= REBUILD_BATCH_SIZE:
+            pipeline.execute()
+
+    # Leftovers of an interrupted rebuild.
+    leftovers = list(redis.scan_iter(REBUILD_PREFIX + '*', count=REBUILD_BATCH_SIZE))
+    for start in range(0, len(leftovers), REBUILD_BATCH_SIZE):
+        pipeline.unlink(*leftovers[start:start + REBUILD_BATCH_SIZE])
+    keys = set()
+    for (scope, member), count in counts.items():
+        keys.update((MEMBERS_KEY.format(scope=scope), SCORES_KEY.format(scope=scope)))
+        pipeline.hset(_rebuild_key(MEMBERS_KEY.format(scope=scope)), member, count)
+        pipeline.hset(_rebuild_key(SCORES_KEY.format(scope=scope)), member, scores[(scope, member)])
+        flush()
+    for key, (country_code, members, bookings) in sources.items():
+        keys.add(SOURCES_KEY)
+        pipeline.hset(_rebuild_key(SOURCES_KEY), key, json.dumps([_scopes(country_code), members]))
+        flush()
+    for key, members in prefix_sets.items():
+        keys.add(key)
+        pipeline.zadd(_rebuild_key(key), members)
+        flush()
+    pipeline.execute()
+
+    # RENAME replaces a live key, live keys the new index has no
+    # counterpart for are dropped, all in one MULTI/EXEC.
+    stale = [key for key in redis.scan_iter(KEY_PATTERN, count=REBUILD_BATCH_SIZE) if key.decode() not in keys]
+    swap = redis.pipeline(transaction=True)
+    for start in range(0, len(stale), REBUILD_BATCH_SIZE):
+        swap.unlink(*stale[start:start + REBUILD_BATCH_SIZE])
+    for key in keys:
+        swap.rename(_rebuild_key(key), key)
+    swap.execute()
+    return len(sources), len(prefix_sets)
+
+
+__all__ = [
+    "autocomplete",
+    "index_source",
+    "rebuild_index",
+    "record_booking",
+    "remove_source",
+    "saloon_members",
+]
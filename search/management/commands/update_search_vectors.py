@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from search.search import SEARCH_VECTORS, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored full-text search vectors, e.g. after a bulk import or a change of SEARCH_TEXT_CONFIG."
+
+    def handle(self, *args, **options):
+        for model in SEARCH_VECTORS:
+            updated = update_search_vectors(model)
+            self.stdout.write(f"{model.__name__}: {updated} rows updated.")
+        self.stdout.write(self.style.SUCCESS("Search vectors are up to date."))
@@ -149,22 +149,236 @@
 
 #     return response if response else None
 # Optimized search.py
-from django.db.models import Q, Count, Avg, OuterRef, Subquery
+import json
+import operator
+from functools import reduce
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db.models import Q, Count, Avg, F, FloatField, OuterRef, Subquery
+from django.db.models.expressions import OrderBy
 from saloons.models import Saloon
 from services.models import Service, ServiceVariation
 from staffs.models import Staff
 from appointments.models import Appointment
-from django.db.models.functions import Coalesce
+from django.db.models.functions import Cast, Coalesce
 from core.utils.normalize_text import normalize_amenity
-
-def search(query=None, price_min=None, price_max=None, preferences=None, location=None, country_id=None, amenities=None, sort_price=None, discount_percentage=None, ratings=None):
+from core.utils.geo import nearby
+
+
+def search_vector(*weighted_fields):
+    vector = None
+    for field, weight in weighted_fields:
+        part = SearchVector(field, weight=weight, config=settings.SEARCH_TEXT_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+# Stored search_vector column of each searchable model and what it is built from.
+SEARCH_VECTORS = {
+    Saloon: lambda: search_vector(('name', 'A'), ('address', 'B'), ('short_description', 'B'), ('long_description', 'C')),
+    Service: lambda: search_vector(('name', 'A'), ('description', 'B')),
+    Staff: lambda: search_vector(('name', 'A'), ('description', 'B')),
+    ServiceVariation: lambda: search_vector(('name', 'A'), ('description', 'B')),
+}
+
+
+def update_search_vectors(model, pks=None):
+    """Recompute the stored search vector of the given rows, or of every row."""
+    queryset = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    return queryset.update(search_vector=SEARCH_VECTORS[model]())
+
+
+def ranked(queryset, query):
+    """
+    Rows whose stored search vector matches the query, or whose name is
+    trigram-similar to it for misspellings, best matches first. Both
+    conditions are served by GIN indexes.
+    """
+    search_query = SearchQuery(query, search_type='websearch', config=settings.SEARCH_TEXT_CONFIG)
+    return queryset.filter(
+        Q(search_vector=search_query) | Q(name__trigram_similar=query)
+    ).annotate(
+        # Both are real, as double precision the values a page cursor
+        # holds compare equal to the rows they were read from.
+        rank=Cast(SearchRank(F('search_vector'), search_query), FloatField()),
+        similarity=Cast(TrigramSimilarity('name', query), FloatField()),
+    ).order_by('-rank', '-similarity')
+
+
+SEARCH_SECTIONS = ('saloons', 'services', 'staff', 'service_variations')
+
+# Field of each section referencing the saloon a row belongs to.
+SALOON_FIELDS = {
+    'saloons': 'pk',
+    'services': 'saloon_id',
+    'staff': 'saloon_id',
+    'service_variations': 'service__saloon_id',
+}
+
+
+def sort_keys(queryset):
+    """
+    [(expression, descending)] a section is ordered by, pk last so that
+    every row has a distinct key.
+    """
+    keys = []
+    for order in queryset.query.order_by or queryset.model._meta.ordering:
+        if isinstance(order, str):
+            keys.append((F(order.lstrip('-')), order.startswith('-')))
+        elif isinstance(order, OrderBy):
+            keys.append((order.expression, order.descending))
+        else:
+            keys.append((order, False))
+    return keys + [(F('pk'), False)]
+
+
+def keyset_filter(names, descending, values):
+    """
+    Rows sorted after `values`, compared key by key in the order of
+    page(), where nulls come last.
+    """
+    after = []
+    equal = Q()
+    for name, desc, value in zip(names, descending, values):
+        if value is None:
+            # Nothing sorts after a null but another null.
+            equal &= Q(**{f'{name}__isnull': True})
+            continue
+        after.append(equal & (Q(**{f'{name}__lt' if desc else f'{name}__gt': value}) | Q(**{f'{name}__isnull': True})))
+        equal &= Q(**{name: value})
+    return reduce(operator.or_, after)
+
+
+class CursorSerializer(object):
+    """JSON of the sort key of a row, decimals and UUIDs as strings."""
+
+    def dumps(self, obj):
+        return json.dumps(obj, cls=DjangoJSONEncoder, separators=(',', ':')).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+class SearchResults(object):
+    """
+    The unevaluated result queryset of every section. Nothing is queried
+    until a page of a section is read, so sections a caller does not ask
+    for cost nothing. With `distances`, {saloon pk: km}, every section is
+    sorted nearest saloon first.
+
+    Pages are keyset paginated: a cursor holds the sort key of the last
+    row of a page, and the next page starts after it. Its cost does not
+    grow with the page number, and rows added or removed meanwhile do not
+    shift the following pages.
+    """
+
+    def __init__(self, sections, distances=None):
+        self.sections = sections
+        self.distances = distances
+
+    def __contains__(self, section):
+        return section in self.sections
+
+    def __getitem__(self, section):
+        return self.sections[section]
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __bool__(self):
+        return any(self.sections[section].exists() for section in self.sections)
+
+    def cursor_salt(self, section):
+        # A cursor is only valid for the section and order it was made for.
+        if self.distances is not None:
+            order = 'distance'
+        else:
+            order = ','.join(f"{'-' if desc else ''}{expression}" for expression, desc in sort_keys(self.sections[section]))
+        return f'search.cursor:{section}:{order}'
+
+    def encode_cursor(self, section, key):
+        return signing.dumps(key, salt=self.cursor_salt(section), serializer=CursorSerializer, compress=True)
+
+    def decode_cursor(self, section, cursor):
+        """Sort key held by a cursor of page(), ValueError if it is not one."""
+        try:
+            return signing.loads(cursor, salt=self.cursor_salt(section), serializer=CursorSerializer)
+        except signing.BadSignature:
+            raise ValueError("Invalid cursor.")
+
+    def page(self, section, cursor=None, limit=None):
+        """
+        (rows, next cursor) of one section, the cursor is None on the last
+        page. One query, a row past the page tells whether there is more.
+        """
+        limit = limit or settings.SEARCH_SECTION_LIMIT
+        if self.distances is not None:
+            return self.page_by_distance(section, cursor, limit)
+        keys = sort_keys(self.sections[section])
+        names = [f'cursor_key_{index}' for index in range(len(keys))]
+        descending = [desc for _, desc in keys]
+        queryset = self.sections[section].annotate(
+            **{name: expression for name, (expression, _) in zip(names, keys)}
+        ).order_by(*[
+            F(name).desc(nulls_last=True) if desc else F(name).asc(nulls_last=True)
+            for name, desc in zip(names, descending)
+        ])
+        if cursor:
+            queryset = queryset.filter(keyset_filter(names, descending, self.decode_cursor(section, cursor)))
+        rows = list(queryset[:limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = self.encode_cursor(section, [getattr(rows[limit - 1], name) for name in names])
+        return rows[:limit], next_cursor
+
+    def page_by_distance(self, section, cursor, limit):
+        """
+        Like page(), nearest saloon first. The nearby saloons past the cursor
+        are sorted in memory, then (pk, saloon) of the section is read for
+        the nearest of them only, limit + 1 saloons at first and twice as
+        many each time that gives too few rows. The rows of the page are
+        then loaded by pk. A page costs a few queries over the saloons it
+        reaches rather than over the whole radius.
+        """
+        queryset = self.sections[section]
+        field = SALOON_FIELDS[section]
+        last = tuple(self.decode_cursor(section, cursor)) if cursor else None
+        saloons = sorted(self.distances.items(), key=lambda item: item[1])
+        if last is not None:
+            saloons = [item for item in saloons if item[1] >= last[0]]
+
+        keys = []
+        start, size = 0, limit + 1
+        while len(keys) <= limit and start < len(saloons):
+            end = min(start + size, len(saloons))
+            # Rows of saloons at the same distance interleave, read them together.
+            while end < len(saloons) and saloons[end][1] == saloons[end - 1][1]:
+                end += 1
+            chunk = dict(saloons[start:end])
+            keys += sorted(
+                key for key in (
+                    (chunk[saloon_id], str(pk), pk)
+                    for pk, saloon_id in queryset.order_by().filter(**{f'{field}__in': chunk}).values_list('pk', field)
+                )
+                if last is None or key[:2] > last
+            )
+            start, size = end, size * 2
+        keys = keys[:limit + 1]
+        rows = queryset.in_bulk([pk for _, _, pk in keys[:limit]])
+        next_cursor = self.encode_cursor(section, list(keys[limit - 1][:2])) if len(keys) > limit else None
+        return [rows[pk] for _, _, pk in keys[:limit] if pk in rows], next_cursor
+
+
+def search(query=None, price_min=None, price_max=None, preferences=None, location=None, country_id=None, amenities=None, sort_price=None, discount_percentage=None, ratings=None, full_text=True, lat=None, lng=None, radius_km=None, sort=None):
     saloon_filters = Q()
     service_filters = Q()
     staff_filters = Q()
     service_variation_filters = Q()
 
     # Prepare filters
-    if query:
+    if query and not full_text:
         saloon_filters |= Q(name__icontains=query) | Q(short_description__icontains=query) | Q(long_description__icontains=query) | Q(address__icontains=query)
         service_filters |= Q(name__icontains=query) | Q(description__icontains=query)
         staff_filters |= Q(name__icontains=query) | Q(description__icontains=query)
@@ -174,7 +388,7 @@ def search(query=None, price_min=None, price_max=None, preferences=None, locatio
         saloon_filters &= Q(address__icontains=location)
         service_filters &= Q(saloon__address__icontains=location)
         staff_filters &= Q(saloon__address__icontains=location)
-        service_variation_filters &= Q(saloon__address__icontains=location)
+        service_variation_filters &= Q(service__saloon__address__icontains=location)
 
     if country_id:
         saloon_filters &= Q(country_id=country_id)
@@ -185,43 +399,62 @@ def search(query=None, price_min=None, price_max=None, preferences=None, locatio
             normalized_amenity = normalize_amenity(amenity)
             saloon_filters &= Q(amenities__contains=[normalized_amenity])
 
+    # Saloons within radius_km from the H3 cell index, everything else is
+    # restricted to them.
+    distances = None
+    if lat is not None and lng is not None:
+        distances = dict(nearby(Saloon.objects.all(), lat, lng, radius_km))
+        saloon_filters &= Q(pk__in=distances)
+        service_filters &= Q(saloon_id__in=distances)
+        staff_filters &= Q(saloon_id__in=distances)
+        service_variation_filters &= Q(service__saloon_id__in=distances)
+
+    saloon_results = Saloon.objects.filter(saloon_filters).prefetch_related('reviews')
+    service_results = Service.objects.filter(service_filters).only('name', 'description')
+    staff_results = Staff.objects.filter(staff_filters).select_related('saloon')
+    service_variation_results = ServiceVariation.objects.filter(service_variation_filters)
+
+    if query and full_text:
+        saloon_results = ranked(saloon_results, query)
+        service_results = ranked(service_results, query)
+        staff_results = ranked(staff_results, query)
+        service_variation_results = ranked(service_variation_results, query)
+
     if ratings:
-        saloon_results = Saloon.objects.annotate(average_rating=Avg('reviews__rating')).filter(average_rating__gte=ratings)
-    else:
-        saloon_results = Saloon.objects.filter(saloon_filters)
+        saloon_results = saloon_results.annotate(average_rating=Avg('reviews__rating')).filter(average_rating__gte=ratings)
 
     if preferences == 'popular':
         saloon_results = saloon_results.annotate(appointment_count=Count('appointment')).order_by('-appointment_count')
 
-    service_results = Service.objects.filter(service_filters).only('name', 'description')
-    staff_results = Staff.objects.filter(staff_filters).select_related('saloon')
-
     if price_min is not None:
-        service_variation_filters &= (
+        service_variation_results = service_variation_results.filter(
             Q(discount_price__gte=price_min) | Q(discount_price__isnull=True, price__gte=price_min)
         )
 
     if price_max is not None:
-        service_variation_filters &= (
+        service_variation_results = service_variation_results.filter(
             Q(discount_price__lte=price_max) | Q(discount_price__isnull=True, price__lte=price_max)
         )
 
     if sort_price:
         if sort_price == 'low_to_high':
-            service_variation_results = ServiceVariation.objects.filter(service_variation_filters).order_by(Coalesce('discount_price', 'price'))
+            service_variation_results = service_variation_results.order_by(Coalesce('discount_price', 'price'))
         else:
-            service_variation_results = ServiceVariation.objects.filter(service_variation_filters).order_by('-price')
+            service_variation_results = service_variation_results.order_by('-price')
     else:
-        service_variation_results = ServiceVariation.objects.filter(service_variation_filters).only('name', 'description', 'price', 'discount_price')
+        service_variation_results = service_variation_results.only('name', 'description', 'price', 'discount_price')
 
     if discount_percentage:
-        service_variation_results = [
-            sv for sv in service_variation_results if sv.discount_price and ((sv.price - sv.discount_price) / sv.price) * 100 <= int(discount_percentage.split('_')[-1])
-        ]
+        # (price - discount_price) / price * 100 <= N, filtered in the database.
+        max_discount = int(discount_percentage.split('_')[-1])
+        service_variation_results = service_variation_results.filter(
+            discount_price__gt=0,
+            discount_price__gte=F('price') * (100 - max_discount) / 100,
+        )
 
-    return {
+    return SearchResults({
         'saloons': saloon_results,
         'services': service_results,
         'staff': staff_results,
         'service_variations': service_variation_results
-    } if any([saloon_results, service_results, staff_results, service_variation_results]) else None
+    }, distances=distances if sort == 'distance' else None)
@@ -0,0 +1,132 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+from appointments.models import Appointment
+from saloons.models import Saloon
+from services.models import Service, ServiceVariation
+from staffs.models import Staff
+from . import autocomplete
+from .search import update_search_vectors
+from .suggestions import SUGGESTION_MODELS, publish_change
+
+SUGGESTION_LABELS = {model: label for label, model in SUGGESTION_MODELS.items()}
+
+
+@receiver(post_save, sender=Saloon)
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=Staff)
+@receiver(post_save, sender=ServiceVariation)
+def refresh_search_vector(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # A queryset update, so this does not send post_save again.
+    update_search_vectors(sender, [instance.pk])
+
+
+@receiver(post_init, sender=Saloon)
+@receiver(post_init, sender=Service)
+@receiver(post_init, sender=ServiceVariation)
+def remember_name(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred name is not loaded.
+    instance._published_name = instance.__dict__.get('name')
+
+
+@receiver(post_save, sender=Saloon)
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=ServiceVariation)
+def publish_name(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'name' not in update_fields):
+        return
+    # Saves that leave the name alone, e.g. Service.update_durations() on
+    # every variation edit, would make each worker apply a no-op change.
+    if not created and instance.name == instance._published_name:
+        return
+    instance._published_name = instance.name
+    label, pk, name = SUGGESTION_LABELS[sender], instance.pk, instance.name
+    transaction.on_commit(lambda: publish_change(label, pk, name))
+
+
+@receiver(post_delete, sender=Saloon)
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=ServiceVariation)
+def publish_removal(sender, instance, **kwargs):
+    label, pk = SUGGESTION_LABELS[sender], instance.pk
+    transaction.on_commit(lambda: publish_change(label, pk, None))
+
+
+def index_saloon(pk):
+    saloon = Saloon.objects.filter(pk=pk).values_list('name', 'amenities', 'country__code').first()
+    if saloon is not None:
+        name, amenities, country_code = saloon
+        autocomplete.index_source('saloon', pk, country_code, autocomplete.saloon_members(name, amenities))
+
+
+def index_service(pk):
+    service = Service.objects.filter(pk=pk).values_list('name', 'saloon__country__code').first()
+    if service is not None:
+        name, country_code = service
+        autocomplete.index_source('service', pk, country_code, [f"service|{name}"])
+
+
+def index_service_variation(pk):
+    variation = ServiceVariation.objects.filter(pk=pk).values_list('name', 'service__saloon__country__code').first()
+    if variation is not None:
+        name, country_code = variation
+        autocomplete.index_source('service_variation', pk, country_code, [f"service_variation|{name}"])
+
+
+AUTOCOMPLETE_INDEXERS = {
+    Saloon: index_saloon,
+    Service: index_service,
+    ServiceVariation: index_service_variation,
+}
+
+
+@receiver(post_save, sender=Saloon)
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=ServiceVariation)
+def index_autocomplete(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    indexer, pk = AUTOCOMPLETE_INDEXERS[sender], instance.pk
+    transaction.on_commit(lambda: indexer(pk))
+
+
+@receiver(post_delete, sender=Saloon)
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=ServiceVariation)
+def unindex_autocomplete(sender, instance, **kwargs):
+    label, pk = SUGGESTION_LABELS[sender], instance.pk
+    transaction.on_commit(lambda: autocomplete.remove_source(label, pk))
+
+
+def record_appointment(pk):
+    appointment = Appointment.objects.filter(pk=pk).values_list(
+        'saloon__name', 'saloon__amenities', 'saloon__country__code', 'service__name'
+    ).first()
+    if appointment is not None:
+        saloon_name, amenities, country_code, service_name = appointment
+        members = autocomplete.saloon_members(saloon_name, amenities)
+        if service_name:
+            members.append(f"service|{service_name}")
+        autocomplete.record_booking(country_code, members)
+
+
+def record_appointment_variations(pk, variation_ids):
+    variations = ServiceVariation.objects.filter(pk__in=variation_ids).values_list('name', flat=True)
+    country_code = Appointment.objects.filter(pk=pk).values_list('saloon__country__code', flat=True).first()
+    autocomplete.record_booking(country_code, [f"service_variation|{name}" for name in variations])
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_booked(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: record_appointment(pk))
+
+
+@receiver(m2m_changed, sender=Appointment.service_variation.through)
+def appointment_variations_booked(sender, instance, action, pk_set=None, reverse=False, **kwargs):
+    if action == 'post_add' and not reverse and pk_set:
+        pk, variation_ids = instance.pk, list(pk_set)
+        transaction.on_commit(lambda: record_appointment_variations(pk, variation_ids))
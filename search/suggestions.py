@@ -0,0 +1,182 @@
+import json
+import sys
+import threading
+import time
+from django.conf import settings
+from django_redis import get_redis_connection
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+from saloons.models import Saloon
+from services.models import Service, ServiceVariation
+
+VERSION_KEY = "search:suggestions:version"
+CHANGES_KEY = "search:suggestions:changes"
+
+# Bump the version and append the change stamped with it in one step, so a
+# reader never sees a version whose change is not in the log yet.
+# KEYS: version, change log. ARGV: label, pk, name (JSON), log size.
+PUBLISH_CHANGE_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+redis.call('RPUSH', KEYS[2], '[' .. version .. ',' .. ARGV[1] .. ',' .. ARGV[2] .. ',' .. ARGV[3] .. ']')
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[4]), -1)
+return version
+"""
+
+_publish_change = None
+
+# Models whose names are suggested, keyed by the label used in the change log.
+SUGGESTION_MODELS = {
+    'saloon': Saloon,
+    'service': Service,
+    'service_variation': ServiceVariation,
+}
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def publish_change(label, pk, name):
+    """
+    Record that the name of a row changed (None when it was deleted) and
+    bump the shared version, so every worker applies it on its next lookup.
+    """
+    global _publish_change
+    if _publish_change is None:
+        _publish_change = _redis().register_script(PUBLISH_CHANGE_SCRIPT)
+    return _publish_change(
+        keys=[VERSION_KEY, CHANGES_KEY],
+        args=[json.dumps(label), json.dumps(str(pk)), json.dumps(name), settings.SUGGESTION_CHANGE_LOG_SIZE],
+    )
+
+
+class SuggestionIndex:
+    """
+    Distinct saloon, service and variation names with their normalized form
+    precomputed, held in memory by each worker. Lookups compare against the
+    normalized choices only; row changes are applied incrementally from the
+    shared change log and the index is rebuilt only when it fell too far
+    behind.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = {}
+        self.counts = {}
+        # Normalized form of every distinct name, computed once per name.
+        self.processed = {}
+        # (display terms, normalized choices), swapped as one object.
+        self.entries = ([], [])
+        self.version = None
+        self.build_time = None
+        self.built_at = None
+        self.changes_applied = 0
+
+    def build(self):
+        started = time.perf_counter()
+        version = int(_redis().get(VERSION_KEY) or 0)
+        names = {}
+        for label, model in SUGGESTION_MODELS.items():
+            for pk, name in model.objects.values_list('pk', 'name').iterator():
+                names[(label, str(pk))] = name
+        counts = {}
+        for name in names.values():
+            counts[name] = counts.get(name, 0) + 1
+
+        self.names, self.counts, self.version = names, counts, version
+        self.processed = {name: default_process(name) for name in counts if name}
+        self._refresh_choices()
+        self.build_time = time.perf_counter() - started
+        self.built_at = time.time()
+        self.changes_applied = 0
+
+    def _refresh_choices(self):
+        terms = list(self.processed)
+        self.entries = (terms, [self.processed[term] for term in terms])
+
+    def _apply(self, label, pk, name):
+        """Apply one change, only a name that is new to the index is normalized."""
+        old = self.names.pop((label, pk), None)
+        if old is not None:
+            self.counts[old] -= 1
+            if not self.counts[old]:
+                del self.counts[old]
+                self.processed.pop(old, None)
+        if name is not None:
+            self.names[(label, pk)] = name
+            self.counts[name] = self.counts.get(name, 0) + 1
+            if name and name not in self.processed:
+                self.processed[name] = default_process(name)
+
+    def sync(self):
+        """Bring the index up to the shared version, one Redis round trip when nothing changed."""
+        redis = _redis()
+        version = int(redis.get(VERSION_KEY) or 0)
+        if self.version is not None and version == self.version:
+            return
+        with self.lock:
+            if self.version is None or version < self.version:
+                self.build()
+                return
+            if version == self.version:
+                return
+            changes = [json.loads(change) for change in redis.lrange(CHANGES_KEY, 0, -1)]
+            pending = [change for change in changes if change[0] > self.version]
+            # The log was trimmed past our version, some changes are lost.
+            if not pending or pending[0][0] != self.version + 1:
+                self.build()
+                return
+            for change_version, label, pk, name in pending:
+                self._apply(label, pk, name)
+            self._refresh_choices()
+            self.version = pending[-1][0]
+            self.changes_applied += len(pending)
+
+    def extract(self, query, limit=None, score_cutoff=None):
+        self.sync()
+        terms, choices = self.entries
+        matches = process.extract(
+            default_process(query),
+            choices,
+            scorer=fuzz.WRatio,
+            processor=None,
+            limit=limit or settings.SUGGESTION_LIMIT,
+            score_cutoff=settings.SUGGESTION_SCORE_CUTOFF if score_cutoff is None else score_cutoff,
+        )
+        return [terms[index] for _, _, index in matches]
+
+    def stats(self):
+        terms, choices = self.entries
+        memory = (
+            sys.getsizeof(terms) + sys.getsizeof(choices) + sys.getsizeof(self.names) + sys.getsizeof(self.counts)
+            + sum(sys.getsizeof(term) for term in terms) + sum(sys.getsizeof(choice) for choice in choices)
+        )
+        return {
+            'terms': len(terms),
+            'rows': len(self.names),
+            'version': self.version,
+            'build_time_ms': round(self.build_time * 1000, 1) if self.build_time is not None else None,
+            'built_at': self.built_at,
+            'changes_applied': self.changes_applied,
+            'memory_bytes': memory,
+        }
+
+
+_index = SuggestionIndex()
+
+
+def get_suggestions(query, limit=None):
+    return _index.extract(query, limit)
+
+
+def get_index_stats():
+    _index.sync()
+    return _index.stats()
+
+
+__all__ = [
+    "SUGGESTION_MODELS",
+    "get_index_stats",
+    "get_suggestions",
+    "publish_change",
+]
@@ -1,3 +1,81 @@
-from django.test import TestCase
+from unittest import mock
+from django.test import SimpleTestCase
+from rapidfuzz.utils import default_process
+from services.models import Service
+from .search import SearchResults
+from .signals import publish_name
+from .suggestions import SuggestionIndex
 
-# Create your tests here.
+
+class PublishNameTests(SimpleTestCase):
+    def publish(self, instance, **kwargs):
+        with mock.patch('search.signals.transaction.on_commit') as on_commit:
+            publish_name(Service, instance, **kwargs)
+        return on_commit.call_count
+
+    def test_created_row_is_published(self):
+        self.assertEqual(self.publish(Service(name='Haircut'), created=True), 1)
+
+    def test_save_without_name_change_is_not_published(self):
+        service = Service(name='Haircut')
+        self.assertEqual(self.publish(service), 0)
+        service.name = 'Beard trim'
+        self.assertEqual(self.publish(service), 1)
+        self.assertEqual(self.publish(service), 0)
+
+
+class SuggestionIndexTests(SimpleTestCase):
+    def test_changes_normalize_only_new_names(self):
+        index = SuggestionIndex()
+        index._apply('service', '1', 'Haircut')
+        index._apply('service', '2', 'Haircut')
+        with mock.patch('search.suggestions.default_process', side_effect=default_process) as process:
+            index._apply('service', '1', 'Beard Trim')
+            index._apply('service', '2', None)
+        self.assertEqual([call.args for call in process.call_args_list], [('Beard Trim',)])
+        index._refresh_choices()
+        self.assertEqual(index.entries, (['Beard Trim'], ['beard trim']))
+
+
+class SectionStub(object):
+    """(pk, saloon id) rows of a section, with the queryset calls page_by_distance() makes."""
+
+    def __init__(self, rows, saloons=None):
+        self.rows = rows
+        self.saloons = saloons
+        self.reads = []
+
+    def order_by(self, *ordering):
+        return self
+
+    def filter(self, **lookups):
+        (saloons,) = lookups.values()
+        self.reads.append(set(saloons))
+        return SectionStub(self.rows, set(saloons))
+
+    def values_list(self, *fields):
+        return [(pk, saloon_id) for pk, saloon_id in self.rows if saloon_id in self.saloons]
+
+    def in_bulk(self, pks):
+        return {pk: pk for pk in pks}
+
+
+class DistancePageTests(SimpleTestCase):
+    def test_pages_follow_distance_then_pk_without_repeats(self):
+        distances = {'a': 2.0, 'b': 1.0, 'c': 3.0, 'd': 1.0}
+        section = SectionStub([(1, 'a'), (2, 'b'), (3, 'a'), (4, 'c'), (5, 'd'), (6, 'b')])
+        results = SearchResults({'services': section}, distances=distances)
+        pages, cursor = [], None
+        while True:
+            rows, cursor = results.page('services', cursor, 2)
+            pages.append(rows)
+            if cursor is None:
+                break
+        self.assertEqual(pages, [[2, 5], [6, 1], [3, 4]])
+
+    def test_reads_only_the_nearest_saloons(self):
+        distances = {f's{index}': float(index) for index in range(100)}
+        section = SectionStub([(index, f's{index}') for index in range(100)])
+        rows, cursor = SearchResults({'saloons': section}, distances=distances).page('saloons', None, 3)
+        self.assertEqual(rows, [0, 1, 2])
+        self.assertEqual(section.reads, [{'s0', 's1', 's2', 's3'}])
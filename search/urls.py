@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import SearchView, SimilarTermsView
+from .views import SearchView, SimilarTermsView, SuggestionIndexStatsView, AutocompleteView
 
 urlpatterns = [
     path('search/', SearchView.as_view(), name='saloon_search'),
     path('similar/', SimilarTermsView.as_view(), name='similar_terms'),
+    path('similar/stats/', SuggestionIndexStatsView.as_view(), name='similar_terms_stats'),
+    path('autocomplete/', AutocompleteView.as_view(), name='autocomplete'),
 ]
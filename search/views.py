@@ -76,21 +76,60 @@
 
 #         return Response({'similar_terms': suggestions}, status=status.HTTP_200_OK)
 
+import json
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from saloons.models import Saloon
-from services.models import Service, ServiceVariation
+from rest_framework.permissions import IsAdminUser
 from rest_framework.generics import GenericAPIView
-from .search import search
-from fuzzywuzzy import process
+from .search import SEARCH_SECTIONS, search
+from .suggestions import get_index_stats, get_suggestions
+from .autocomplete import autocomplete
+from core.utils.geo import parse_location
 from saloons.serializers import SaloonSerializer
 from services.serializers import SearchServiceSerializer, NestedServiceVariationSerializer
 from staffs.serializers import StaffSerializer
 
 class SearchView(GenericAPIView):
+    """
+    Search saloons, services, staff and variations. Each section is paged
+    on its own: `limit` rows per section and a `<section>_cursor` taken from
+    `next` for the following page (keyset pagination, a cursor is only
+    valid for the query it came from); `sections` picks which sections to
+    return, the others are never queried. With `stream=true` the sections
+    are sent as NDJSON, one line per section as soon as it is ready.
+    """
+    section_serializers = {
+        'saloons': SaloonSerializer,
+        'services': SearchServiceSerializer,
+        'staff': StaffSerializer,
+        'service_variations': NestedServiceVariationSerializer,
+    }
+
     def get(self, request, *args, **kwargs):
         query_params = request.query_params
+        sections = [section for section in query_params.get('sections', '').split(',') if section] or list(SEARCH_SECTIONS)
+        unknown = [section for section in sections if section not in SEARCH_SECTIONS]
+        if unknown:
+            return Response({'message': f"Unknown sections: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        cursors = {section: query_params.get(f'{section}_cursor') for section in sections}
+        try:
+            limit = int(query_params.get('limit', settings.SEARCH_SECTION_LIMIT))
+        except ValueError:
+            return Response({'message': 'Invalid limit.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.SEARCH_SECTION_MAX_LIMIT))
+
+        lat = lng = radius_km = None
+        if query_params.get('lat') or query_params.get('lng'):
+            try:
+                lat, lng, radius_km = parse_location(query_params.get('lat'), query_params.get('lng'), query_params.get('radius'))
+            except (TypeError, ValueError):
+                return Response({'message': 'Provide valid lat, lng and an optional radius in km.'}, status=status.HTTP_400_BAD_REQUEST)
+
         results = search(
             query=query_params.get('query'),
             price_min=query_params.get('price_min'),
@@ -101,21 +140,43 @@ class SearchView(GenericAPIView):
             amenities=query_params.getlist('amenities[]'),
             sort_price=query_params.get('sort_price'),
             discount_percentage=query_params.get('discount_percentage'),
-            ratings=query_params.get('ratings')
+            ratings=query_params.get('ratings'),
+            lat=lat,
+            lng=lng,
+            radius_km=radius_km,
+            sort=query_params.get('sort')
         )
 
-        if not results:
-            return Response({'message': 'No results found'}, status=status.HTTP_200_OK)
+        try:
+            for section in sections:
+                if cursors[section]:
+                    results.decode_cursor(section, cursors[section])
+        except ValueError:
+            return Response({'message': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        pages = (self.serialize_page(results, section, cursors[section], limit) for section in sections)
+
+        if query_params.get('stream') in ('1', 'true'):
+            lines = (
+                json.dumps({'section': section, 'results': data, 'next': next_cursor}, cls=JSONEncoder) + '\n'
+                for section, data, next_cursor in pages
+            )
+            return StreamingHttpResponse(lines, content_type='application/x-ndjson')
 
-        response_data = {
-            'saloons': SaloonSerializer(results['saloons'], many=True).data if 'saloons' in results else [],
-            'services': SearchServiceSerializer(results['services'], many=True).data if 'services' in results else [],
-            'staff': StaffSerializer(results['staff'], many=True).data if 'staff' in results else [],
-            'service_variations': NestedServiceVariationSerializer(results['service_variations'], many=True).data if 'service_variations' in results else []
-        }
+        response_data = {'next': {}}
+        for section, data, next_cursor in pages:
+            response_data[section] = data
+            response_data['next'][section] = next_cursor
+
+        if not any(response_data[section] for section in sections) and not any(cursors.values()):
+            return Response({'message': 'No results found'}, status=status.HTTP_200_OK)
 
         return Response(response_data, status=status.HTTP_200_OK)
 
+    def serialize_page(self, results, section, cursor, limit):
+        rows, next_cursor = results.page(section, cursor, limit)
+        return section, self.section_serializers[section](rows, many=True).data, next_cursor
+
 class SimilarTermsView(APIView):
     def get(self, request, *args, **kwargs):
         query = request.query_params.get('query', '')
@@ -123,12 +184,26 @@ class SimilarTermsView(APIView):
         if not query:
             return Response({'similar_terms': []}, status=status.HTTP_200_OK)
 
-        saloon_names = Saloon.objects.values_list('name', flat=True)
-        service_names = Service.objects.values_list('name', flat=True)
-        service_variation_names = ServiceVariation.objects.values_list('name', flat=True)
+        suggestions = get_suggestions(query)
+
+        return Response({'similar_terms': suggestions}, status=status.HTTP_200_OK)
 
-        all_names = set(saloon_names).union(service_names, service_variation_names)
-        similar_terms = process.extract(query, all_names, limit=10)
-        suggestions = [term for term, score in similar_terms if score > 70]
 
-        return Response({'similar_terms': suggestions}, status=status.HTTP_200_OK)
\ No newline at end of file
+class AutocompleteView(APIView):
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('query', '')
+        try:
+            limit = min(int(request.query_params.get('limit', settings.AUTOCOMPLETE_LIMIT)), settings.AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            limit = settings.AUTOCOMPLETE_LIMIT
+
+        suggestions = autocomplete(query, getattr(request, 'country_code', None), max(limit, 1))
+
+        return Response({'suggestions': suggestions}, status=status.HTTP_200_OK)
+
+
+class SuggestionIndexStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_index_stats(), status=status.HTTP_200_OK)
\ No newline at end of file
@@ -1,4 +1,6 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 import uuid
 from saloons.models import Saloon
 from django.utils.text import slugify
@@ -22,6 +24,8 @@ class Service(models.Model):
     icon = models.ImageField(upload_to='service_icons/', null=True, blank=True, help_text="Upload an icon for this service")
     created_at = models.DateTimeField(auto_now_add=True,null=True)  
     updated_at = models.DateTimeField(auto_now=True,null=True)
+    # Maintained by search.signals, see search.search.SEARCH_VECTORS
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def update_durations(self):
         variations = self.variations.all()
@@ -49,6 +53,10 @@ class Service(models.Model):
         super().save(*args, **kwargs)
     class Meta:
         unique_together = ('saloon', 'name') 
+        indexes = [
+            GinIndex(fields=['search_vector'], name='service_search_vector_idx'),
+            GinIndex(fields=['name'], name='service_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.saloon.name}"
@@ -74,6 +82,14 @@ class ServiceVariation(models.Model):
     duration =models.DurationField(help_text="Duration of the service (e.g., 1 hour, 30 minutes)")
     price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Additional price for this variation",null=True, blank=True)
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Discounted price for this variation",null=True, blank=True)
+    # Maintained by search.signals, see search.search.SEARCH_VECTORS
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='variation_search_vector_idx'),
+            GinIndex(fields=['name'], name='variation_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.service.name}"
@@ -1,4 +1,6 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from saloons.models import Saloon
 from services.models import Service
 import uuid
@@ -17,6 +19,14 @@ class Staff(models.Model):
     contact_no = models.CharField(max_length=20, null=True, blank=True)
     buffer_time = models.DurationField(default=timedelta(minutes=10),null=True, blank=True)
     is_holiday = models.BooleanField(default=False)
+    # Maintained by search.signals, see search.search.SEARCH_VECTORS
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='staff_search_vector_idx'),
+            GinIndex(fields=['name'], name='staff_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
    
 
     def __str__(self):
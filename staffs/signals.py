@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core.utils.availability_bitmap import invalidate_staff
+from openinghours.models import OpeningHour
+from .models import BreakTime, Staff, WorkingDay
+
+
+def invalidate_on_commit(staff_ids):
+    staff_ids = {staff_id for staff_id in staff_ids if staff_id}
+    transaction.on_commit(lambda: [invalidate_staff(staff_id) for staff_id in staff_ids])
+
+
+@receiver([post_save, post_delete], sender=Staff)
+def staff_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=WorkingDay)
+def working_day_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.staff_id])
+
+
+@receiver([post_save, post_delete], sender=BreakTime)
+def break_time_changed(sender, instance, **kwargs):
+    invalidate_on_commit(
+        WorkingDay.objects.filter(pk=instance.working_day_id).values_list('staff_id', flat=True)
+    )
+
+
+@receiver([post_save, post_delete], sender=OpeningHour)
+def opening_hour_changed(sender, instance, **kwargs):
+    invalidate_on_commit(Staff.objects.filter(saloon_id=instance.saloon_id).values_list('pk', flat=True))
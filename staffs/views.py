@@ -3,9 +3,12 @@ from .models import Staff, WorkingDay
 from rest_framework.permissions import IsAuthenticated
 from .serializers import StaffSerializer, StaffAvailabilitySerializer, StaffListSerializer
 from core.utils.response import PrepareResponse
-from appointments.models import Appointment
+from appointments.models import Appointment, appointment_time_range
 from core.utils.pagination import CustomPageNumberPagination
 from django.db.models import Q, Count
+from datetime import datetime
+from core.utils.availability_bitmap import can_start
+from core.utils.slot_holds import overlaps_hold
 
 class StaffListCreateView(generics.GenericAPIView):
     queryset = Staff.objects.all()
@@ -69,11 +72,37 @@ class StaffAvailabilityView(generics.GenericAPIView):
             appointment_start_time = serializer.validated_data.get('start_time')
             appointment_end_time = serializer.validated_data.get('end_time')
 
-            staff = Staff.objects.filter(id=staff_id, saloon_id=saloon_id).first()
+            staff = Staff.objects.filter(id=staff_id, saloon_id=saloon_id).select_related('saloon').first()
             if not staff:
                 response = PrepareResponse(success=False, message='Staff not found in the specified saloon.')
                 return response.send(404)
 
+            if overlaps_hold(staff.pk, appointment_date, appointment_start_time, appointment_end_time):
+                response = PrepareResponse(success=False, message='Appointment time is currently held by another customer.')
+                return response.send(400)
+
+            if staff.is_holiday:
+                response = PrepareResponse(success=False, message='Staff is on holiday.')
+                return response.send(400)
+
+            overlapping_appointments = Appointment.objects.filter(
+                staff=staff,
+                time_range__overlap=appointment_time_range(
+                    appointment_date, appointment_start_time, appointment_end_time, staff.saloon.timezone
+                )
+            ).exclude(status='Cancelled')
+
+            # Fast path on the cached bitmap for working hours, breaks and
+            # closing hours. Bookings are always confirmed in the database,
+            # the bitmap misses those written by queryset updates.
+            duration = datetime.combine(appointment_date, appointment_end_time) - datetime.combine(appointment_date, appointment_start_time)
+            if can_start(staff, appointment_date, appointment_start_time, duration):
+                if overlapping_appointments.exists():
+                    response = PrepareResponse(success=False, message='Appointment time overlaps with another booking.')
+                    return response.send(400)
+                response = PrepareResponse(success=True, message='Staff is available.')
+                return response.send(200)
+
             working_day = WorkingDay.objects.filter(
                 staff=staff,
                 day_of_week=appointment_date.strftime('%A')
@@ -93,11 +122,6 @@ class StaffAvailabilityView(generics.GenericAPIView):
                     response = PrepareResponse(success=False, message='Appointment overlaps with break time.')
                     return response.send(400)
 
-            overlapping_appointments = Appointment.objects.filter(
-                staff=staff,
-                date=appointment_date
-            ).exclude(end_time__lte=appointment_start_time).exclude(start_time__gte=appointment_end_time)
-
             if overlapping_appointments.exists():
                 response = PrepareResponse(success=False, message='Appointment time overlaps with another booking.')
                 return response.send(400)
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core.utils.identity_cache import invalidate_user
+from core.utils.permissions import invalidate_user_saloon_permission
+from .models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # A deactivated, changed or removed user must not be served from the cache.
+    user_id = instance.pk
+
+    def invalidate():
+        # The permission decisions are found through the identity index,
+        # drop them before the index goes.
+        invalidate_user_saloon_permission(user_id)
+        invalidate_user(user_id)
+
+    transaction.on_commit(invalidate)
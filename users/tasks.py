@@ -0,0 +1,32 @@
+from celery import shared_task
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import InvalidToken
+from core.utils.circuit_breaker import ServiceUnavailable
+from core.utils.identity_cache import get_refresh_token, get_stale_identity, invalidate_token, clear_identity_refresh
+
+
+@shared_task(bind=True, max_retries=settings.SSO_REFRESH_MAX_RETRIES)
+def refresh_sso_identity(self, token_hash):
+    """
+    Revalidate an identity that was served stale while the SSO service was
+    unavailable, retrying with backoff a bounded number of times. The token
+    is read from the pending refresh entry, never sent through the broker.
+    """
+    from core.utils.sso_middleware import SSOAuthentication
+
+    token = get_refresh_token(token_hash)
+    if token is None:
+        return
+    if get_stale_identity(token) is None:
+        clear_identity_refresh(token_hash)
+        return
+
+    authentication = SSOAuthentication()
+    try:
+        authentication.get_validated_token(token)
+        authentication.get_or_create_user(token)
+    except ServiceUnavailable as e:
+        raise self.retry(exc=e, countdown=settings.SSO_REFRESH_RETRY_DELAY * 2 ** self.request.retries)
+    except InvalidToken:
+        invalidate_token(token)
+    clear_identity_refresh(token_hash)
@@ -1,3 +1,179 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import SimpleTestCase, override_settings
+from jwt.algorithms import RSAAlgorithm
+from core.utils import circuit_breaker, jwt_verifier
+from core.utils.circuit_breaker import CircuitBreaker, ServiceUnavailable
+from core.utils.identity_cache import cache_identity, get_cached_identity, get_stale_identity, invalidate_user
+from core.utils.permissions import get_saloon_permission, invalidate_user_saloon_permission
+from core.utils.jwt_verifier import SigningKeyUnavailable, decode_token
 
-# Create your tests here.
+
+class JWKSStub(object):
+    """Serves the public key set of a freshly generated RSA key on localhost."""
+
+    def __init__(self, kid='test-key'):
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = RSAAlgorithm.to_jwk(self.private_key.public_key(), as_dict=True)
+        jwk.update(kid=kid, use='sig', alg='RS256')
+        body = json.dumps({'keys': [jwk]}).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/auth/jwks/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def token(self, kid=None, **claims):
+        claims.setdefault('exp', int(time.time()) + 300)
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': kid or self.kid})
+
+
+class LocalTokenVerificationTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.jwks = JWKSStub()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.jwks.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        jwt_verifier._jwk_client = None
+        jwt_verifier._jwks_unavailable_until = 0
+        self.addCleanup(setattr, jwt_verifier, '_jwk_client', None)
+        self.addCleanup(setattr, jwt_verifier, '_jwks_unavailable_until', 0)
+        settings = override_settings(
+            SSO_JWKS_URL=self.jwks.url, SSO_JWT_PUBLIC_KEY=None, SSO_JWT_AUDIENCE=None, SSO_JWT_ISSUER=None
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_decodes_token_signed_by_published_key(self):
+        claims = decode_token(self.jwks.token(sub='42', aud='moresaloon'))
+        self.assertEqual(claims['sub'], '42')
+
+    def test_rejects_expired_token(self):
+        with self.assertRaises(jwt.ExpiredSignatureError):
+            decode_token(self.jwks.token(exp=int(time.time()) - 60))
+
+    def test_unknown_kid_is_left_to_the_sso_service(self):
+        with self.assertRaises(SigningKeyUnavailable):
+            decode_token(self.jwks.token(kid='rotated-key'))
+
+    @override_settings(SSO_JWT_AUDIENCE='moresaloon', SSO_JWT_ISSUER='https://moretrek.com')
+    def test_checks_audience_and_issuer_when_configured(self):
+        claims = decode_token(self.jwks.token(aud='moresaloon', iss='https://moretrek.com'))
+        self.assertEqual(claims['aud'], 'moresaloon')
+        with self.assertRaises(jwt.InvalidAudienceError):
+            decode_token(self.jwks.token(aud='other', iss='https://moretrek.com'))
+        with self.assertRaises(jwt.InvalidIssuerError):
+            decode_token(self.jwks.token(aud='moresaloon', iss='https://evil.example'))
+
+    def test_unreachable_key_endpoint_is_not_retried_on_every_request(self):
+        unreachable = JWKSStub()
+        unreachable.close()
+        with override_settings(SSO_JWKS_URL=unreachable.url):
+            with self.assertRaises(SigningKeyUnavailable):
+                decode_token(self.jwks.token())
+            with mock.patch.object(jwt_verifier, 'get_jwk_client') as get_jwk_client:
+                with self.assertRaises(SigningKeyUnavailable):
+                    decode_token(self.jwks.token())
+            get_jwk_client.assert_not_called()
+
+
+class ResponseStub(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(circuit_breaker.time, 'time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', failure_threshold=2, failure_window=30, recovery_timeout=30)
+        self.addCleanup(self.breaker.record_success)
+
+    def failing_call(self):
+        with self.assertRaises(ServiceUnavailable):
+            self.breaker.call(lambda: ResponseStub(503))
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        self.failing_call()
+        self.assertEqual(self.breaker.state(), 'closed')
+        self.failing_call()
+        self.assertEqual(self.breaker.state(), 'open')
+        call = mock.Mock()
+        with self.assertRaises(ServiceUnavailable):
+            self.breaker.call(call)
+        call.assert_not_called()
+
+    def test_failed_probe_reopens_at_once(self):
+        self.failing_call()
+        self.failing_call()
+        self.now += 31
+        self.assertEqual(self.breaker.state(), 'half-open')
+        self.failing_call()
+        self.assertEqual(self.breaker.state(), 'open')
+
+    def test_half_open_lets_one_probe_through(self):
+        self.failing_call()
+        self.failing_call()
+        self.now += 31
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_successful_probe_closes(self):
+        self.failing_call()
+        self.failing_call()
+        self.now += 31
+        self.assertEqual(self.breaker.call(lambda: ResponseStub(200)).status_code, 200)
+        self.assertEqual(self.breaker.state(), 'closed')
+        self.failing_call()
+        self.assertEqual(self.breaker.state(), 'closed')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class IdentityInvalidationTests(SimpleTestCase):
+    def test_invalidate_user_drops_every_cached_token(self):
+        cache_identity('token-a', 'sso-1', 'user-1')
+        cache_identity('token-b', 'sso-1', 'user-1')
+        cache_identity('token-c', 'sso-2', 'user-2')
+        invalidate_user('user-1')
+        self.assertIsNone(get_cached_identity('token-a'))
+        self.assertIsNone(get_stale_identity('token-b'))
+        self.assertEqual(get_cached_identity('token-c')['user_id'], 'user-2')
+
+    def test_owner_change_drops_cached_saloon_permission(self):
+        cache_identity('token-a', 'sso-1', 'user-1')
+        with mock.patch('core.utils.permissions.sso_breaker.call', return_value=ResponseStub(200)) as call:
+            self.assertTrue(get_saloon_permission('token-a'))
+            get_saloon_permission('token-a')
+            self.assertEqual(call.call_count, 1)
+            invalidate_user_saloon_permission('user-1')
+            get_saloon_permission('token-a')
+            self.assertEqual(call.call_count, 2)
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import HomeView, GetUserBalance
+from .views import HomeView, GetUserBalance, LogoutView
 
 urlpatterns = [
      path('home/', HomeView.as_view(), name='home'),
      path('balance/', GetUserBalance.as_view(), name='get_user_balance'),
+     path('logout/', LogoutView.as_view(), name='logout'),
 ]
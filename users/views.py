@@ -1,9 +1,10 @@
-import requests
+from core.utils import http_client
 from rest_framework import generics
 from users.models import User
 from .serializers import UserSerializer
 from decouple import config
 from core.utils.response import PrepareResponse
+from core.utils.identity_cache import invalidate_token, invalidate_user
 
 main_api_url = config('MAIN_API_URL')
 
@@ -29,7 +30,7 @@ class GetUserBalance(generics.GenericAPIView):
         headers = {
             'Authorization': f"{token}"
         }
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, headers=headers, endpoint='wallets.balance')
         if response.status_code != 200:
             response = PrepareResponse(
                 success=False,
@@ -39,3 +40,22 @@ class GetUserBalance(generics.GenericAPIView):
         
         response = Response(response.json())
         return response
+
+
+class LogoutView(APIView):
+    """
+    Forget the cached identity of the calling token, or of every token of
+    the user with `all=true`, so that a token logged out of the SSO service
+    is checked with it again on its next use.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if str(request.data.get('all', '')).lower() in ('1', 'true'):
+            invalidate_user(request.user.pk)
+        else:
+            invalidate_token(request.headers.get('Authorization', '').replace('Bearer ', ''))
+        return PrepareResponse(
+            success=True,
+            message="Logged out successfully"
+        ).send(200)